@@ -74,6 +74,13 @@ class GlobalConfig:
     cache_dir: str = default_path("cache")
     data_dir: str = default_path("lib")
     run_dir: str = default_path("run")
+    # If set, files are stored compressed with this method ("gzip" or
+    # "zstd").
+    file_compression: str | None = None
+    # If true, some files produced by the workers (sandbox archives
+    # and user outputs) are stored split in chunks shared among
+    # similar files.
+    chunked_storage: bool = False
 
 
 @dataclass()
@@ -81,11 +88,17 @@ class DatabaseConfig:
     url: str
     debug: bool = False
     twophase_commit: bool = False
+    # Max number of idle connections kept by each process to access
+    # the files stored in the database.
+    large_object_pool_size: int = 5
 
 
 @dataclass()
 class WorkerConfig:
     keep_sandbox: bool = False
+    # If set, workers don't run jobs, but pretend they succeeded after
+    # waiting this many seconds (for benchmarking the rest of CMS).
+    fake_worker_time: float | None = None
 
 
 @dataclass()
@@ -117,6 +130,17 @@ class CWSConfig:
     listen_address: tuple[str, ...] = ("127.0.0.1",)
     listen_port: tuple[int, ...] = (8888,)
     cookie_duration: int = 30 * 60  # 30 minutes
+    # How long a login cookie is trusted (and not refreshed) before
+    # checking it against the database again.
+    auth_token_duration: int = 5 * 60  # 5 minutes
+    # Threads verifying passwords at login, and login attempts allowed
+    # per minute from each IP address (off by default, as a contest
+    # behind a NAT can have all its users on one address) and for each
+    # username from each IP address (0 for no limit), counted by each
+    # CWS on its own.
+    password_verification_threads: int = 4
+    login_attempts_per_ip: int = 0
+    login_attempts_per_user: int = 20
     num_proxies_used: int = 0
 
     submit_local_copy: bool = True
@@ -126,6 +150,9 @@ class CWSConfig:
 
     max_submission_length: int = 100_000  # 100 KB
     max_input_length: int = 5_000_000  # 5 MB
+    # Files sent in up to this size are stored in the database in the
+    # same transaction as their submission or user test.
+    max_inline_file_length: int = 128_000  # 128 KB
 
     stl_path: str = "/usr/share/cppreference/doc/html/"
     docs_path: str | None = None
@@ -151,6 +178,7 @@ class ProxyServiceConfig:
 class PrometheusConfig:
     listen_address: str = "127.0.0.1"
     listen_port: int = 8811
+    refresh_interval: float = 15.0
 
 
 @dataclass()
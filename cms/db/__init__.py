@@ -63,7 +63,7 @@ __all__ = [
     "Task", "Statement", "Attachment", "Dataset", "Manager", "Testcase",
     # submission
     "Submission", "File", "Token", "SubmissionResult", "Executable",
-    "Evaluation",
+    "Evaluation", "TaskScore",
     # usertest
     "UserTest", "UserTestFile", "UserTestManager", "UserTestResult",
     "UserTestExecutable",
@@ -80,7 +80,7 @@ __all__ = [
 
 # Instantiate or import these objects.
 
-version = 48
+version = 51
 
 engine = create_engine(config.database.url, echo=config.database.debug,
                        pool_timeout=60, pool_recycle=120)
@@ -99,7 +99,7 @@ from .contest import Contest, Announcement
 from .user import Group, User, Team, Participation, Message, Question
 from .task import Task, Statement, Attachment, Dataset, Manager, Testcase
 from .submission import Submission, File, Token, SubmissionResult, \
-    Executable, Evaluation
+    Executable, Evaluation, TaskScore
 from .usertest import UserTest, UserTestFile, UserTestManager, \
     UserTestResult, UserTestExecutable
 
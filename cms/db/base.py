@@ -31,7 +31,7 @@ from sqlalchemy.orm.exc import ObjectDeletedError
 from sqlalchemy.orm.session import object_session
 from sqlalchemy.types import \
     Boolean, Integer, Float, String, Unicode, Enum, DateTime, Interval, \
-    BigInteger
+    BigInteger, LargeBinary
 
 from cms.db.session import Session
 
@@ -48,6 +48,7 @@ _TYPE_MAP = {
     Enum: str,
     Unicode: str,
     String: str,  # TODO Use bytes.
+    LargeBinary: bytes,
     Codename: str,
     Filename: str,
     FilenameSchema: str,
@@ -27,21 +27,39 @@
 """
 
 import atexit
+import functools
+import hashlib
 import io
 import logging
 import os
+import struct
 import tempfile
 import fcntl
+import itertools
+import time
+import zlib
 from abc import ABCMeta, abstractmethod
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from contextlib import contextmanager
 import typing
 
 import gevent
+import gevent.pool
+import gevent.threadpool
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import LargeBinary, func
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import undefer
 
 from cms import config, mkdir, rmtree
 from cms.db import SessionGen, Digest, FSObject, LargeObject
 from cms.db.session import Session
-from cmscommon.digest import Digester
+from cmscommon.digest import Digester, bytes_digest
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 if typing.TYPE_CHECKING:
     from cms.io.service import Service
 
@@ -50,7 +68,8 @@ logger = logging.getLogger(__name__)
 
 
 def copyfileobj(source_fobj: typing.IO, destination_fobj: typing.IO,
-                buffer_size: int = io.DEFAULT_BUFFER_SIZE):
+                buffer_size: int = io.DEFAULT_BUFFER_SIZE,
+                max_buffer_size: int | None = None):
     """Read all content from one file object and write it to another.
 
     Repeatedly read from the given source file object, until no content
@@ -63,12 +82,18 @@ def copyfileobj(source_fobj: typing.IO, destination_fobj: typing.IO,
     destination_fobj: a file object open for writing, in the
         same mode as the source (doesn't need to be buffered).
     buffer_size: the size of the read/write buffer.
+    max_buffer_size: if given, the buffer size doubles after each
+        read that fills it, up to this value; this reduces the number
+        of reads (which may be round trips to a server) for big files,
+        without allocating big buffers for small ones.
 
     """
     while True:
         buffer = source_fobj.read(buffer_size)
         if len(buffer) == 0:
             break
+        if max_buffer_size is not None and len(buffer) == buffer_size:
+            buffer_size = min(2 * buffer_size, max_buffer_size)
         while len(buffer) > 0:
             gevent.sleep(0)
             written = destination_fobj.write(buffer)
@@ -140,6 +165,17 @@ class FileCacherBackend(metaclass=ABCMeta):
         """
         pass
 
+    def discard_file(self, fobj: typing.IO[bytes]):
+        """Drop a file created by create_file() without storing it.
+
+        Backends should override this if closing the file object is
+        not enough to free what was written to it.
+
+        fobj: the object returned by create_file()
+
+        """
+        fobj.close()
+
     @abstractmethod
     def describe(self, digest: str) -> str:
         """Return the description of a file given its digest.
@@ -185,6 +221,101 @@ class FileCacherBackend(metaclass=ABCMeta):
         """
         pass
 
+    def identity(self) -> str | None:
+        """Return a string identifying the storage.
+
+        Two backends with the same identity must access the same files.
+        This is used to remember, across FileCacher instances, which
+        files are stored (see KnownDigests).
+
+        return: the identity, or None if the storage should not be
+            tracked.
+
+        """
+        return None
+
+    def existing_digests(self, digests: Iterable[str]) -> set[str]:
+        """Return which of the given files are in the storage.
+
+        Backends should override this if they can answer more
+        efficiently than by looking for each file separately.
+
+        digests: the digests of the files to look for.
+
+        return: the subset of digests that are in the storage.
+
+        """
+        ret = set()
+        for digest in digests:
+            try:
+                self.describe(digest)
+            except KeyError:
+                pass
+            else:
+                ret.add(digest)
+        return ret
+
+    def get_file_contents(self, digests: Sequence[str]) -> "list[bytes]":
+        """Return the contents of many (small) files.
+
+        Backends should override this if they can fetch many files
+        more efficiently than one at a time.
+
+        digests: the digests of the files to retrieve.
+
+        return: the contents of the files, in the same order.
+
+        raise (KeyError): if a file cannot be found.
+
+        """
+        contents = []
+        for digest in digests:
+            with self.get_file(digest) as fobj, io.BytesIO() as dst:
+                copyfileobj(fobj, dst, FileCacher.CHUNK_SIZE)
+                contents.append(dst.getvalue())
+        return contents
+
+    def put_file_contents(self, files: Sequence[tuple[str, bytes, str]]):
+        """Store many (small) files.
+
+        Backends should override this if they can store many files
+        more efficiently than one at a time. Files that are already
+        stored are left as they are.
+
+        files: for each file, its digest, content and description.
+
+        """
+        for digest, content, desc in files:
+            fobj = self.create_file(digest)
+            if fobj is None:
+                continue
+            try:
+                with io.BytesIO(content) as src:
+                    copyfileobj(src, fobj, FileCacher.CHUNK_SIZE)
+            except BaseException:
+                self.discard_file(fobj)
+                raise
+            self.commit_file(fobj, digest, desc)
+
+    def stage_files(
+        self, session: Session, files: Sequence[tuple[str, bytes, str]]
+    ) -> bool:
+        """Add small files to the storage within a transaction of the
+        caller.
+
+        Backends storing the files in the database can do so through
+        the given session, so that the files are stored if and only if
+        the caller commits it, without any transaction of their own.
+
+        session: the session of the caller.
+        files: for each file, its digest, content and description.
+
+        return: whether the files were staged; if False (the default)
+            nothing was done and the files must be stored otherwise.
+
+        """
+        return False
+
 
 class FSBackend(FileCacherBackend):
     """This class implements a backend for FileCacher that keeps all
@@ -215,6 +346,12 @@ class FSBackend(FileCacherBackend):
         except OSError:
             pass
 
+    def identity(self):
+        """See FileCacherBackend.identity().
+
+        """
+        return "fs:%s" % os.path.abspath(self.path)
+
     def get_file(self, digest):
         """See FileCacherBackend.get_file().
 
@@ -264,6 +401,16 @@ class FSBackend(FileCacherBackend):
             os.unlink(fobj.name)
             return False
 
+    def discard_file(self, fobj):
+        """See FileCacherBackend.discard_file().
+
+        """
+        fobj.close()
+        try:
+            os.unlink(fobj.name)
+        except FileNotFoundError:
+            pass
+
     def describe(self, digest):
         """See FileCacherBackend.describe().
 
@@ -311,12 +458,21 @@ class DBBackend(FileCacherBackend):
 
     """
 
+    def identity(self):
+        """See FileCacherBackend.identity().
+
+        """
+        return "db:%s" % config.database.url
+
     def get_file(self, digest):
         """See FileCacherBackend.get_file().
 
         """
         with SessionGen() as session:
-            fso = FSObject.get_from_digest(digest, session)
+            # Load the content of files stored inline with the row.
+            fso = session.query(FSObject) \
+                .options(undefer(FSObject.content)) \
+                .filter(FSObject.digest == digest).first()
 
             if fso is None:
                 raise KeyError("File not found.")
@@ -375,6 +531,13 @@ class DBBackend(FileCacherBackend):
             return False
         return True
 
+    def discard_file(self, fobj):
+        """See FileCacherBackend.discard_file().
+
+        """
+        fobj.close()
+        LargeObject.unlink(fobj.loid)
+
     def describe(self, digest):
         """See FileCacherBackend.describe().
 
@@ -394,12 +557,17 @@ class DBBackend(FileCacherBackend):
         # TODO - The business logic may be moved in FSObject, for
         # better generality
         with SessionGen() as session:
-            fso = FSObject.get_from_digest(digest, session)
+            row = session.query(FSObject.loid,
+                                func.octet_length(FSObject.content)) \
+                .filter(FSObject.digest == digest).first()
 
-            if fso is None:
+            if row is None:
                 raise KeyError("File not found.")
 
-            with fso.get_lobject(mode='rb') as lobj:
+            loid, inline_size = row
+            if loid is None:
+                return inline_size
+            with LargeObject(loid, mode='rb') as lobj:
                 return lobj.seek(0, io.SEEK_END)
 
     def delete(self, digest):
@@ -417,6 +585,70 @@ class DBBackend(FileCacherBackend):
 
             session.commit()
 
+    def existing_digests(self, digests):
+        """See FileCacherBackend.existing_digests().
+
+        """
+        digests = list(digests)
+        if len(digests) == 0:
+            return set()
+        with SessionGen() as session:
+            return set(
+                digest for digest, in session.query(FSObject.digest)
+                .filter(FSObject.digest.in_(digests)))
+
+    def stage_files(self, session, files):
+        """See FileCacherBackend.stage_files().
+
+        The files are stored inline (i.e., in the row of their FSObject
+        rather than in a large object), all with a single statement;
+        files that are already stored are left as they are.
+
+        """
+        rows = {digest: {"digest": digest, "loid": None,
+                         "content": content, "description": desc}
+                for digest, content, desc in files}
+        if len(rows) > 0:
+            session.execute(insert(FSObject.__table__)
+                            .values(list(rows.values()))
+                            .on_conflict_do_nothing())
+        return True
+
+    def get_file_contents(self, digests):
+        """See FileCacherBackend.get_file_contents().
+
+        All the files are fetched with a single query, reading the
+        large objects with lo_get.
+
+        """
+        digests = list(digests)
+        if len(digests) == 0:
+            return []
+        with SessionGen() as session:
+            rows = session.query(
+                FSObject.digest, FSObject.content,
+                func.lo_get(FSObject.loid, type_=LargeBinary)) \
+                .filter(FSObject.digest.in_(set(digests))).all()
+        contents = {digest: inline if inline is not None else lobject
+                    for digest, inline, lobject in rows}
+        try:
+            return [contents[digest] for digest in digests]
+        except KeyError:
+            raise KeyError("File not found.")
+
+    def put_file_contents(self, files):
+        """See FileCacherBackend.put_file_contents().
+
+        The files are stored inline, as in stage_files, all in a
+        single transaction.
+
+        """
+        if len(files) == 0:
+            return
+        with SessionGen() as session:
+            self.stage_files(session, files)
+            session.commit()
+
     def list(self, session: "Session | None" = None):
         """See FileCacherBackend.list().
 
@@ -471,6 +703,863 @@ class NullBackend(FileCacherBackend):
         return list()
 
 
+class _DecompressingReader(io.RawIOBase):
+    """Read-only file-like object decompressing a zlib-like stream.
+
+    The decompressed data is produced at most a buffer at a time, so
+    that the memory used is bounded even for very compressible files.
+
+    """
+
+    def __init__(self, fobj: typing.IO[bytes], decompressor: typing.Any,
+                 chunk_size: int = io.DEFAULT_BUFFER_SIZE):
+        """Initialize.
+
+        fobj: the file-like object to read the compressed data from,
+            positioned at the start of the stream; it is closed with
+            this object.
+        decompressor: an object like the ones returned by
+            zlib.decompressobj.
+        chunk_size: how much compressed data to read at a time.
+
+        """
+        super().__init__()
+        self._fobj = fobj
+        self._decompressor = decompressor
+        self._chunk_size = chunk_size
+        self._tail = b""
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf) -> int:
+        while not self._decompressor.eof:
+            data = self._decompressor.decompress(self._tail, len(buf))
+            self._tail = self._decompressor.unconsumed_tail
+            if len(data) > 0:
+                buf[:len(data)] = data
+                return len(data)
+            if len(self._tail) == 0 and not self._decompressor.eof:
+                self._tail = self._fobj.read(self._chunk_size)
+                if len(self._tail) == 0:
+                    raise EOFError("Compressed file is truncated.")
+        return 0
+
+    def close(self):
+        if not self.closed:
+            self._fobj.close()
+        super().close()
+
+
+class _CompressingWriter(io.RawIOBase):
+    """Write-only file-like object compressing what it receives.
+
+    Call finish() once done writing, instead of close().
+
+    """
+
+    def __init__(self, fobj: typing.IO[bytes], codec: str, digest: str,
+                 compressor: typing.Any):
+        """Initialize.
+
+        fobj: the seekable file-like object to write the header and the
+            compressed data to.
+        codec: the name of the compression method, see
+            CompressedBackend.CODECS.
+        digest: the digest of the (uncompressed) file.
+        compressor: an object like the ones returned by
+            zlib.compressobj.
+
+        """
+        super().__init__()
+        self._fobj = fobj
+        self._compressor = compressor
+        self._size = 0
+        # The size is not known yet, finish() fills it in.
+        self._write_all(CompressedBackend.HEADER.pack(
+            CompressedBackend.MAGIC, CompressedBackend.CODECS[codec],
+            digest.encode("ascii"), 0))
+
+    def _write_all(self, data: bytes):
+        view = memoryview(data)
+        while len(view) > 0:
+            written = self._fobj.write(view)
+            view = view[written:]
+
+    def writable(self):
+        return True
+
+    def write(self, buf) -> int:
+        self._write_all(self._compressor.compress(buf))
+        self._size += len(buf)
+        return len(buf)
+
+    def finish(self) -> typing.IO[bytes]:
+        """Complete the compressed file.
+
+        return: the underlying file-like object, ready to be committed.
+
+        """
+        self._write_all(self._compressor.flush())
+        end = self._fobj.tell()
+        self._fobj.seek(CompressedBackend.HEADER.size - 8)
+        self._write_all(struct.pack(">Q", self._size))
+        self._fobj.seek(end)
+        super().close()
+        return self._fobj
+
+    def abort(self) -> typing.IO[bytes]:
+        """Stop writing, leaving the compressed file incomplete.
+
+        return: the underlying file-like object, to be discarded.
+
+        """
+        super().close()
+        return self._fobj
+
+
+class CompressedBackend(FileCacherBackend):
+    """This class implements a backend for FileCacher that wraps
+    another backend, storing the files there in compressed form.
+
+    Each file stored by this backend starts with a header made of
+    MAGIC, a byte identifying the compression method, the digest of
+    the file and the size of the uncompressed content; digests are
+    always computed over the uncompressed content. Files without the
+    header (e.g., stored before enabling compression, or staged with
+    stage_files) are returned as they are, so compression can be
+    enabled, disabled, or have its method changed on an existing
+    storage: FileCacher always reads through this backend, and the
+    configuration only decides how new files are stored.
+
+    A header is recognized only if it contains the digest the file is
+    looked up with: a file stored as it is would need to contain its
+    own digest to be mistaken for a compressed one, so any content
+    (even one starting with MAGIC) round-trips, without having to
+    record out of band which files are compressed.
+
+    """
+
+    MAGIC = b"\x89CMZ"
+    # Magic, compression method, digest, uncompressed size (last, as
+    # _CompressingWriter fills it in at the end).
+    HEADER = struct.Struct(">4sc40sQ")
+    CODECS = {
+        "gzip": b"g",
+        "zstd": b"z",
+    }
+    GZIP_LEVEL = 6
+    ZSTD_LEVEL = 3
+
+    def __init__(self, backend: FileCacherBackend,
+                 codec: str | None = "gzip"):
+        """Initialize the backend.
+
+        backend: the backend actually storing the files.
+        codec: the compression method for new files, one of CODECS,
+            or None to store new files uncompressed (compressed files
+            are read anyway).
+
+        raise (ValueError): if the compression method is unknown or
+            not available.
+
+        """
+        if codec is not None and codec not in self.CODECS:
+            raise ValueError("Unknown compression method `%s'." % codec)
+        if codec == "zstd" and zstandard is None:
+            raise ValueError("Compression method `zstd' requires the "
+                             "zstandard package.")
+        self.backend = backend
+        self.codec = codec
+
+    def _read_header(
+        self, fobj: typing.IO[bytes], digest: str
+    ) -> tuple[bytes, int] | None:
+        """Read the header of a file, if it has one.
+
+        fobj: the file as returned by the wrapped backend.
+        digest: the digest the file was looked up with.
+
+        return: the compression method identifier and the uncompressed
+            size, or None if the file is not compressed (in which case
+            fobj is rewound).
+
+        """
+        header = fobj.read(self.HEADER.size)
+        if len(header) == self.HEADER.size \
+                and header.startswith(self.MAGIC):
+            _, codec_id, header_digest, size = self.HEADER.unpack(header)
+            if header_digest == digest.encode("ascii"):
+                return codec_id, size
+        fobj.seek(0)
+        return None
+
+    def get_file(self, digest):
+        """See FileCacherBackend.get_file().
+
+        """
+        fobj = self.backend.get_file(digest)
+        try:
+            header = self._read_header(fobj, digest)
+            if header is None:
+                return fobj
+            codec_id, _ = header
+            if codec_id == self.CODECS["gzip"]:
+                return _DecompressingReader(
+                    fobj, zlib.decompressobj(wbits=zlib.MAX_WBITS | 16),
+                    FileCacher.CHUNK_SIZE)
+            if codec_id == self.CODECS["zstd"] and zstandard is not None:
+                return zstandard.ZstdDecompressor().stream_reader(
+                    fobj, read_size=FileCacher.CHUNK_SIZE, closefd=True)
+            raise RuntimeError("File %s uses an unsupported compression "
+                               "method (%r)." % (digest, codec_id))
+        except BaseException:
+            fobj.close()
+            raise
+
+    def create_file(self, digest):
+        """See FileCacherBackend.create_file().
+
+        """
+        fobj = self.backend.create_file(digest)
+        if fobj is None or self.codec is None:
+            return fobj
+        return self._compressing_writer(fobj, digest)
+
+    def _compressing_writer(
+        self, fobj: typing.IO[bytes], digest: str
+    ) -> "_CompressingWriter":
+        if self.codec == "zstd":
+            compressor = zstandard.ZstdCompressor(
+                level=self.ZSTD_LEVEL).compressobj()
+        else:
+            compressor = zlib.compressobj(
+                self.GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        return _CompressingWriter(fobj, self.codec, digest, compressor)
+
+    def commit_file(self, fobj, digest, desc=""):
+        """See FileCacherBackend.commit_file().
+
+        """
+        if isinstance(fobj, _CompressingWriter):
+            fobj = fobj.finish()
+        return self.backend.commit_file(fobj, digest, desc)
+
+    def discard_file(self, fobj):
+        """See FileCacherBackend.discard_file().
+
+        """
+        if isinstance(fobj, _CompressingWriter):
+            fobj = fobj.abort()
+        self.backend.discard_file(fobj)
+
+    def get_file_contents(self, digests):
+        """See FileCacherBackend.get_file_contents().
+
+        """
+        contents = []
+        for digest, content in zip(
+                digests, self.backend.get_file_contents(digests)):
+            header = self._read_header(io.BytesIO(content), digest)
+            if header is None:
+                contents.append(content)
+                continue
+            codec_id, _ = header
+            data = content[self.HEADER.size:]
+            if codec_id == self.CODECS["gzip"]:
+                contents.append(zlib.decompress(
+                    data, wbits=zlib.MAX_WBITS | 16))
+            elif codec_id == self.CODECS["zstd"] and zstandard is not None:
+                contents.append(
+                    zstandard.ZstdDecompressor().decompressobj()
+                    .decompress(data))
+            else:
+                raise RuntimeError("File %s uses an unsupported "
+                                   "compression method (%r)."
+                                   % (digest, codec_id))
+        return contents
+
+    def put_file_contents(self, files):
+        """See FileCacherBackend.put_file_contents().
+
+        """
+        if self.codec is not None:
+            compressed = []
+            for digest, content, desc in files:
+                with io.BytesIO() as dst:
+                    writer = self._compressing_writer(dst, digest)
+                    writer.write(content)
+                    writer.finish()
+                    compressed.append((digest, dst.getvalue(), desc))
+            files = compressed
+        self.backend.put_file_contents(files)
+
+    def describe(self, digest):
+        """See FileCacherBackend.describe().
+
+        """
+        return self.backend.describe(digest)
+
+    def get_size(self, digest):
+        """See FileCacherBackend.get_size().
+
+        """
+        with self.backend.get_file(digest) as fobj:
+            header = self._read_header(fobj, digest)
+        if header is None:
+            return self.backend.get_size(digest)
+        return header[1]
+
+    def delete(self, digest):
+        """See FileCacherBackend.delete().
+
+        """
+        self.backend.delete(digest)
+
+    def list(self):
+        """See FileCacherBackend.list().
+
+        """
+        return self.backend.list()
+
+    def identity(self):
+        """See FileCacherBackend.identity().
+
+        """
+        return self.backend.identity()
+
+    def existing_digests(self, digests):
+        """See FileCacherBackend.existing_digests().
+
+        """
+        return self.backend.existing_digests(digests)
+
+    def stage_files(self, session, files):
+        """See FileCacherBackend.stage_files().
+
+        The files are staged uncompressed, since they are small; since
+        they lack a header with their digest, get_file returns them as
+        they are, whatever their content (even starting with MAGIC).
+
+        """
+        return self.backend.stage_files(session, files)
+
+
+# A table of random values, one per byte, to compute the gear hash
+# used by content_defined_chunks; it must never change, or new chunks
+# will not be shared with the ones already stored.
+_GEAR = tuple(int.from_bytes(hashlib.sha256(b"cms-gear-%d" % i).digest()[:4],
+                             "big")
+              for i in range(256))
+# The bytes of the values of _GEAR, most significant first, as tables
+# for bytes.translate.
+_GEAR_TABLES = tuple(bytes((value >> (8 * (3 - i))) & 0xFF for value in _GEAR)
+                     for i in range(4))
+# The gear hash only depends on the last 32 bytes.
+_GEAR_WINDOW = 32
+# _gear_flags packs one hash per _GEAR_LANE bytes of a big integer:
+# four for the hash, one to catch the carries of the additions.
+_GEAR_LANE = 5
+# content_defined_chunks computes the hashes this many bytes at a
+# time: bigger integers are slower to work on, smaller ones need more
+# Python steps per byte.
+_GEAR_BLOCK = 8 * 1024
+
+
+@functools.lru_cache(maxsize=4)
+def _gear_masks(length: int, threshold: int) -> tuple[list[int], int, int]:
+    """Return the constants used by _gear_flags for a given length.
+
+    """
+    def repeat(value: int) -> int:
+        return int.from_bytes(value.to_bytes(_GEAR_LANE, "big") * length,
+                              "big")
+    return ([repeat((1 << (32 - shift)) - 1)
+             for shift in (1, 2, 4, 8, 16)],
+            repeat(0xFFFFFFFF),
+            repeat((1 << 32) - threshold))
+
+
+def _gear_flags(data: bytes, length: int, threshold: int) -> bytes:
+    """Compute the gear hash at each position of some data.
+
+    The hash at position i is the sum of _GEAR[data[i - k]] << k for k
+    from 0 to 31 (and i - k >= 0), modulo 2 ** 32, i.e., what hashing
+    the data one byte at a time computes. Instead of looping over the
+    bytes in Python, the hashes of all positions are packed in a big
+    integer and computed in log2(32) steps of arithmetic on it (each
+    step doubling the number of bytes added into each hash).
+
+    data: the data, at most length bytes.
+    length: the length to pad the data to (so that the constants can
+        be reused across calls).
+    threshold: the value to compare the hashes with.
+
+    return: length bytes, the i-th of which is zero if and only if the
+        hash at position i is less than threshold.
+
+    """
+    lanes = bytearray(_GEAR_LANE * length)
+    data = data.ljust(length, b"\0")
+    for i, table in enumerate(_GEAR_TABLES):
+        lanes[_GEAR_LANE - 4 + i::_GEAR_LANE] = data.translate(table)
+    hashes = int.from_bytes(lanes, "big")
+    truncate, mask, complement = _gear_masks(length, threshold)
+    for i, shift in enumerate((1, 2, 4, 8, 16)):
+        # Add to each hash the one shift positions before, shifted
+        # left by shift bits (dropping the bits that would overflow).
+        hashes += (hashes & truncate[i]) >> (8 * _GEAR_LANE * shift - shift)
+        hashes &= mask
+    # The hashes less than threshold are the ones that do not carry
+    # into the fifth byte when adding 2 ** 32 - threshold.
+    return (hashes + complement).to_bytes(
+        _GEAR_LANE * length, "big")[::_GEAR_LANE]
+
+
+def content_defined_chunks(src: typing.IO[bytes], min_size: int,
+                           avg_size: int, max_size: int) -> Iterator[bytes]:
+    """Split the content of a file in chunks at content-defined points.
+
+    A chunk ends after a byte where a rolling hash of the last 32
+    bytes has a given property, so the boundaries depend only on the
+    nearby content and not on the offset: if two files differ only in
+    a few places, all their chunks but the ones around those places
+    are the same.
+
+    The hashes are computed _GEAR_BLOCK bytes at a time with
+    _gear_flags; this still runs in the calling thread at about 20
+    MiB/s on a current CPU (and the chunks are then hashed and compressed), so
+    put_chunked should be used for the files that are expected to
+    share content with others, not for every file.
+
+    src: a readable binary file-like object.
+    min_size: the minimum size of a chunk (except the last one).
+    avg_size: the expected size of a chunk beyond min_size.
+    max_size: the maximum size of a chunk.
+
+    return: the chunks, in order.
+
+    """
+    threshold = (1 << 32) // avg_size
+    step = min(avg_size, _GEAR_BLOCK)
+    # Each block of hashes needs the bytes before it in the window.
+    length = step + _GEAR_WINDOW - 1
+    buf = b""
+    pos = 0
+    eof = False
+    while True:
+        if not eof and len(buf) - pos < max_size:
+            data = src.read(max(max_size, FileCacher.CHUNK_SIZE))
+            eof = len(data) == 0
+            buf = buf[pos:] + data
+            pos = 0
+            continue
+        if pos == len(buf):
+            return
+
+        end = min(len(buf), pos + max_size)
+        cut = end
+        # The hash restarts from zero at min_size bytes into the chunk.
+        start = pos + min_size
+        block = start
+        while block < end:
+            context = max(start, block - _GEAR_WINDOW + 1)
+            block_end = min(end, block + step)
+            flags = _gear_flags(buf[context:block_end], length, threshold)
+            found = flags.find(b"\0", block - context, block_end - context)
+            if found != -1:
+                cut = context + found + 1
+                break
+            block = block_end
+        yield buf[pos:cut]
+        pos = cut
+        # Cooperative yield.
+        gevent.sleep(0)
+
+
+class _ChunkReader(io.RawIOBase):
+    """Read-only file-like object concatenating files of a backend.
+
+    The files are fetched a batch at a time with get_file_contents.
+
+    """
+
+    def __init__(self, backend: FileCacherBackend,
+                 entries: list[tuple[str, int]], batch_size: int):
+        """Initialize.
+
+        backend: the backend storing the files.
+        entries: the digest and the size of the files to concatenate.
+        batch_size: the number of bytes to fetch at once (at least
+            one file is fetched anyway).
+
+        """
+        super().__init__()
+        self._backend = backend
+        self._entries = entries
+        self._batch_size = batch_size
+        self._index = 0
+        self._data = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def _fetch(self):
+        end = self._index + 1
+        size = self._entries[self._index][1]
+        while end < len(self._entries) \
+                and size + self._entries[end][1] <= self._batch_size:
+            size += self._entries[end][1]
+            end += 1
+        contents = self._backend.get_file_contents(
+            [digest for digest, _ in self._entries[self._index:end]])
+        self._data = memoryview(b"".join(contents))
+        self._index = end
+
+    def readinto(self, buf) -> int:
+        while len(self._data) == 0:
+            if self._index == len(self._entries):
+                return 0
+            self._fetch()
+        size = min(len(buf), len(self._data))
+        buf[:size] = self._data[:size]
+        self._data = self._data[size:]
+        return size
+
+    def close(self):
+        self._data = memoryview(b"")
+        super().close()
+
+
+class _PrefixedReader(io.RawIOBase):
+    """Read-only file-like object returning some bytes before the
+    content of a file (to "unread" from a file that can't seek).
+
+    """
+
+    def __init__(self, prefix: bytes, fobj: typing.IO[bytes]):
+        super().__init__()
+        self._prefix = prefix
+        self._fobj = fobj
+
+    def readable(self):
+        return True
+
+    def readinto(self, buf) -> int:
+        if len(self._prefix) > 0:
+            data = self._prefix[:len(buf)]
+            self._prefix = self._prefix[len(data):]
+        else:
+            data = self._fobj.read(len(buf))
+        buf[:len(data)] = data
+        return len(data)
+
+    def close(self):
+        if not self.closed:
+            self._fobj.close()
+        super().close()
+
+
+class ChunkedBackend(FileCacherBackend):
+    """This class implements a backend for FileCacher that wraps
+    another backend, and can store files there split in chunks.
+
+    Files stored with put_chunked are split with
+    content_defined_chunks; each chunk is stored in the wrapped
+    backend as a file on its own (with CHUNK_DESCRIPTION), and the
+    file itself is stored as a manifest listing them (MAGIC, the
+    digest of the file, the total size, and the digest and size of
+    each chunk). Similar files (e.g., the archives of two sandboxes
+    that ran the same program) thus share most of their storage.
+    Reading a manifest returns the reassembled content; files stored
+    in other ways pass through. FileCacher always reads through this
+    backend, so that the files stored in chunks remain readable if
+    the configuration changes; the configuration only decides whether
+    put_chunked is used for new files.
+
+    As in CompressedBackend, a manifest is recognized only if it
+    contains the digest it is looked up with, which no other file can
+    do: files starting with MAGIC (even crafted to look like a
+    manifest of other files' chunks) are returned as they are.
+
+    Chunks are only referenced by manifests, which have descriptions
+    starting with MANIFEST_DESCRIPTION_PREFIX; cmsCleanFiles deletes
+    the chunks that no manifest references anymore.
+
+    """
+
+    MAGIC = b"\x89CMK"
+    # Magic, digest, total size.
+    HEADER = struct.Struct(">4s40sQ")
+    # Digest of the chunk, size of the chunk.
+    ENTRY = struct.Struct(">40sQ")
+    # Chunks are large enough that fetching or storing them (a batch
+    # at a time) is not dominated by the round trips to the storage.
+    MIN_CHUNK_SIZE = 64 * 1024
+    AVG_CHUNK_SIZE = 256 * 1024
+    MAX_CHUNK_SIZE = 1024 * 1024
+    # Smaller files are not worth splitting.
+    MIN_FILE_SIZE = 512 * 1024
+    # How many bytes of chunks to look for, store or read in the
+    # wrapped backend at once.
+    BATCH_SIZE = 16 * 1024 * 1024
+    CHUNK_DESCRIPTION = "Chunk"
+    MANIFEST_DESCRIPTION_PREFIX = "Chunked: "
+
+    def __init__(self, backend: FileCacherBackend):
+        """Initialize the backend.
+
+        backend: the backend actually storing the chunks and the
+            manifests.
+
+        """
+        self.backend = backend
+
+    def _read_header(
+        self, fobj: typing.IO[bytes], digest: str
+    ) -> tuple[bytes, int | None]:
+        """Read the header of a file, if it is a manifest.
+
+        fobj: the file as returned by the wrapped backend.
+        digest: the digest the file was looked up with.
+
+        return: the bytes read, and the total size if the file is a
+            manifest, None otherwise.
+
+        """
+        header = fobj.read(self.HEADER.size)
+        if len(header) == self.HEADER.size and header.startswith(self.MAGIC):
+            _, header_digest, size = self.HEADER.unpack(header)
+            if header_digest == digest.encode("ascii"):
+                return header, size
+        return header, None
+
+    def read_manifest(self, digest: str) -> list[tuple[str, int]] | None:
+        """Return the chunks of a file.
+
+        digest: the digest of the file.
+
+        return: the digest and the size of each chunk of the file, or
+            None if the file was not stored in chunks.
+
+        raise (KeyError): if the file cannot be found.
+
+        """
+        with self.backend.get_file(digest) as fobj:
+            _, size = self._read_header(fobj, digest)
+            if size is None:
+                return None
+            entries = fobj.read()
+        return [(chunk_digest.decode("ascii"), chunk_size)
+                for chunk_digest, chunk_size
+                in self.ENTRY.iter_unpack(entries)]
+
+    def get_file(self, digest):
+        """See FileCacherBackend.get_file().
+
+        """
+        fobj = self.backend.get_file(digest)
+        try:
+            header, size = self._read_header(fobj, digest)
+            if size is None:
+                if fobj.seekable():
+                    fobj.seek(0)
+                    return fobj
+                return _PrefixedReader(header, fobj)
+            entries = fobj.read()
+        except BaseException:
+            fobj.close()
+            raise
+        fobj.close()
+        return _ChunkReader(
+            self.backend, [(chunk_digest.decode("ascii"), chunk_size)
+                           for chunk_digest, chunk_size
+                           in self.ENTRY.iter_unpack(entries)],
+            self.BATCH_SIZE)
+
+    def create_file(self, digest):
+        """See FileCacherBackend.create_file().
+
+        """
+        return self.backend.create_file(digest)
+
+    def commit_file(self, fobj, digest, desc=""):
+        """See FileCacherBackend.commit_file().
+
+        """
+        return self.backend.commit_file(fobj, digest, desc)
+
+    def discard_file(self, fobj):
+        """See FileCacherBackend.discard_file().
+
+        """
+        self.backend.discard_file(fobj)
+
+    def put_chunked(self, src: typing.IO[bytes], digest: str, desc: str = ""):
+        """Store a file in chunks.
+
+        Nothing is done if the file is already stored (in any way).
+
+        src: a readable binary file-like object with the content of
+            the file.
+        digest: the digest of the file.
+        desc: the description of the file.
+
+        """
+        if digest in self.backend.existing_digests([digest]):
+            logger.debug("File %s already stored, not chunking it.", digest)
+            return
+        entries: list[tuple[str, int]] = []
+        new = 0
+
+        def store(batch: dict[str, bytes]):
+            nonlocal new
+            existing = self.backend.existing_digests(batch.keys())
+            missing = [(chunk_digest, chunk, self.CHUNK_DESCRIPTION)
+                       for chunk_digest, chunk in batch.items()
+                       if chunk_digest not in existing]
+            self.backend.put_file_contents(missing)
+            new += len(missing)
+
+        batch: dict[str, bytes] = {}
+        batch_size = 0
+        for chunk in content_defined_chunks(
+                src, self.MIN_CHUNK_SIZE, self.AVG_CHUNK_SIZE,
+                self.MAX_CHUNK_SIZE):
+            chunk_digest = bytes_digest(chunk)
+            entries.append((chunk_digest, len(chunk)))
+            if chunk_digest not in batch:
+                batch[chunk_digest] = chunk
+                batch_size += len(chunk)
+            if batch_size >= self.BATCH_SIZE:
+                store(batch)
+                batch = {}
+                batch_size = 0
+        store(batch)
+
+        manifest = [self.HEADER.pack(
+            self.MAGIC, digest.encode("ascii"),
+            sum(size for _, size in entries))]
+        manifest.extend(self.ENTRY.pack(chunk_digest.encode("ascii"), size)
+                        for chunk_digest, size in entries)
+        self.backend.put_file_contents(
+            [(digest, b"".join(manifest),
+              self.MANIFEST_DESCRIPTION_PREFIX + desc)])
+        logger.debug("File %s stored in %d chunks (%d new).",
+                     digest, len(entries), new)
+
+    def describe(self, digest):
+        """See FileCacherBackend.describe().
+
+        """
+        return self.backend.describe(digest)
+
+    def get_size(self, digest):
+        """See FileCacherBackend.get_size().
+
+        """
+        with self.backend.get_file(digest) as fobj:
+            _, size = self._read_header(fobj, digest)
+        if size is None:
+            return self.backend.get_size(digest)
+        return size
+
+    def delete(self, digest):
+        """See FileCacherBackend.delete().
+
+        The chunks are left in place, as other files may use them.
+
+        """
+        self.backend.delete(digest)
+
+    def list(self):
+        """See FileCacherBackend.list().
+
+        """
+        return self.backend.list()
+
+    def identity(self):
+        """See FileCacherBackend.identity().
+
+        """
+        return self.backend.identity()
+
+    def existing_digests(self, digests):
+        """See FileCacherBackend.existing_digests().
+
+        """
+        return self.backend.existing_digests(digests)
+
+    def stage_files(self, session, files):
+        """See FileCacherBackend.stage_files().
+
+        Only files stored with put_chunked are split, so staged files
+        are stored whole (and, lacking a manifest header with their
+        digest, are never mistaken for manifests).
+
+        """
+        return self.backend.stage_files(session, files)
+
+
+class KnownDigests:
+    """The files recently seen in the storages used by this process.
+
+    Storing a file that is already stored happens often (e.g., for
+    identical submissions, or for the executables compiled from them),
+    so we remember the files that we stored or found in each storage:
+    for them, FileCacher only asks the backend whether they are still
+    there, instead of staging and uploading them again.
+
+    Entries are only hints, never a proof that a file is stored:
+    another process (e.g., cmsCleanFiles) may delete the files at any
+    time without this process knowing, so the backend is always
+    checked before returning the digest of a file as stored. The set
+    is bounded (least recently used entries are evicted) and entries
+    expire.
+
+    """
+
+    def __init__(self, size: int, ttl: float):
+        """Initialize.
+
+        size: the maximum number of entries.
+        ttl: the seconds after which an entry expires.
+
+        """
+        self.size = size
+        self.ttl = ttl
+        # Map from (storage identity, digest) to the time the entry
+        # was added, from the least recently used.
+        self._entries: OrderedDict[tuple[str, str], float] = OrderedDict()
+
+    def __contains__(self, key: tuple[str, str]) -> bool:
+        added = self._entries.get(key)
+        if added is None:
+            return False
+        if time.monotonic() - added > self.ttl:
+            del self._entries[key]
+            return False
+        self._entries.move_to_end(key)
+        return True
+
+    def add(self, key: tuple[str, str]):
+        self._entries[key] = time.monotonic()
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def discard(self, key: tuple[str, str]):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+# The files known to be stored, shared by all FileCacher instances of
+# this process.
+known_digests = KnownDigests(size=10000, ttl=600)
+
+
 class FileCacher:
     """This class implement a local cache for files stored as FSObject
     in the database.
@@ -490,6 +1579,12 @@ class FileCacher:
     # CHUNK_SIZE should be a multiple of these values.
     # Note that a too-small value can cause issues on high-latency networks.
     CHUNK_SIZE = 1024 * 1024  # 1 MiB
+    # Reading from the backend starts with CHUNK_SIZE and grows up to
+    # this, as each read may be a round trip to the database.
+    MAX_CHUNK_SIZE = 16 * 1024 * 1024  # 16 MiB
+    # How often (in seconds) to check whether another process on the
+    # same host finished downloading a file we need.
+    DOWNLOAD_LOCK_POLL_INTERVAL = 0.05
     backend: FileCacherBackend
 
     def __init__(self, service: "Service | None" = None, path: str | None = None, null: bool = False):
@@ -520,6 +1615,12 @@ class FileCacher:
             self.backend = DBBackend()
         else:
             self.backend = FSBackend(path)
+        # Compressed and chunked files must be readable whatever the
+        # configuration of this service, which only decides how new
+        # files are stored.
+        if not null:
+            self.backend = ChunkedBackend(CompressedBackend(
+                self.backend, config.global_.file_compression))
 
         # First we create the config directories.
         self._create_directory_or_die(config.global_.temp_dir)
@@ -541,10 +1642,31 @@ class FileCacher:
         # Just to make sure it was created.
         self._create_directory_or_die(self.file_dir)
 
+        # Lock files coordinating the downloads among the processes
+        # sharing the cache, one for each digest.
+        if self.is_shared():
+            self.lock_dir = os.path.join(self.file_dir, "_locks")
+            self._create_directory_or_die(self.lock_dir)
+
     def is_shared(self):
         """Return whether the cache directory is shared with other services."""
         return self.service is not None
 
+    def _is_known(self, digest: str) -> bool:
+        """Return whether the file is known to be in the backend."""
+        identity = self.backend.identity()
+        return identity is not None and (identity, digest) in known_digests
+
+    def _set_known(self, digest: str, known: bool = True):
+        """Remember whether the file is in the backend."""
+        identity = self.backend.identity()
+        if identity is None:
+            return
+        if known:
+            known_digests.add((identity, digest))
+        else:
+            known_digests.discard((identity, digest))
+
     @staticmethod
     def _create_directory_or_die(directory):
         """Create directory and ensure it exists, or raise a RuntimeError."""
@@ -583,6 +1705,80 @@ class FileCacher:
             if not returned:
                 fobj.close()
 
+    @contextmanager
+    def _download_lock(self, digest: str) -> Iterator[None]:
+        """Hold the right to download a file into the shared cache.
+
+        All the processes on a host using the shared cache (e.g., the
+        workers) take this lock before downloading a file, so that
+        each file is downloaded only once: the others wait for the
+        download to finish and then find the file in the cache.
+
+        The lock is released by the kernel if the process holding it
+        dies, so that a waiting process can take over the download.
+
+        The lock file is removed when the lock is released, so that
+        they do not pile up, one for each file ever downloaded. A
+        process that opened it before it was removed gets the lock on
+        a file nobody else sees: it notices, and tries again with a
+        new one.
+
+        digest: the digest of the file to download.
+
+        """
+        lock_path = os.path.join(self.lock_dir, digest)
+        waiting = False
+        while True:
+            fobj = open(lock_path, 'w')
+            try:
+                while True:
+                    try:
+                        fcntl.flock(fobj, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except BlockingIOError:
+                        # Polling instead of blocking, to let the other
+                        # greenlets run in the meantime.
+                        if not waiting:
+                            logger.debug("Waiting for another process to "
+                                         "download file %s.", digest)
+                            waiting = True
+                        gevent.sleep(self.DOWNLOAD_LOCK_POLL_INTERVAL)
+                    else:
+                        break
+                try:
+                    locked = os.stat(lock_path).st_ino \
+                        == os.fstat(fobj.fileno()).st_ino
+                except FileNotFoundError:
+                    locked = False
+            except BaseException:
+                fobj.close()
+                raise
+            if locked:
+                break
+            fobj.close()
+        try:
+            yield
+        finally:
+            # Removed before unlocking it: the processes waiting on
+            # it then find it is not the current one anymore.
+            os.unlink(lock_path)
+            fobj.close()
+
+    def _open_cached(self, digest: str,
+                     cache_only: bool) -> tuple[bool, typing.IO[bytes] | None]:
+        """Look for a file in the cache.
+
+        return: whether the file was found and, unless cache_only is
+            True, a readable binary file-like object for it.
+
+        """
+        cache_file_path = os.path.join(self.file_dir, digest)
+        if cache_only:
+            return os.path.exists(cache_file_path), None
+        try:
+            return True, open(cache_file_path, 'rb')
+        except FileNotFoundError:
+            return False, None
+
     def _load(self, digest: str, cache_only: bool) -> typing.IO[bytes] | None:
         """Load a file into the cache and open it for reading.
 
@@ -594,16 +1790,29 @@ class FileCacher:
         raise (KeyError): if the file cannot be found.
 
         """
-        cache_file_path = os.path.join(self.file_dir, digest)
+        found, fobj = self._open_cached(digest, cache_only)
+        if found:
+            return fobj
 
-        if cache_only:
-            if os.path.exists(cache_file_path):
-                return
-        else:
-            try:
-                return open(cache_file_path, 'rb')
-            except FileNotFoundError:
-                pass
+        if not self.is_shared():
+            return self._download(digest, cache_only)
+
+        with self._download_lock(digest):
+            # Another process may have downloaded the file while we
+            # were waiting for the lock.
+            found, fobj = self._open_cached(digest, cache_only)
+            if found:
+                return fobj
+            return self._download(digest, cache_only)
+
+    def _download(self, digest: str,
+                  cache_only: bool) -> typing.IO[bytes] | None:
+        """Download a file from the backend into the cache.
+
+        See _load for the meaning of the argument and the return value.
+
+        """
+        cache_file_path = os.path.join(self.file_dir, digest)
 
         logger.debug("File %s not in cache, downloading "
                      "from database.", digest)
@@ -612,7 +1821,8 @@ class FileCacher:
                                                        text=False)
         with open(ftmp_handle, 'wb') as ftmp, \
                 self.backend.get_file(digest) as fobj:
-            copyfileobj(fobj, ftmp, self.CHUNK_SIZE)
+            copyfileobj(fobj, ftmp, self.CHUNK_SIZE, self.MAX_CHUNK_SIZE)
+        self._set_known(digest)
 
         if not cache_only:
             # We allow anyone to delete files from the cache directory
@@ -735,7 +1945,8 @@ class FileCacher:
             with open(dst_path, 'wb') as dst:
                 copyfileobj(src, dst, self.CHUNK_SIZE)
 
-    def put_file_from_fobj(self, src: typing.IO[bytes], desc: str = "") -> str:
+    def put_file_from_fobj(self, src: typing.IO[bytes], desc: str = "",
+                           chunked: bool = False) -> str:
         """Store a file in the storage.
 
         If it's already (for some reason...) in the cache send that
@@ -749,12 +1960,29 @@ class FileCacher:
             to read the contents of the file.
         desc: the (optional) description to associate to the
             file.
+        chunked: whether the file is likely to be similar to others
+            already stored (e.g., the archive of a sandbox); if so, and
+            if enabled in the configuration, it is stored in chunks
+            (see ChunkedBackend).
 
         return: the digest of the stored file.
 
         """
         logger.debug("Reading input file to store on the database.")
 
+        # Small files (the common case) are hashed before anything
+        # else, so that if they are known to be stored already we can
+        # skip the staging and just check that they are still there.
+        first = src.read(self.CHUNK_SIZE)
+        second = src.read(self.CHUNK_SIZE) if len(first) > 0 else b""
+        if len(second) == 0:
+            digest = bytes_digest(first)
+            if self._is_known(digest) \
+                    and digest in self.backend.existing_digests([digest]):
+                logger.debug("File %s is known to be stored already.",
+                             digest)
+                return digest
+
         # Unfortunately, we have to read the whole file-obj to compute
         # the digest but we take that chance to save it to a temporary
         # path so that we then just need to move it. Hoping that both
@@ -765,8 +1993,9 @@ class FileCacher:
         with tempfile.NamedTemporaryFile('wb', delete=False,
                                          dir=self.temp_dir) as dst:
             d = Digester()
-            buf = src.read(self.CHUNK_SIZE)
-            while len(buf) > 0:
+            for buf in itertools.chain(
+                    [first, second],
+                    iter(functools.partial(src.read, self.CHUNK_SIZE), b"")):
                 d.update(buf)
                 while len(buf) > 0:
                     written = dst.write(buf)
@@ -775,7 +2004,6 @@ class FileCacher:
                     if written is None:
                         break
                     buf = buf[written:]
-                buf = src.read(self.CHUNK_SIZE)
             digest = d.digest()
             dst.flush()
 
@@ -784,22 +2012,177 @@ class FileCacher:
             cache_file_path = os.path.join(self.file_dir, digest)
 
             # Store the file in the backend. We do that even if the file
-            # was already in the cache
+            # was already in the cache (or known to be stored)
             # because there's a (small) chance that the file got removed
             # from the backend but somehow remained in the cache.
             # We read from the temporary file before moving it to
             # cache_file_path because the latter might be deleted before
             # we get a chance to open it.
             with open(dst.name, 'rb') as src:
-                fobj = self.backend.create_file(digest)
-                if fobj is not None:
-                    copyfileobj(src, fobj, self.CHUNK_SIZE)
-                    self.backend.commit_file(fobj, digest, desc)
+                if chunked \
+                        and config.global_.chunked_storage \
+                        and isinstance(self.backend, ChunkedBackend) \
+                        and os.fstat(src.fileno()).st_size \
+                        >= ChunkedBackend.MIN_FILE_SIZE:
+                    self.backend.put_chunked(src, digest, desc)
+                else:
+                    fobj = self.backend.create_file(digest)
+                    if fobj is not None:
+                        copyfileobj(src, fobj, self.CHUNK_SIZE,
+                                    self.MAX_CHUNK_SIZE)
+                        self.backend.commit_file(fobj, digest, desc)
+            self._set_known(digest)
 
             os.rename(dst.name, cache_file_path)
 
         return digest
 
+    def put_files(
+        self,
+        files: Sequence[tuple[Callable[[], typing.IO[bytes]], str]],
+        concurrency: int = 8,
+    ) -> list[str]:
+        """Store many files in the storage.
+
+        This is faster than storing the files one by one, as needed
+        when importing a task with many (possibly big) testcases: files
+        are hashed in parallel (in a pool of threads, as hashing
+        releases the GIL), the backend is asked which of them it
+        already has all at once, and the missing ones are uploaded
+        concurrently. Unlike put_file_from_fobj, the files are not
+        stored in the local cache.
+
+        files: for each file, a function that opens it (returning a
+            readable binary file-like object; it will be called more
+            than once, possibly from different threads) and the
+            description to associate to the file.
+        concurrency: the maximum number of files hashed or uploaded at
+            the same time.
+
+        return: the digests of the stored files, in the same order.
+
+        raise (RuntimeError): if a file changed while being stored.
+
+        """
+        def hash_file(file_: tuple[Callable[[], typing.IO[bytes]], str]):
+            d = Digester()
+            with file_[0]() as src:
+                buf = src.read(self.CHUNK_SIZE)
+                while len(buf) > 0:
+                    d.update(buf)
+                    buf = src.read(self.CHUNK_SIZE)
+            return d.digest()
+
+        threadpool = gevent.threadpool.ThreadPool(concurrency)
+        try:
+            digests = list(threadpool.imap(hash_file, files))
+        finally:
+            threadpool.kill()
+
+        # Known files are checked too, as they may have been deleted
+        # by another process since (see KnownDigests).
+        existing = self.backend.existing_digests(set(digests))
+        logger.info("Storing %d files (%d already stored).",
+                    len(files), sum(1 for d in digests if d in existing))
+
+        def upload_file(index: int):
+            open_, desc = files[index]
+            digest = digests[index]
+            fobj = self.backend.create_file(digest)
+            if fobj is None:
+                return
+            # Whatever was written must not be left behind (e.g., as an
+            # orphaned large object) if the file cannot be committed.
+            try:
+                d = Digester()
+                with open_() as src:
+                    buf = src.read(self.CHUNK_SIZE)
+                    while len(buf) > 0:
+                        d.update(buf)
+                        while len(buf) > 0:
+                            written = fobj.write(buf)
+                            # Cooperative yield.
+                            gevent.sleep(0)
+                            buf = buf[written:]
+                        buf = src.read(self.CHUNK_SIZE)
+                if d.digest() != digest:
+                    raise RuntimeError("File %s (%s) changed while being "
+                                       "stored." % (digest, desc))
+            except BaseException:
+                self.backend.discard_file(fobj)
+                raise
+            self.backend.commit_file(fobj, digest, desc)
+
+        # Upload each missing digest only once, even if it appears in
+        # more files.
+        to_upload: dict[str, int] = {}
+        for index, digest in enumerate(digests):
+            if digest not in existing:
+                to_upload.setdefault(digest, index)
+        pool = gevent.pool.Pool(concurrency)
+        try:
+            for index in to_upload.values():
+                pool.spawn(upload_file, index)
+            pool.join(raise_error=True)
+        finally:
+            pool.kill()
+
+        for digest in digests:
+            self._set_known(digest)
+        return digests
+
+    def put_files_from_paths(
+        self, files: Sequence[tuple[str, str]], concurrency: int = 8
+    ) -> list[str]:
+        """Store many files in the storage.
+
+        See `put_files'. This method will read the content of the
+        files from the given file-system locations.
+
+        files: pairs of paths of the files to store and descriptions
+            to associate to them.
+        concurrency: see `put_files'.
+
+        return: the digests of the stored files, in the same order.
+
+        """
+        return self.put_files(
+            [(functools.partial(open, path, 'rb'), desc)
+             for path, desc in files], concurrency)
+
+    def stage_files(
+        self, session: Session, files: Sequence[tuple[bytes, str]]
+    ) -> list[str]:
+        """Store many small files within a transaction of the caller.
+
+        If the backend supports it (see FileCacherBackend.stage_files),
+        the files are written through the given session, and are thus
+        stored if and only if the caller commits it, together with
+        (typically) the objects referring to them; this saves the
+        separate transactions needed to store each file otherwise.
+        If not, the files are stored right away, as with put_files.
+        Either way, the files are not stored in the local cache.
+
+        session: the session of the caller.
+        files: for each file, its content and the description to
+            associate to it.
+
+        return: the digests of the files, in the same order.
+
+        """
+        digests = [bytes_digest(content) for content, _ in files]
+        # All files are staged, even the known ones (see _is_known):
+        # another process may have deleted them since, and the insert
+        # leaves the ones that are there as they are. The staged files
+        # are not marked as known either, since the caller may not
+        # commit the session after all.
+        staged = [(digest, content, desc)
+                  for digest, (content, desc) in zip(digests, files)]
+        if not self.backend.stage_files(session, staged):
+            self.put_files([(functools.partial(io.BytesIO, content), desc)
+                            for content, desc in files])
+        return digests
+
     def put_file_content(self, content: bytes, desc: str = "") -> str:
         """Store a file in the storage.
 
@@ -871,6 +2254,7 @@ class FileCacher:
         if digest == Digest.TOMBSTONE:
             return
         self.drop(digest)
+        self._set_known(digest, False)
         self.backend.delete(digest)
 
     def drop(self, digest: str):
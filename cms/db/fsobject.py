@@ -25,26 +25,115 @@
 
 from collections.abc import Iterable
 import io
+import logging
+import time
 from typing import Self
 import typing
 
+import gevent.monkey
 import psycopg2
 import psycopg2.extensions
 from sqlalchemy.dialects.postgresql import OID
+from sqlalchemy.orm import deferred
 from sqlalchemy.schema import Column
-from sqlalchemy.types import String, Unicode
+from sqlalchemy.sql import text
+from sqlalchemy.types import BigInteger, LargeBinary, String, Unicode
 
+from cms import config
 from . import Base, custom_psycopg2_connection, Session
 
 
+logger = logging.getLogger(__name__)
+
+
+class LargeObjectConnectionPool:
+
+    """A pool of the connections used to access large objects.
+
+    Opening a connection is much more expensive than reading a small
+    file, so instead of closing the connection of a large object when
+    the object is closed we keep it for the next one. At most `size'
+    idle connections are kept; connections in use are not limited, as
+    a caller may need several large objects at the same time.
+
+    Like SQLAlchemy's pool (see pool_recycle in cms.db), connections
+    idle for too long are not reused, as the server may have dropped
+    them in the meantime.
+
+    The pool is used both by greenlets and by the threads of gevent's
+    thread pools (e.g., FileCacher.put_files), so the idle connections
+    are guarded by a real (not monkey-patched) lock, which is never
+    held while doing I/O.
+
+    """
+
+    # Seconds after which an idle connection is discarded.
+    RECYCLE = 120
+
+    def __init__(self, size: int):
+        self.size = size
+        # Pairs (connection, time it was returned to the pool).
+        self._idle: list[tuple[typing.Any, float]] = []
+        self._lock = gevent.monkey.get_original("threading", "Lock")()
+
+    def get(self) -> typing.Any:
+        """Return a connection, reusing an idle one if possible."""
+        while True:
+            with self._lock:
+                if len(self._idle) == 0:
+                    break
+                conn, released = self._idle.pop()
+            if conn.closed == 0 \
+                    and time.monotonic() - released < self.RECYCLE:
+                return conn
+            conn.close()
+        return custom_psycopg2_connection()
+
+    def put(self, conn: typing.Any):
+        """Give back a connection obtained through get.
+
+        The connection is rolled back first, so that no transaction
+        (possibly failed) is left open on it, even when the caller gave
+        it back on an error path; it is reused only if it is then in a
+        clean state, otherwise it is closed.
+
+        """
+        if conn.closed == 0:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                conn.close()
+        if conn.closed == 0 \
+                and conn.status == psycopg2.extensions.STATUS_READY \
+                and conn.get_transaction_status() == \
+                psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            with self._lock:
+                if len(self._idle) < self.size:
+                    self._idle.append((conn, time.monotonic()))
+                    return
+        conn.close()
+
+    def clear(self):
+        """Close all the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+
+# The pool shared by all large objects of this process.
+connection_pool = LargeObjectConnectionPool(
+    config.database.large_object_pool_size)
+
+
 class LargeObject(io.RawIOBase, typing.BinaryIO):
 
     """Present a PostgreSQL large object as a Python file-object.
 
-    A LargeObject creates and maintains (i.e. closes when done) its
-    own connection to the database. This approach is preferred over
-    using one of the connections pooled by SQLAlchemy (for example by
-    "borrowing" the one of the Session of the FSObject that created the
+    A LargeObject takes its own connection to the database from a
+    dedicated pool (and gives it back when closed). This approach is
+    preferred over using one of the connections pooled by SQLAlchemy
+    (for example by "borrowing" the one of the Session of the FSObject that created the
     LO instance, if any!) to make these objects independent from the
     Session (in particular, to allow them to live longer) and to avoid
     polluting the connections in the SQLAlchemy pool (because executing
@@ -96,25 +185,32 @@ class LargeObject(io.RawIOBase, typing.BinaryIO):
         self._readable = 'r' in modeset
         self._writable = 'w' in modeset
 
-        self._conn = custom_psycopg2_connection()
+        self._conn = connection_pool.get()
         cursor = self._conn.cursor()
 
-        # If the loid is 0, create the large object.
-        if self.loid == 0:
-            creat_mode = LargeObject.INV_READ | LargeObject.INV_WRITE
-            self.loid = self._execute("SELECT lo_creat(%(mode)s);",
-                                      {'mode': creat_mode},
-                                      "Couldn't create large object.", cursor)
+        try:
+            # If the loid is 0, create the large object.
             if self.loid == 0:
-                raise OSError("Couldn't create large object.")
-
-        # Open the large object.
-        open_mode = (LargeObject.INV_READ if self._readable else 0) | \
-                    (LargeObject.INV_WRITE if self._writable else 0)
-        self._fd = self._execute("SELECT lo_open(%(loid)s, %(mode)s);",
-                                 {'loid': self.loid, 'mode': open_mode},
-                                 "Couldn't open large object with LOID "
-                                 "%s." % self.loid, cursor)
+                creat_mode = LargeObject.INV_READ | LargeObject.INV_WRITE
+                self.loid = self._execute("SELECT lo_creat(%(mode)s);",
+                                          {'mode': creat_mode},
+                                          "Couldn't create large object.",
+                                          cursor)
+                if self.loid == 0:
+                    raise OSError("Couldn't create large object.")
+
+            # Open the large object.
+            open_mode = (LargeObject.INV_READ if self._readable else 0) | \
+                        (LargeObject.INV_WRITE if self._writable else 0)
+            self._fd = self._execute("SELECT lo_open(%(loid)s, %(mode)s);",
+                                     {'loid': self.loid, 'mode': open_mode},
+                                     "Couldn't open large object with LOID "
+                                     "%s." % self.loid, cursor)
+        except OSError:
+            # The connection may be broken, don't give it back.
+            self._fd = None
+            self._conn.close()
+            raise
 
         cursor.close()
 
@@ -326,15 +422,19 @@ class LargeObject(io.RawIOBase, typing.BinaryIO):
         if self._fd is None:
             return
 
-        self._execute("SELECT lo_close(%(fd)s);",
-                      {'fd': self._fd},
-                      "Couldn't close large object.")
-
-        self._conn.commit()
-
-        # We delete the fd number to avoid writing on another file by
-        # mistake
-        self._fd = None
+        try:
+            self._execute("SELECT lo_close(%(fd)s);",
+                          {'fd': self._fd},
+                          "Couldn't close large object.")
+            self._conn.commit()
+        finally:
+            # Also on errors (the pool rolls back what was not
+            # committed).
+            connection_pool.put(self._conn)
+
+            # We delete the fd number to avoid writing on another file
+            # by mistake
+            self._fd = None
 
     @staticmethod
     def unlink(loid: int, conn=None):
@@ -345,8 +445,15 @@ class LargeObject(io.RawIOBase, typing.BinaryIO):
 
         """
         if conn is None:
-            conn = custom_psycopg2_connection()
-            conn.autocommit = True
+            conn = connection_pool.get()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("SELECT lo_unlink(%(loid)s);",
+                                   {'loid': loid})
+                conn.commit()
+            finally:
+                connection_pool.put(conn)
+            return
 
         with conn.cursor() as cursor:
             cursor.execute("SELECT lo_unlink(%(loid)s);", {'loid': loid})
@@ -368,19 +475,37 @@ class FSObject(Base):
         primary_key=True,
         nullable=False)
 
-    # OID of the large object in the database
-    loid: int = Column(
+    # OID of the large object in the database, or None if the file is
+    # stored inline
+    loid: int | None = Column(
         OID,
-        nullable=False,
-        default=0)
+        nullable=True)
 
     # Human-readable description, primarily meant for debugging (i.e,
-    # should have no semantic value from the viewpoint of CMS)
+    # should have no semantic value from the viewpoint of CMS, except
+    # for telling apart the chunks and manifests of ChunkedBackend)
     description: str | None = Column(
         Unicode,
         nullable=True)
 
-    def get_lobject(self, mode: str = 'rb') -> LargeObject:
+    # Content of the file, if it is small enough to be stored inline
+    # (see FileCacher.stage_files) instead of in a large object; it is
+    # deferred, so that listing or describing files doesn't load it
+    content: bytes | None = deferred(Column(
+        LargeBinary,
+        nullable=True))
+
+    # Id of the transaction that stored the file, always filled in by
+    # the database. Unlike large object ids, these are 64 bits (so
+    # they don't wrap around) and say which files were stored after a
+    # given point in time (see cmscontrib.CleanFiles)
+    created_txid: int | None = Column(
+        BigInteger,
+        nullable=True,
+        server_default=text("txid_current()"),
+        index=True)
+
+    def get_lobject(self, mode: str = 'rb') -> typing.BinaryIO:
         """Return an open file bound to the represented large object.
 
         The returned value acts as a context manager, so it can be used
@@ -388,12 +513,19 @@ class FSObject(Base):
 
             with fsobject.get_lobject() as lobj:
 
+        If the file is stored inline, an in-memory file with its
+        content is returned instead (and it can only be read).
+
         mode: how to open the file (`r' -> read, `w' -> write,
              `b' -> binary, which must be always specified). If not
              given, `rb' is used.
 
         """
-        assert self.loid != 0, "Expected LO to have already been created!"
+        if self.loid is None:
+            assert self.content is not None, \
+                "Expected LO to have already been created!"
+            assert mode == 'rb', "Files stored inline are read-only!"
+            return io.BytesIO(self.content)
         # Here we rely on the fact that we're using psycopg2 as
         # PostgreSQL backend.
         lobj = LargeObject(self.loid, mode)
@@ -405,7 +537,8 @@ class FSObject(Base):
         """Delete this file.
 
         """
-        LargeObject.unlink(self.loid)
+        if self.loid is not None:
+            LargeObject.unlink(self.loid)
         self.sa_session.delete(self)
 
     @classmethod
@@ -797,3 +797,75 @@ class Evaluation(Base):
     def codename(self) -> str:
         """Return the codename of the testcase."""
         return self.testcase.codename
+
+
+class TaskScore(Base):
+    """Class to store the score of a participation on a task.
+
+    This is a materialization of what cms.grading.scoring.task_score
+    computes from the submissions of the participation on the task,
+    kept up to date by ScoringService, so that readers (e.g., CWS) do
+    not need to load all the submissions and their results. Rows are
+    computed on the active dataset of the task: one referring to
+    another dataset is stale. Rows are deleted when something they
+    depend on changes outside ScoringService (see
+    cms.grading.scoring.invalidate_task_scores), and readers fall back
+    to computing the score when there is no valid row.
+
+    """
+    __tablename__ = 'task_scores'
+
+    # Primary key is (participation_id, task_id).
+    participation_id: int = Column(
+        Integer,
+        ForeignKey(Participation.id,
+                   onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True)
+    participation: Participation = relationship(
+        Participation)
+
+    task_id: int = Column(
+        Integer,
+        ForeignKey(Task.id,
+                   onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True,
+        index=True)
+    task: Task = relationship(
+        Task)
+
+    # Dataset (id and object) the scores were computed on.
+    dataset_id: int = Column(
+        Integer,
+        ForeignKey(Dataset.id,
+                   onupdate="CASCADE", ondelete="CASCADE"),
+        nullable=False,
+        index=True)
+    dataset: Dataset = relationship(
+        Dataset)
+
+    # The full, public and tokened (see task_score) scores, not
+    # rounded.
+    score: float = Column(
+        Float,
+        nullable=False)
+    public_score: float = Column(
+        Float,
+        nullable=False)
+    tokened_score: float = Column(
+        Float,
+        nullable=False)
+
+    # Whether some of the submissions were not scored yet.
+    partial: bool = Column(
+        Boolean,
+        nullable=False)
+
+    # Number of official submissions, and of tokens played on them,
+    # the scores were computed from; readers that have loaded the
+    # submissions anyway can use them to check the row is current.
+    submission_count: int = Column(
+        Integer,
+        nullable=False)
+    token_count: int = Column(
+        Integer,
+        nullable=False)
@@ -228,6 +228,13 @@ class Task(Base):
         nullable=False,
         default=SCORE_MODE_MAX_TOKENED_LAST)
 
+    # A digest of the data the task was last imported from by a loader,
+    # used to skip importing it again if nothing changed (see
+    # TaskLoader.get_fingerprint).
+    import_fingerprint: str | None = Column(
+        Unicode,
+        nullable=True)
+
     # Active Dataset (id and object) currently being used for scoring.
     # The ForeignKeyConstraint for this column is set at table-level.
     active_dataset_id: int | None = Column(
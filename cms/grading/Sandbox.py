@@ -29,11 +29,14 @@ import stat
 import subprocess
 import tempfile
 import tarfile
+import time
 import typing
+import zlib
 
 from cms import config, rmtree
 from cms.db.filecacher import FileCacher
 from cmscommon.commands import pretty_print_cmdline
+from cmscommon.tracing import tracer
 
 logger = logging.getLogger(__name__)
 
@@ -55,6 +58,41 @@ def with_meta(func):
     return newfunc
 
 
+class _ResettingGzipWriter(io.RawIOBase):
+    """Write-only file-like object gzip-compressing what it receives.
+
+    The compression state is reset after each write, so that the
+    compressed form of a write depends only on its content: archives
+    sharing some files also share their compressed data, which can
+    then be stored only once (see ChunkedBackend).
+
+    """
+
+    def __init__(self, fobj: typing.IO[bytes]):
+        super().__init__()
+        self._fobj = fobj
+        self._compressor = zlib.compressobj(
+            6, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+        self._size = 0
+
+    def writable(self):
+        return True
+
+    def tell(self) -> int:
+        return self._size
+
+    def write(self, buf) -> int:
+        self._fobj.write(self._compressor.compress(buf))
+        self._fobj.write(self._compressor.flush(zlib.Z_FULL_FLUSH))
+        self._size += len(buf)
+        return len(buf)
+
+    def close(self):
+        if not self.closed:
+            self._fobj.write(self._compressor.flush())
+        super().close()
+
+
 def wait_without_std(procs: list[subprocess.Popen]) -> list[int]:
     """Wait for the conclusion of the processes in the list, avoiding
     starving for input and output.
@@ -64,6 +102,7 @@ def wait_without_std(procs: list[subprocess.Popen]) -> list[int]:
     return: a list of return codes.
 
     """
+    start_time = time.monotonic()
 
     def get_to_consume() -> list:
         """Amongst stdout and stderr of list of processes, find the
@@ -99,7 +138,10 @@ def wait_without_std(procs: list[subprocess.Popen]) -> list[int]:
             file_.read(8 * 1024)
         to_consume = get_to_consume()
 
-    return [process.wait() for process in procs]
+    exitcodes = [process.wait() for process in procs]
+    tracer.record("sandbox_run", time.monotonic() - start_time,
+                  processes=len(procs))
+    return exitcodes
 
 
 class Truncator(io.RawIOBase):
@@ -594,6 +636,7 @@ class Sandbox:
         file_cacher: FileCacher,
         description: str = "",
         trunc_len: int | None = None,
+        chunked: bool = False,
     ) -> str:
         """Put a sandbox file in FS and return its digest.
 
@@ -602,12 +645,14 @@ class Sandbox:
         description: the description for FS.
         trunc_len: if None, does nothing; otherwise, before
             returning truncate it at the specified length.
+        chunked: see FileCacher.put_file_from_fobj.
 
         return: the digest of the file.
 
         """
         with self.get_file(path, trunc_len=trunc_len) as file_:
-            return file_cacher.put_file_from_fobj(file_, description)
+            return file_cacher.put_file_from_fobj(
+                file_, description, chunked=chunked)
 
     def stat_file(self, path: str) -> os.stat_result:
         """Return the stats of a file in the sandbox.
@@ -758,8 +803,13 @@ class Sandbox:
             # Archive the working directory
             content_path = self.get_root_path()
             try:
-                with tarfile.open(fileobj=sandbox_archive, mode="w:gz") as tar_file:
-                    tar_file.add(content_path, os.path.basename(content_path))
+                if config.global_.chunked_storage:
+                    with _ResettingGzipWriter(sandbox_archive) as gz_file, \
+                            tarfile.open(fileobj=gz_file, mode="w") as tar_file:
+                        tar_file.add(content_path, os.path.basename(content_path))
+                else:
+                    with tarfile.open(fileobj=sandbox_archive, mode="w:gz") as tar_file:
+                        tar_file.add(content_path, os.path.basename(content_path))
             except Exception:
                 logger.warning("Failed to archive sandbox", exc_info=True)
                 return None
@@ -767,7 +817,8 @@ class Sandbox:
             # Put archive to FS
             sandbox_archive.seek(0)
             return self.file_cacher.put_file_from_fobj(
-                sandbox_archive, "Sandbox %s" % self.get_root_path()
+                sandbox_archive, "Sandbox %s" % self.get_root_path(),
+                chunked=True
             )
 
     def add_mapped_directory(
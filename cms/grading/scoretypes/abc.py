@@ -32,6 +32,7 @@ task.
 
 import logging
 import re
+from collections import OrderedDict
 from typing import TypedDict, NotRequired
 from abc import ABCMeta, abstractmethod
 
@@ -59,6 +60,13 @@ class ScoreType(metaclass=ABCMeta):
 
     TEMPLATE = ""
 
+    # Rendered score details, shared by all instances (as they are
+    # recreated often, see Dataset.score_type_object), by cache key,
+    # feedback level and locale; see get_html_details.
+    HTML_DETAILS_CACHE_SIZE = 1000
+    _html_details_cache: OrderedDict[tuple, tuple[tuple, str]] = \
+        OrderedDict()
+
     def __init__(self, parameters: object, public_testcases: dict[str, bool]):
         """Initializer.
 
@@ -118,6 +126,7 @@ class ScoreType(metaclass=ABCMeta):
         score_details: object,
         feedback_level: str = FEEDBACK_LEVEL_RESTRICTED,
         translation: Translation = DEFAULT_TRANSLATION,
+        cache_key: tuple | None = None,
     ) -> str:
         """Return an HTML string representing the score details of a
         submission.
@@ -126,10 +135,44 @@ class ScoreType(metaclass=ABCMeta):
             itself in the database; can be public or private.
         feedback_level: the level of details to show to users.
         translation: the translation to use.
+        cache_key: if given, something identifying score_details
+            (e.g., the submission result and whether they are the
+            public ones), used to reuse the HTML rendered the last
+            time for them. The HTML is rendered again if the details
+            (for example, because the result was invalidated and scored
+            again) or the score type changed in the meantime.
 
         return: an HTML string representing score_details.
 
         """
+        if cache_key is None or score_details is None:
+            return self._render_html_details(
+                score_details, feedback_level, translation)
+
+        cache = ScoreType._html_details_cache
+        key = (cache_key, feedback_level, translation.identifier)
+        validity = (type(self), self.parameters, self.public_testcases,
+                    score_details)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == validity:
+            cache.move_to_end(key)
+            return entry[1]
+
+        html = self._render_html_details(
+            score_details, feedback_level, translation)
+        cache[key] = (validity, html)
+        cache.move_to_end(key)
+        while len(cache) > self.HTML_DETAILS_CACHE_SIZE:
+            cache.popitem(last=False)
+        return html
+
+    def _render_html_details(
+        self,
+        score_details: object,
+        feedback_level: str,
+        translation: Translation,
+    ) -> str:
+        """Render the score details, see get_html_details."""
         _ = translation.gettext
         n_ = translation.ngettext
         if score_details is None:
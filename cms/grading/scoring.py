@@ -25,15 +25,19 @@
 
 from collections import namedtuple
 
-from sqlalchemy.orm import joinedload
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy import func
+from sqlalchemy.orm import Session, joinedload
 
-from cms.db import Submission, Dataset, Participation, Task
+from cms.db import Submission, Dataset, Participation, Task, TaskScore, \
+    Token
 from cmscommon.constants import \
     SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
 
 
 __all__ = [
     "compute_changes_for_dataset", "task_score",
+    "update_task_score", "get_task_score", "invalidate_task_scores",
 ]
 
 
@@ -182,6 +186,123 @@ def task_score(
     return score, partial
 
 
+def update_task_score(
+    session: Session, participation: Participation, task: Task
+):
+    """Compute and store the TaskScore of a participation on a task.
+
+    session: the session to use; the row is written but not committed.
+    participation: the participation.
+    task: the task, whose active dataset is used.
+
+    """
+    # Load all the information task_score needs at once.
+    submissions: list[Submission] = (
+        session.query(Submission)
+        .filter(Submission.participation == participation)
+        .filter(Submission.task == task)
+        .options(joinedload(Submission.token))
+        .options(joinedload(Submission.results))
+        .all()
+    )
+    official = [s for s in submissions if s.official]
+
+    score, partial = task_score(participation, task)
+    public_score, _ = task_score(participation, task, public=True)
+    tokened_score, _ = task_score(participation, task, only_tokened=True)
+
+    values = {
+        "dataset_id": task.active_dataset_id,
+        "score": score,
+        "public_score": public_score,
+        "tokened_score": tokened_score,
+        "partial": partial,
+        "submission_count": len(official),
+        "token_count": sum(1 for s in official if s.tokened()),
+    }
+    # ScoringService and CWS may both write the same row.
+    session.execute(
+        insert(TaskScore.__table__)
+        .values(participation_id=participation.id, task_id=task.id,
+                **values)
+        .on_conflict_do_update(
+            index_elements=["participation_id", "task_id"], set_=values))
+
+
+def get_task_score(
+    session: Session, participation: Participation, task: Task,
+    submissions: list[Submission] | None = None,
+) -> TaskScore | None:
+    """Return the stored TaskScore of a participation on a task.
+
+    The row is checked against the official submissions and tokens of
+    the participation on the task, which must be as many as the ones it
+    was computed from: invalidate_task_scores may run (e.g., in CWS,
+    for a new submission) while ScoringService is computing the row
+    from the previous submissions, and the row it then writes would be
+    stale.
+
+    session: the session to use.
+    participation: the participation.
+    task: the task.
+    submissions: if given, all the submissions of the participation
+        on the task, with tokens loaded, to check the row against;
+        otherwise they are counted in the database.
+
+    return: the TaskScore, or None if there is none, if it was not
+        computed on the active dataset of the task, or if it does not
+        match the submissions (in all cases the caller should use
+        task_score instead).
+
+    """
+    row = session.query(TaskScore)\
+        .filter(TaskScore.participation_id == participation.id)\
+        .filter(TaskScore.task_id == task.id)\
+        .one_or_none()
+    if row is None or row.dataset_id != task.active_dataset_id:
+        return None
+    if submissions is not None:
+        official = [s for s in submissions if s.official]
+        counts = (len(official), sum(1 for s in official if s.tokened()))
+    else:
+        counts = session.query(func.count(Submission.id),
+                               func.count(Token.id))\
+            .outerjoin(Submission.token)\
+            .filter(Submission.participation_id == participation.id)\
+            .filter(Submission.task_id == task.id)\
+            .filter(Submission.official.is_(True))\
+            .one()
+    if (row.submission_count, row.token_count) != tuple(counts):
+        return None
+    return row
+
+
+def invalidate_task_scores(
+    session: Session,
+    participation_id: int | None = None,
+    task_id: int | None = None,
+):
+    """Delete the TaskScores that might not be current anymore.
+
+    To be called when something that task_score depends on changes
+    outside of ScoringService (e.g., a new submission arrives, or the
+    score mode of a task changes). The rows are recreated when
+    ScoringService next scores a submission of theirs.
+
+    session: the session to use.
+    participation_id: if not None, only delete the rows of this
+        participation.
+    task_id: if not None, only delete the rows of this task.
+
+    """
+    query = session.query(TaskScore)
+    if participation_id is not None:
+        query = query.filter(TaskScore.participation_id == participation_id)
+    if task_id is not None:
+        query = query.filter(TaskScore.task_id == task_id)
+    query.delete(synchronize_session=False)
+
+
 def _task_score_max_tokened_last(
     score_details_tokened: list[tuple[float | None, object | None, bool]],
 ) -> float:
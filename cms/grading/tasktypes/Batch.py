@@ -349,7 +349,7 @@ class Batch(TaskType):
                         self._actual_output,
                         file_cacher,
                         "Output file in job %s" % job.info,
-                        trunc_len=100 * 1024)
+                        trunc_len=100 * 1024, chunked=True)
 
                 # If just asked to execute, fill text and set dummy outcome.
                 if job.only_execution:
@@ -428,7 +428,7 @@ class Communication(TaskType):
                     self.OUTPUT_FILENAME,
                     file_cacher,
                     "Output file in job %s" % job.info,
-                    trunc_len=100 * 1024)
+                    trunc_len=100 * 1024, chunked=True)
             else:
                 job.user_output = None
 
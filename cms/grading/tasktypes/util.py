@@ -32,6 +32,7 @@ compilation and the evaluation are contained in the task type class.
 import logging
 import os
 import shutil
+import time
 
 from cms import config
 from cms.db.filecacher import FileCacher
@@ -41,6 +42,7 @@ from cms.grading.Sandbox import Sandbox
 from cms.grading.language import Language
 from cms.grading.steps import EVALUATION_MESSAGES, checker_step, \
     white_diff_fobj_step
+from cmscommon.tracing import tracer
 
 
 logger = logging.getLogger(__name__)
@@ -61,6 +63,7 @@ def create_sandbox(box_index: int, file_cacher: FileCacher, name: str | None = N
     raise (JobException): if the sandbox cannot be created.
 
     """
+    start_time = time.monotonic()
     try:
         shard = file_cacher.service.shard if file_cacher.service is not None else None
         sandbox = Sandbox(box_index, shard, name=name)
@@ -68,6 +71,8 @@ def create_sandbox(box_index: int, file_cacher: FileCacher, name: str | None = N
         err_msg = "Couldn't create sandbox."
         logger.error(err_msg, exc_info=True)
         raise JobException(err_msg)
+    tracer.record("sandbox_setup", time.monotonic() - start_time,
+                  sandbox=sandbox.get_root_path())
     return sandbox
 
 
@@ -83,6 +88,8 @@ def delete_sandbox(sandbox: Sandbox, job: Job, success: bool | None = None):
     if success is None:
         success = job.success
 
+    start_time = time.monotonic()
+
     # Archive the sandbox if required
     if job.archive_sandbox:
         sandbox_digest = sandbox.archive()
@@ -100,6 +107,8 @@ def delete_sandbox(sandbox: Sandbox, job: Job, success: bool | None = None):
     except OSError:
         err_msg = "Couldn't delete sandbox."
         logger.warning(err_msg, exc_info=True)
+    tracer.record("sandbox_teardown", time.monotonic() - start_time,
+                  sandbox=sandbox.get_root_path())
 
 
 def is_manager_for_compilation(filename: str, language: Language) -> bool:
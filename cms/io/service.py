@@ -46,6 +46,7 @@ from cms import ConfigError, config, mkdir, ServiceCoord, Address, \
     get_service_address
 from cms.log import root_logger, shell_handler, ServiceFilter, \
     DetailedFormatter, LogServiceHandler, FileHandler
+from cmscommon.tracing import HistogramDict, tracer
 from .rpc import rpc_method, RemoteServiceServer, RemoteServiceClient, \
     FakeRemoteServiceClient
 
@@ -350,6 +351,16 @@ class Service:
         """
         return string
 
+    @rpc_method
+    def latency_histograms(self) -> dict[str, HistogramDict]:
+        """Return the latency histograms of the stages timed so far.
+
+        return: a dict mapping each stage name to its histogram (see
+            cmscommon.tracing.LatencyHistogram.to_dict).
+
+        """
+        return tracer.get_status()
+
     @rpc_method
     def quit(self, reason: str = ""):
         """Shut down the service
@@ -29,13 +29,14 @@ except:
     collections.MutableMapping = collections.abc.MutableMapping
 
 import tornado.wsgi
-from gevent.pywsgi import WSGIServer
+from gevent.pywsgi import WSGIHandler, WSGIServer
 from werkzeug.middleware.proxy_fix import ProxyFix
 from werkzeug.middleware.dispatcher import DispatcherMiddleware
 from werkzeug.middleware.shared_data import SharedDataMiddleware
 
 from cms.db.filecacher import FileCacher
-from cms.server.file_middleware import FileServerMiddleware
+from cms.server.file_middleware import FileServerMiddleware, FileWrapper, \
+    SECONDS_IN_A_YEAR
 from .service import Service
 from .web_rpc import RPCMiddleware
 
@@ -43,7 +44,32 @@ from .web_rpc import RPCMiddleware
 logger = logging.getLogger(__name__)
 
 
-SECONDS_IN_A_YEAR = 365 * 24 * 60 * 60
+class FileWSGIHandler(WSGIHandler):
+    """A gevent WSGI handler that sends files with sendfile.
+
+    The file has to be returned by the application as a FileWrapper
+    (that the handler provides as wsgi.file_wrapper), backed by a
+    real file, and with a known Content-Length.
+
+    """
+
+    def get_environ(self):
+        environ = super().get_environ()
+        environ["wsgi.file_wrapper"] = FileWrapper
+        return environ
+
+    def process_result(self):
+        if not isinstance(self.result, FileWrapper) \
+                or self.result.fileno() is None \
+                or self.code in (204, 304):
+            super().process_result()
+            return
+        # Send the headers.
+        self.write(b"")
+        if self.response_use_chunked:
+            super().process_result()
+            return
+        self.response_length += self.result.sendfile(self.socket)
 
 
 class WebService(Service):
@@ -105,7 +131,8 @@ class WebService(Service):
         if num_proxies_used > 0:
             self.wsgi_app = ProxyFix(self.wsgi_app, num_proxies_used)
 
-        self.web_server = WSGIServer((listen_address, listen_port), self)
+        self.web_server = WSGIServer((listen_address, listen_port), self,
+                                     handler_class=FileWSGIHandler)
 
     def __call__(self, environ, start_response):
         """Execute this instance as a WSGI application.
@@ -269,6 +269,8 @@ class ParticipationHandler(BaseHandler):
         if self.try_commit():
             # Update the user on RWS.
             self.service.proxy_service.reinitialize()
+            # The password might have changed.
+            self.service.revoke_login_tokens([participation.id])
         self.redirect(fallback_page)
 
 
@@ -40,6 +40,7 @@ except:
 import tornado.web
 
 from cms.db import Attachment, Dataset, Session, Statement, Submission, Task
+from cms.grading.scoring import invalidate_task_scores
 from cmscommon.datetime import make_datetime
 from .base import BaseHandler, SimpleHandler, require_permission
 
@@ -216,6 +217,9 @@ class TaskHandler(BaseHandler):
                 self.redirect(self.url("task", task_id))
                 return
 
+        # The score mode might have changed.
+        invalidate_task_scores(self.sql_session, task_id=task.id)
+
         if self.try_commit():
             # Update the task and score on RWS.
             self.service.proxy_service.dataset_updated(
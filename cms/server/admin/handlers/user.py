@@ -91,6 +91,9 @@ class UserHandler(BaseHandler):
         if self.try_commit():
             # Update the user on RWS.
             self.service.proxy_service.reinitialize()
+            # The password might have changed.
+            self.service.revoke_login_tokens(
+                [participation.id for participation in user.participations])
         self.redirect(fallback_page)
 
 
@@ -85,12 +85,27 @@ class AdminWebServer(WebService):
             ServiceCoord("ProxyService", 0),
             must_be_present=ranking_enabled)
 
+        # To revoke the login cookies of the participations we change.
+        self.contest_web_servers = [
+            self.connect_to(ServiceCoord("ContestWebServer", i))
+            for i in range(get_service_shards("ContestWebServer"))]
+
         self.resource_services = []
         for i in range(get_service_shards("ResourceService")):
             self.resource_services.append(self.connect_to(
                 ServiceCoord("ResourceService", i)))
         self.logservice = self.connect_to(ServiceCoord("LogService", 0))
 
+    def revoke_login_tokens(self, participation_ids: list[int]):
+        """Have CWS check again the login cookies of some participations.
+
+        participation_ids: the ids of the participations.
+
+        """
+        for contest_web_server in self.contest_web_servers:
+            contest_web_server.revoke_login_tokens(
+                participation_ids=participation_ids)
+
     def is_rpc_authorized(self, service: str, shard: int, method: str):
         return rpc_authorization_checker(self.auth_handler.admin_id,
                                          service, shard, method)
@@ -28,9 +28,11 @@
 import ipaddress
 import json
 import logging
+import time
 from datetime import datetime, timedelta
 import typing
 
+import gevent.threadpool
 from sqlalchemy.orm import contains_eager, joinedload
 
 from cms import config
@@ -39,9 +41,13 @@ from cms.db.contest import Contest
 from cms.db.session import Session
 from cmscommon.crypto import validate_password
 from cmscommon.datetime import make_datetime, make_timestamp
+from cmscommon.tracing import tracer
 
 
-__all__ = ["validate_login", "authenticate_request"]
+__all__ = [
+    "validate_login", "authenticate_request", "LoginTokens",
+    "PasswordVerifier", "LoginRateLimiter",
+]
 
 
 logger = logging.getLogger(__name__)
@@ -50,6 +56,222 @@ logger = logging.getLogger(__name__)
 AnyIPAddress: typing.TypeAlias = ipaddress.IPv4Address | ipaddress.IPv6Address
 
 
+class LoginTokens:
+    """Decide which login cookies can be trusted without the database.
+
+    A login cookie (or authorization header), signed by tornado, holds
+    the username, the (hashed) password, the participation id, the time
+    it was issued and whether it is an impersonation. A cookie issued
+    less than token_duration seconds ago is trusted as is: the
+    participation is loaded by its id and the password is not compared
+    with the one in the database. After that, the next request checks
+    the cookie against the database and, if it is still valid, issues
+    a new one: cookies are thus refreshed only once in a while, rather
+    than at every request.
+
+    Trusted cookies can be revoked (for example when the password of
+    the participation changes) by recording the time of the revocation
+    in a small in-memory table: cookies issued before it are checked
+    against the database again.
+
+    """
+
+    def __init__(self, token_duration: float | None = None):
+        """Create an empty table of revocations.
+
+        token_duration: seconds during which a cookie is trusted; if
+            None, the configured value is used. It is capped by the
+            cookie duration, as refreshing the cookie is what keeps it
+            from expiring.
+
+        """
+        if token_duration is None:
+            token_duration = config.contest_web_server.auth_token_duration
+        self.token_duration = timedelta(seconds=min(
+            token_duration, config.contest_web_server.cookie_duration))
+        # For each participation id, the time of the last revocation.
+        self._revoked: dict[int, datetime] = {}
+
+    def revoke(self, participation_id: int, timestamp: datetime):
+        """Stop trusting the cookies of a participation issued so far.
+
+        participation_id: the id of the participation.
+        timestamp: the time of the revocation.
+
+        """
+        self._revoked[participation_id] = timestamp
+        # Cookies issued before token_duration ago are not trusted
+        # anyway, so there is no need to remember older revocations.
+        for other_id, revoked in list(self._revoked.items()):
+            if timestamp - revoked > self.token_duration:
+                del self._revoked[other_id]
+
+    def is_trusted(
+        self, participation_id: int, issued: datetime, timestamp: datetime
+    ) -> bool:
+        """Return whether a cookie can be trusted without the database.
+
+        participation_id: the id of the participation in the cookie.
+        issued: the time the cookie was issued.
+        timestamp: the date and the time of the request.
+
+        """
+        if timestamp - issued > self.token_duration:
+            return False
+        revoked = self._revoked.get(participation_id)
+        return revoked is None or issued > revoked
+
+
+class PasswordVerifier:
+    """Verify passwords in a bounded pool of threads.
+
+    Verifying a bcrypt-hashed password takes tens of milliseconds of
+    CPU: doing it in the event loop would stall all other requests when
+    many contestants log in together (e.g., at the start of the
+    contest). bcrypt releases the GIL, so a few threads are enough to
+    move the work out of the loop; logins in excess wait for a free
+    thread, and the time they wait is recorded (as the "login_queue"
+    stage, see cmscommon.tracing) together with the time spent
+    verifying ("login_verify").
+
+    """
+
+    def __init__(self, size: int | None = None):
+        """Create the pool.
+
+        size: the number of threads; if None, the configured value is
+            used.
+
+        """
+        if size is None:
+            size = config.contest_web_server.password_verification_threads
+        self._pool = gevent.threadpool.ThreadPool(size)
+
+    def validate(self, authentication: str, password: str) -> bool:
+        """Validate a password, see cmscommon.crypto.validate_password.
+
+        Only the calling greenlet waits for the result.
+
+        """
+        enqueue_time = time.monotonic()
+        start_time = None
+
+        def verify():
+            nonlocal start_time
+            start_time = time.monotonic()
+            return validate_password(authentication, password)
+
+        try:
+            return self._pool.apply(verify)
+        finally:
+            if start_time is not None:
+                tracer.record("login_queue", start_time - enqueue_time)
+                tracer.record("login_verify", time.monotonic() - start_time)
+
+
+class LoginRateLimiter:
+    """Limit the login attempts coming from each IP address and for
+    each username, to blunt retry storms.
+
+    Each IP address, and each username from each IP address, has a
+    bucket allowing the given number of attempts per minute, with
+    bursts up to the same number; an attempt is allowed only if both
+    its buckets allow it. The buckets of a username are per IP address
+    so that attempts from elsewhere (e.g., someone guessing the
+    password) cannot lock its user out. A limit of 0 disables the
+    corresponding buckets, and by default only the ones per username
+    are enabled, as many users may share an IP address.
+
+    The buckets live in the memory of each CWS, so the limits apply to
+    each shard separately, not to the whole contest.
+
+    """
+
+    # Seconds in which the buckets fill up completely.
+    PERIOD = 60.0
+
+    def __init__(
+        self, per_ip: int | None = None, per_user: int | None = None
+    ):
+        """Create the limiter.
+
+        per_ip: attempts per minute allowed for each IP address, 0 for
+            no limit; if None, the configured value is used.
+        per_user: the same, for each username from each IP address.
+
+        """
+        if per_ip is None:
+            per_ip = config.contest_web_server.login_attempts_per_ip
+        if per_user is None:
+            per_user = config.contest_web_server.login_attempts_per_user
+        self._capacities = {"ip": per_ip, "user": per_user}
+        # For each (kind, key), the attempts left at the given time.
+        self._buckets: dict[tuple[str, object], tuple[float, float]] = {}
+        self._last_pruned = time.monotonic()
+
+    def _available(self, kind: str, key: object, now: float) -> float:
+        capacity = self._capacities[kind]
+        attempts, last = self._buckets.get((kind, key), (capacity, now))
+        return min(capacity,
+                   attempts + (now - last) * capacity / self.PERIOD)
+
+    def allow(
+        self, ip_address: AnyIPAddress, username: str,
+        now: float | None = None
+    ) -> bool:
+        """Record a login attempt, if it is allowed.
+
+        ip_address: the IP address the attempt comes from.
+        username: the username the attempt is for.
+        now: the current monotonic time, if already known.
+
+        return: whether the attempt can proceed.
+
+        """
+        if now is None:
+            now = time.monotonic()
+        keys = [(kind, key)
+                for kind, key in [("ip", ip_address),
+                                  ("user", (ip_address, username))]
+                if self._capacities[kind] > 0]
+        available = {k: self._available(*k, now) for k in keys}
+        if any(attempts < 1 for attempts in available.values()):
+            return False
+        for k, attempts in available.items():
+            self._buckets[k] = (attempts - 1, now)
+        self._forget_full(now)
+        return True
+
+    def _forget_full(self, now: float):
+        """Drop the buckets that have filled up again, once per period,
+        to keep memory bounded.
+
+        """
+        if now - self._last_pruned < self.PERIOD:
+            return
+        self._last_pruned = now
+        for k in list(self._buckets):
+            if self._available(*k, now) >= self._capacities[k[0]]:
+                del self._buckets[k]
+
+
+def _make_cookie(
+    participation: Participation, username: str, password: str,
+    timestamp: datetime, impersonated: bool
+) -> bytes:
+    """Return the content of the login cookie.
+
+    participation: the participation that authenticated.
+    username: its username.
+    password: its (hashed) password, or "" when impersonated.
+    timestamp: the time the cookie is issued at.
+    impersonated: whether the administrator is impersonating the user.
+
+    """
+    return json.dumps([username, password, make_timestamp(timestamp),
+                       impersonated, participation.id]).encode("utf-8")
+
+
 def get_password(participation: Participation) -> str:
     """Return the password the participation can log in with.
 
@@ -71,7 +293,8 @@ def validate_login(
     username: str,
     password: str,
     ip_address: AnyIPAddress,
-    admin_token: str = ""
+    admin_token: str = "",
+    password_verifier: PasswordVerifier | None = None,
 ) -> tuple[Participation | None, bytes | None]:
     """Authenticate a user logging in, with username and password.
 
@@ -93,6 +316,8 @@ def validate_login(
     password: the password the user provided.
     ip_address: the IP address the request came from.
     admin_token: administrator's token used to impersonate a user
+    password_verifier: where to verify the password, if not in the
+        calling thread.
 
     return: if the user couldn't
         be authenticated then return None, otherwise return the
@@ -133,13 +358,16 @@ def validate_login(
                     timestamp)
 
         return (participation,
-                json.dumps([username, "", make_timestamp(timestamp), True])
-                    .encode("utf-8"))
+                _make_cookie(participation, username, "", timestamp, True))
 
     correct_password = get_password(participation)
 
     try:
-        password_valid = validate_password(correct_password, password)
+        if password_verifier is not None:
+            password_valid = password_verifier.validate(
+                correct_password, password)
+        else:
+            password_valid = validate_password(correct_password, password)
     except ValueError as e:
         # This is either a programming or a configuration error.
         logger.warning(
@@ -167,8 +395,8 @@ def validate_login(
     # If hashing is used, the cookie stores the hashed password so that
     # the expensive bcrypt call doesn't need to be done at every request.
     return (participation,
-            json.dumps([username, correct_password, make_timestamp(timestamp), False])
-                .encode("utf-8"))
+            _make_cookie(participation, username, correct_password,
+                         timestamp, False))
 
 
 class AmbiguousIPAddress(Exception):
@@ -182,6 +410,7 @@ def authenticate_request(
     cookie: bytes | None,
     authorization_header: bytes | None,
     ip_address: AnyIPAddress,
+    login_tokens: LoginTokens | None = None,
 ) -> tuple[Participation | None, bytes | None, bool]:
     """Authenticate a user returning to the site, with a cookie.
 
@@ -204,6 +433,10 @@ def authenticate_request(
       is valid, the corresponding participation is returned, together
       with a refreshed cookie.
 
+    If login_tokens is given, recently issued cookies are trusted
+    without checking them against the database, and returned unchanged
+    (i.e., they do not need to be set again), see LoginTokens.
+
     After finding the participation, IP login and hidden users
     restrictions are checked.
 
@@ -219,6 +452,7 @@ def authenticate_request(
     authorization_header: the value of X-CMS-Authorization header (if any).
     ip_address: the IP address the request
         came from.
+    login_tokens: the cookies that can be trusted, if any.
 
     return: a tuple consisting of participation (None if authentication failed),
         a cookie that has to be set (or None), and a boolean flag indicating
@@ -242,7 +476,8 @@ def authenticate_request(
         participation, cookie, impersonated = (
             _authenticate_request_from_cookie_or_authorization_header(
                 sql_session, contest, timestamp,
-                authorization_header if authorization_header is not None else cookie))
+                authorization_header if authorization_header is not None else cookie,
+                login_tokens))
 
     if participation is None:
         return None, None, False
@@ -330,11 +565,13 @@ def _authenticate_request_by_ip_address(
 
 
 def _authenticate_request_from_cookie_or_authorization_header(
-    sql_session: Session, contest: Contest, timestamp: datetime, cookie: bytes | None
+    sql_session: Session, contest: Contest, timestamp: datetime,
+    cookie: bytes | None, login_tokens: LoginTokens | None = None
 ) -> tuple[Participation | None, bytes | None, bool]:
     """Return the current participation based on the cookie.
 
-    If a participation can be extracted, the cookie is refreshed.
+    If a participation can be extracted, the cookie is refreshed,
+    unless it can be trusted as is.
 
     sql_session: the SQLAlchemy database session used to
         execute queries.
@@ -342,6 +579,7 @@ def _authenticate_request_from_cookie_or_authorization_header(
     timestamp: the date and the time of the request.
     cookie: the contents of the cookie (or authorization header)
         provided in the request (if any).
+    login_tokens: the cookies that can be trusted, if any.
 
     return: a triple of the participation extracted from the cookie (or None),
         the cookie to set/refresh (or None), and a boolean flag indicating
@@ -353,12 +591,16 @@ def _authenticate_request_from_cookie_or_authorization_header(
         return None, None, False
 
     # Parse cookie.
+    raw_cookie = cookie
     try:
         cookie: typing.Any = json.loads(cookie.decode("utf-8"))
         username: str = cookie[0]
         password: str = cookie[1]
         last_update = make_datetime(cookie[2])
         impersonated: bool = cookie[3]
+        # Cookies issued before participation ids were included in them
+        # are never trusted without the database.
+        participation_id: int | None = cookie[4] if len(cookie) > 4 else None
     except Exception as e:
         # Cookies are stored securely and thus cannot be tampered with:
         # this is either a programming or a configuration error.
@@ -382,6 +624,16 @@ def _authenticate_request_from_cookie_or_authorization_header(
                            config.contest_web_server.cookie_duration)
         return None, None, False
 
+    if login_tokens is not None and participation_id is not None \
+            and login_tokens.is_trusted(
+                participation_id, last_update, timestamp):
+        participation = Participation.get_from_id(
+            participation_id, sql_session)
+        if participation is None or participation.contest_id != contest.id:
+            log_failed_attempt("user not registered to contest")
+            return None, None, False
+        return participation, raw_cookie, impersonated
+
     # Load participation from DB and make sure it exists.
     participation: Participation | None = (
         sql_session.query(Participation)
@@ -415,6 +667,6 @@ def _authenticate_request_from_cookie_or_authorization_header(
     # We store the hashed password (if hashing is used) so that the
     # expensive bcrypt hashing doesn't need to be done at every request.
     return (participation,
-            json.dumps([username, correct_password, make_timestamp(timestamp), impersonated])
-                .encode("utf-8"),
+            _make_cookie(participation, username, correct_password,
+                         timestamp, impersonated),
             impersonated)
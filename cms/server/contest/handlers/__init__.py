@@ -34,6 +34,7 @@ from .tasksubmission import \
     SubmitHandler, \
     TaskSubmissionsHandler, \
     SubmissionStatusHandler, \
+    BatchStatusHandler, \
     SubmissionDetailsHandler, \
     SubmissionFileHandler, \
     UseTokenHandler
@@ -68,6 +69,7 @@ HANDLERS = [
     (r"/start", StartHandler),
     (r"/notifications", NotificationsHandler),
     (r"/documentation", DocumentationHandler),
+    (r"/status", BatchStatusHandler),
 
     # Tasks
 
@@ -80,6 +82,7 @@ HANDLERS = [
     (r"/tasks/(.*)/submit", SubmitHandler),
     (r"/tasks/(.*)/submissions", TaskSubmissionsHandler),
     (r"/tasks/(.*)/submissions/([1-9][0-9]*)", SubmissionStatusHandler),
+    (r"/tasks/(.*)/status", BatchStatusHandler),
     (r"/tasks/(.*)/submissions/([1-9][0-9]*)/details",
      SubmissionDetailsHandler),
     (r"/tasks/(.*)/submissions/([1-9][0-9]*)/files/(.*)",
@@ -75,9 +75,17 @@ class ApiLoginHandler(ApiContestHandler):
                            self.request.remote_ip)
             return None
 
+        if not self.service.login_rate_limiter.allow(ip_address, username):
+            logger.info("Too many login attempts from IP address %s or as "
+                        "user %r, on contest %s, at %s", ip_address, username,
+                        self.contest.name, self.timestamp)
+            self.json({"error": "Too many login attempts"}, 429)
+            return
+
         participation, login_data = validate_login(
             self.sql_session, self.contest, self.timestamp, username, password,
-            ip_address, admin_token=admin_token)
+            ip_address, admin_token=admin_token,
+            password_verifier=self.service.password_verifier)
 
         if participation is None:
             self.json({"error": "Login failed"}, 403)
@@ -174,18 +174,21 @@ class ContestHandler(BaseHandler):
                            self.request.remote_ip)
             return None
 
-        participation, cookie, impersonated = authenticate_request(
+        participation, new_cookie, impersonated = authenticate_request(
             self.sql_session, self.contest,
             self.timestamp, cookie,
             authorization_header,
-            ip_address)
+            ip_address,
+            self.service.login_tokens)
 
-        if cookie is None:
+        if new_cookie is None:
             self.clear_cookie(cookie_name)
-        elif self.refresh_cookie:
+        # Trusted cookies are returned unchanged and are not set again,
+        # so they are refreshed only once in a while.
+        elif self.refresh_cookie and new_cookie != cookie:
             self.set_secure_cookie(
                 cookie_name,
-                cookie,
+                new_cookie,
                 expires_days=None,
                 max_age=config.contest_web_server.cookie_duration,
             )
@@ -28,6 +28,7 @@
 
 """
 
+import functools
 import ipaddress
 import json
 import logging
@@ -235,9 +236,16 @@ class LoginHandler(ContestHandler):
                            self.request.remote_ip)
             return None
 
+        if not self.service.login_rate_limiter.allow(ip_address, username):
+            logger.info("Too many login attempts from IP address %s or as "
+                        "user %r, on contest %s, at %s", ip_address, username,
+                        self.contest.name, self.timestamp)
+            self.redirect(error_page)
+            return
+
         participation, cookie = validate_login(
             self.sql_session, self.contest, self.timestamp, username, password,
-            ip_address)
+            ip_address, password_verifier=self.service.password_verifier)
 
         cookie_name = self.contest.name + "_login"
         if cookie is None:
@@ -306,20 +314,46 @@ class NotificationsHandler(ContestHandler):
                                  self.timestamp, after=last_notification)
 
         # Simple notifications
-        notifications = self.service.notifications
-        username = participation.user.username
-        if username in notifications:
-            for notification in notifications[username]:
-                res.append({"type": "notification",
-                            "timestamp": make_timestamp(notification[0]),
-                            "subject": notification[1],
-                            "text": notification[2],
-                            "level": notification[3]})
-            del notifications[username]
+        for notification in self.service.notifications.pop(
+                participation.user.username):
+            res.append({"type": "notification",
+                        "timestamp": make_timestamp(notification.timestamp),
+                        "subject": notification.subject,
+                        "text": notification.text,
+                        "level": notification.level})
 
         self.write(json.dumps(res))
 
 
+@functools.lru_cache(maxsize=128)
+def get_language_docs(
+    language_names: tuple[str, ...]
+) -> list[tuple[str, str]]:
+    """Return the documentation available for the given languages.
+
+    The result is cached, as the documentation is not expected to
+    change while CWS is running, and the documentation page (whose
+    main content is cached too, see documentation.html) should be
+    served without touching the filesystem.
+
+    language_names: the names of the languages of a contest.
+
+    return: pairs of a language name and the directory (relative to
+        the docs path) of its documentation.
+
+    """
+    language_docs = []
+    if config.contest_web_server.docs_path is not None:
+        for language in map(get_language, language_names):
+            ext = language.source_extensions[0][1:]  # remove dot
+            path = os.path.join(config.contest_web_server.docs_path, ext)
+            if os.path.exists(path):
+                language_docs.append((language.name, ext))
+    else:
+        language_docs.append(("C++", "en"))
+    return language_docs
+
+
 class DocumentationHandler(ContestHandler):
     """Displays the instruction (compilation lines, documentation,
     ...) of the contest.
@@ -329,17 +363,7 @@ class DocumentationHandler(ContestHandler):
     @multi_contest
     def get(self):
         contest: Contest = self.r_params.get("contest")
-        languages = [get_language(lang) for lang in contest.languages]
-
-        language_docs = []
-        if config.contest_web_server.docs_path is not None:
-            for language in languages:
-                ext = language.source_extensions[0][1:]  # remove dot
-                path = os.path.join(config.contest_web_server.docs_path, ext)
-                if os.path.exists(path):
-                    language_docs.append((language.name, ext))
-        else:
-            language_docs.append(("C++", "en"))
+        language_docs = get_language_docs(tuple(contest.languages))
 
         self.render("documentation.html",
                     COMPILATION_MESSAGES=COMPILATION_MESSAGES,
@@ -86,7 +86,9 @@ class TaskStatementViewHandler(FileHandler):
         else:
             filename = "%s.pdf" % task.name
 
-        self.fetch(statement, "application/pdf", filename=filename, disposition="inline")
+        # Links carry the digest, so that they change with the content.
+        self.fetch(statement, "application/pdf", filename=filename, disposition="inline",
+                   immutable=self.get_argument("digest", None) == statement)
 
 
 class TaskAttachmentViewHandler(FileHandler):
@@ -111,4 +113,5 @@ class TaskAttachmentViewHandler(FileHandler):
         if mimetype is None:
             mimetype = 'application/octet-stream'
 
-        self.fetch(attachment, mimetype, filename)
+        self.fetch(attachment, mimetype, filename,
+                   immutable=self.get_argument("digest", None) == attachment)
@@ -29,6 +29,8 @@
 
 """
 
+import hashlib
+import json
 import logging
 import re
 
@@ -44,12 +46,12 @@ except:
     collections.MutableMapping = collections.abc.MutableMapping
 
 import tornado.web
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import Session, joinedload
 
 from cms import config, FEEDBACK_LEVEL_FULL
-from cms.db import Submission, SubmissionResult
+from cms.db import Submission, SubmissionResult, UserTest, UserTestResult
 from cms.grading.languagemanager import get_language
-from cms.grading.scoring import task_score
+from cms.grading.scoring import get_task_score, task_score
 from cms.server import multi_contest
 from cms.server.contest.submission import get_submission_count, \
     UnacceptableSubmission, accept_submission
@@ -69,6 +71,55 @@ def N_(msgid):
     return msgid
 
 
+def get_public_and_tokened_scores(
+    sql_session: Session,
+    participation: Participation,
+    task: Task,
+    submissions: list[Submission] | None = None,
+) -> tuple[float, float, bool]:
+    """Return the scores of a participation on a task shown in CWS.
+
+    Use the TaskScore stored by ScoringService if it is valid (see
+    get_task_score), and compute the scores from the submissions
+    otherwise.
+
+    sql_session: the session to use.
+    participation: the participation.
+    task: the task.
+    submissions: if given, all the submissions of the participation
+        on the task, with tokens and results loaded; they are used to
+        check that the TaskScore is current (instead of counting them
+        in the database), and to compute the scores without further
+        queries if it is not.
+
+    return: the public and the tokened score (rounded), and whether
+        they are partial.
+
+    """
+    stored = get_task_score(sql_session, participation, task, submissions)
+    if stored is not None:
+        return (round(stored.public_score, task.score_precision),
+                round(stored.tokened_score, task.score_precision),
+                stored.partial)
+
+    if submissions is None:
+        # Just to preload all information required to compute the
+        # task score.
+        sql_session.query(Submission)\
+            .filter(Submission.participation == participation)\
+            .filter(Submission.task == task)\
+            .options(joinedload(Submission.token))\
+            .options(joinedload(Submission.results))\
+            .all()
+    public_score, is_public_score_partial = task_score(
+        participation, task, public=True, rounded=True)
+    tokened_score, is_tokened_score_partial = task_score(
+        participation, task, only_tokened=True, rounded=True)
+    # These two should be the same, anyway.
+    return (public_score, tokened_score,
+            is_public_score_partial or is_tokened_score_partial)
+
+
 class SubmitHandler(ContestHandler):
     """Handles the received submissions.
 
@@ -142,12 +193,9 @@ class TaskSubmissionsHandler(ContestHandler):
             .all()
         )
 
-        public_score, is_public_score_partial = task_score(
-            participation, task, public=True, rounded=True)
-        tokened_score, is_tokened_score_partial = task_score(
-            participation, task, only_tokened=True, rounded=True)
-        # These two should be the same, anyway.
-        is_score_partial = is_public_score_partial or is_tokened_score_partial
+        public_score, tokened_score, is_score_partial = \
+            get_public_and_tokened_scores(
+                self.sql_session, participation, task, submissions)
 
         submissions_left_contest = None
         if self.contest.max_submission_number is not None:
@@ -213,20 +261,9 @@ class SubmissionStatusHandler(ContestHandler):
             "task_is_score_partial" as partial info is the same for both.
 
         """
-        # Just to preload all information required to compute the task score.
-        self.sql_session.query(Submission)\
-            .filter(Submission.participation == participation)\
-            .filter(Submission.task == task)\
-            .options(joinedload(Submission.token))\
-            .options(joinedload(Submission.results))\
-            .all()
-        data["task_public_score"], public_score_is_partial = \
-            task_score(participation, task, public=True, rounded=True)
-        data["task_tokened_score"], tokened_score_is_partial = \
-            task_score(participation, task, only_tokened=True, rounded=True)
-        # These two should be the same, anyway.
-        data["task_score_is_partial"] = \
-            public_score_is_partial or tokened_score_is_partial
+        data["task_public_score"], data["task_tokened_score"], \
+            data["task_score_is_partial"] = get_public_and_tokened_scores(
+                self.sql_session, participation, task)
 
         score_type = task.active_dataset.score_type_object
         data["task_public_score_message"] = score_type.format_score(
@@ -292,6 +329,157 @@ class SubmissionStatusHandler(ContestHandler):
         self.write(data)
 
 
+class BatchStatusHandler(ContestHandler):
+    """Return the statuses of all the pending submissions and user
+    tests of the contestant, on a task or on the whole contest.
+
+    Pending means not in a terminal status yet: when one disappears
+    from the list, the client can ask for its details (scores, ...) to
+    SubmissionStatusHandler or UserTestStatusHandler, once. The payload
+    is {"submissions": {task name: {opaque id: [status, status text]}},
+    "user_tests": {task name: {user test num: [status, status text]}}},
+    and has an ETag computed before formatting it, so that polling
+    while nothing changes is cheap.
+
+    """
+
+    SUBMISSION_STATUS_TEXT = SubmissionStatusHandler.STATUS_TEXT
+
+    USER_TEST_STATUS_TEXT = {
+        UserTestResult.COMPILING: N_("Compiling..."),
+        UserTestResult.EVALUATING: N_("Executing..."),
+    }
+
+    refresh_cookie = False
+
+    def get_pending_submissions(
+        self, task: Task | None
+    ) -> dict[str, dict[str, int]]:
+        """Return the statuses of the pending submissions.
+
+        task: the task to restrict to, or None for all of them.
+
+        return: the statuses, by task name and opaque id.
+
+        """
+        # Only the outcomes are needed to know the status of a pending
+        # result (see SubmissionResult.get_status), and the missing
+        # results are pending too.
+        query = self.sql_session.query(
+            Task.name, Submission.opaque_id,
+            SubmissionResult.compilation_outcome,
+            SubmissionResult.evaluation_outcome) \
+            .join(Submission.task) \
+            .outerjoin(SubmissionResult,
+                       (SubmissionResult.submission_id == Submission.id)
+                       & (SubmissionResult.dataset_id
+                          == Task.active_dataset_id)) \
+            .filter(Submission.participation == self.current_user) \
+            .filter(SubmissionResult.compilation_outcome.is_(None)
+                    | (SubmissionResult.filter_compilation_succeeded()
+                       & ~(SubmissionResult.filter_evaluated()
+                           & SubmissionResult.filter_scored())))
+        if task is not None:
+            query = query.filter(Submission.task == task)
+
+        statuses = {}
+        for task_name, opaque_id, compilation_outcome, evaluation_outcome \
+                in query.all():
+            if compilation_outcome is None:
+                status = SubmissionResult.COMPILING
+            elif evaluation_outcome is None:
+                status = SubmissionResult.EVALUATING
+            else:
+                status = SubmissionResult.SCORING
+            statuses.setdefault(task_name, {})[str(opaque_id)] = status
+        return statuses
+
+    def get_pending_user_tests(
+        self, task: Task | None
+    ) -> dict[str, dict[str, int]]:
+        """Return the statuses of the pending user tests.
+
+        task: the task to restrict to, or None for all of them.
+
+        return: the statuses, by task name and user test num.
+
+        """
+        if not self.r_params["testing_enabled"] \
+                or self.r_params["actual_phase"] != 0:
+            return {}
+
+        # User tests are identified by their position among the ones
+        # on the same task, so we need all of them.
+        query = self.sql_session.query(
+            Task.name,
+            UserTestResult.compilation_outcome,
+            UserTestResult.evaluation_outcome) \
+            .select_from(UserTest) \
+            .join(UserTest.task) \
+            .outerjoin(UserTestResult,
+                       (UserTestResult.user_test_id == UserTest.id)
+                       & (UserTestResult.dataset_id
+                          == Task.active_dataset_id)) \
+            .filter(UserTest.participation == self.current_user) \
+            .order_by(UserTest.timestamp)
+        if task is not None:
+            query = query.filter(UserTest.task == task)
+
+        statuses = {}
+        nums = collections.Counter()
+        for task_name, compilation_outcome, evaluation_outcome \
+                in query.all():
+            nums[task_name] += 1
+            if compilation_outcome is None:
+                status = UserTestResult.COMPILING
+            elif compilation_outcome == "ok" and evaluation_outcome is None:
+                status = UserTestResult.EVALUATING
+            else:
+                continue
+            statuses.setdefault(task_name, {})[str(nums[task_name])] = status
+        return statuses
+
+    @api_login_required
+    @actual_phase_required(0, 1, 2, 3, 4)
+    @multi_contest
+    def get(self, task_name=None):
+        task = None
+        if task_name is not None:
+            task = self.get_task(task_name)
+            if task is None:
+                raise tornado.web.HTTPError(404)
+
+        submissions = self.get_pending_submissions(task)
+        user_tests = self.get_pending_user_tests(task)
+
+        # The payload only depends on the statuses and on the language,
+        # so there is no need to format it if the client has it already.
+        state = json.dumps(
+            [self.translation.identifier, submissions, user_tests],
+            sort_keys=True)
+        self.set_header("Etag",
+                        '"%s"' % hashlib.sha1(state.encode()).hexdigest())
+        # Have the browser revalidate the payload at each poll.
+        self.set_header("Cache-Control", "no-cache")
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        self.write({
+            "submissions": {
+                task_name: {
+                    opaque_id: [status,
+                                self._(self.SUBMISSION_STATUS_TEXT[status])]
+                    for opaque_id, status in by_id.items()}
+                for task_name, by_id in submissions.items()},
+            "user_tests": {
+                task_name: {
+                    num: [status, self._(self.USER_TEST_STATUS_TEXT[status])]
+                    for num, status in by_num.items()}
+                for task_name, by_num in user_tests.items()},
+        })
+
+
 class SubmissionDetailsHandler(ContestHandler):
 
     refresh_cookie = False
@@ -318,8 +506,10 @@ class SubmissionDetailsHandler(ContestHandler):
             is_analysis_mode = self.r_params["actual_phase"] == 3
             if submission.tokened() or is_analysis_mode:
                 raw_details = sr.score_details
+                which_details = "score_details"
             else:
                 raw_details = sr.public_score_details
+                which_details = "public_score_details"
 
             if is_analysis_mode:
                 feedback_level = FEEDBACK_LEVEL_FULL
@@ -327,7 +517,8 @@ class SubmissionDetailsHandler(ContestHandler):
                 feedback_level = task.feedback_level
 
             details = score_type.get_html_details(
-                raw_details, feedback_level, translation=self.translation)
+                raw_details, feedback_level, translation=self.translation,
+                cache_key=(sr.submission_id, sr.dataset_id, which_details))
 
         self.render("submission_details.html", sr=sr, details=details,
                     **self.r_params)
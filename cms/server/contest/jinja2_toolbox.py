@@ -23,12 +23,85 @@ useful specifically to the use that CWS makes of it.
 
 """
 
-from jinja2 import pass_context, PackageLoader
+from collections import OrderedDict
+
+from jinja2 import nodes, pass_context, PackageLoader
+from jinja2.ext import Extension
 
 from cms.server.jinja2_toolbox import GLOBAL_ENVIRONMENT
 from .formatting import format_token_rules, get_score_class
 
 
+def _freeze(value):
+    """Turn lists (also nested) into tuples, to use them in keys."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class FragmentCache:
+    """Least recently used cache of rendered fragments of templates."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._entries: OrderedDict[tuple, str] = OrderedDict()
+
+    def get(self, key: tuple) -> str | None:
+        value = self._entries.get(key)
+        if value is not None:
+            self._entries.move_to_end(key)
+        return value
+
+    def put(self, key: tuple, value: str):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class FragmentCacheExtension(Extension):
+    """Add a {% cache key, ... %}...{% endcache %} tag.
+
+    The body of the tag is rendered once for each distinct key, and
+    then reused. The key is made of the given values together with the
+    position of the tag and the locale of the translation in use, so
+    the body can be localized; everything else the body depends on
+    (including, for example, the data that it shows and the contest
+    that its URLs point into) must be part of the key. Lists in the
+    key are compared by value.
+
+    """
+    tags = {"cache"}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=FragmentCache(size=1000))
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if("comma"):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(("name:endcache",), drop_needle=True)
+        position = nodes.Const("%s:%d" % (parser.name, lineno))
+        return nodes.CallBlock(
+            self.call_method("_render", [nodes.ContextReference(), position,
+                                         nodes.List(args)]),
+            [], [], body).set_lineno(lineno)
+
+    def _render(self, context, position, key, caller):
+        key = (position, context["translation"].identifier) + _freeze(key)
+        cache = self.environment.fragment_cache
+        value = cache.get(key)
+        if value is None:
+            value = caller()
+            cache.put(key, value)
+        return value
+
+
 def extract_token_params(o):
     return {k[6:]: v
             for k, v in o.__dict__.items() if k.startswith("token_")}
@@ -38,22 +111,53 @@ def instrument_cms_toolbox(env):
     env.filters["extract_token_params"] = extract_token_params
 
 
+# Formatted token rules, by parameters, type and locale; there are few
+# distinct ones in a contest.
+_token_rules_cache = FragmentCache(size=1000)
+
+
 @pass_context
 def wrapped_format_token_rules(ctx, tokens, t_type=None):
     translation = ctx["translation"]
-    return format_token_rules(tokens, t_type, translation=translation)
+    key = (tuple(sorted(tokens.items())), t_type, translation.identifier)
+    value = _token_rules_cache.get(key)
+    if value is None:
+        value = format_token_rules(tokens, t_type, translation=translation)
+        _token_rules_cache.put(key, value)
+    return value
+
+
+def overview_key(task):
+    """Return what the row of the task in the overview depends on."""
+    dataset = task.active_dataset
+    return (task.id, task.name, task.title,
+            _freeze(task.submission_format),
+            _freeze(task.get_allowed_languages()), task.token_mode,
+            dataset.id, dataset.time_limit, dataset.memory_limit,
+            dataset.task_type, repr(dataset.task_type_parameters))
+
+
+def statements_key(task):
+    """Return what the statement links of the task depend on."""
+    return (task.id, task.name, _freeze(task.primary_statements),
+            tuple(sorted((language, statement.digest)
+                         for language, statement in task.statements.items())))
 
 
 def instrument_formatting_toolbox(env):
     env.globals["get_score_class"] = get_score_class
 
     env.filters["format_token_rules"] = wrapped_format_token_rules
+    env.filters["overview_key"] = overview_key
+    env.filters["statements_key"] = statements_key
 
 
 CWS_ENVIRONMENT = GLOBAL_ENVIRONMENT.overlay(
     # Load templates from CWS's package (use package rather than file
     # system as that works even in case of a compressed distribution).
-    loader=PackageLoader('cms.server.contest', 'templates'))
+    loader=PackageLoader('cms.server.contest', 'templates'),
+    # Allow caching rarely changing fragments with {% cache %} tags.
+    extensions=[FragmentCacheExtension])
 
 
 instrument_cms_toolbox(CWS_ENVIRONMENT)
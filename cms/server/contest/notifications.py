@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Notifications for contestants that are not stored in the database.
+
+These are things like "Yay, your submission went through.", not things
+like "Your question has been replied", that are handled by the db.
+They are kept in memory by each shard of ContestWebServer and shared
+between them through RPC, so that the contestant receives them from
+whichever shard serves their next request for notifications.
+
+"""
+
+import collections
+import itertools
+import logging
+import typing
+from datetime import datetime
+
+from cms.io import RemoteServiceClient
+from cmscommon.datetime import make_datetime, make_timestamp
+
+
+__all__ = [
+    "Notification", "NotificationStore",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class Notification(typing.NamedTuple):
+    timestamp: datetime
+    subject: str
+    text: str
+    # One of NOTIFICATION_*.
+    level: str
+
+
+class NotificationStore:
+    """The pending notifications, indexed by username.
+
+    A notification added to the store of a shard is forwarded to the
+    stores of all the other shards (see receive); when a shard delivers
+    some notifications to a contestant, it tells the other shards to
+    forget them (see forget). Notifications can thus be delivered
+    twice only if the contestant asks two shards for them at almost
+    the same time.
+
+    """
+
+    # How many delivered notifications to remember, in case a shard is
+    # told to forget a notification before receiving it.
+    FORGOTTEN_SIZE = 10000
+
+    def __init__(self, shard: int, peers: list[RemoteServiceClient]):
+        """Create an empty store.
+
+        shard: the shard of the ContestWebServer owning this store,
+            used to give notifications globally unique ids.
+        peers: the other shards of ContestWebServer.
+
+        """
+        self._shard = shard
+        self._peers = peers
+        self._counter = itertools.count()
+        # For each username, the notifications by id (in order).
+        self._pending: dict[str, dict[str, Notification]] = {}
+        self._forgotten: collections.deque[str] = \
+            collections.deque(maxlen=self.FORGOTTEN_SIZE)
+        self._forgotten_set: set[str] = set()
+
+    def add(
+        self, username: str, timestamp: datetime, subject: str, text: str,
+        level: str
+    ):
+        """Store a new notification to send to a user at the first
+        opportunity (i.e., at the first request for db notifications).
+
+        username: the user to notify.
+        timestamp: the time of the notification.
+        subject: subject of the notification.
+        text: body of the notification.
+        level: one of NOTIFICATION_*.
+
+        """
+        notification_id = "%d.%d" % (self._shard, next(self._counter))
+        notification = Notification(timestamp, subject, text, level)
+        self._pending.setdefault(username, {})[notification_id] = \
+            notification
+        for peer in self._peers:
+            peer.notification_added(
+                notification_id=notification_id, username=username,
+                timestamp=make_timestamp(timestamp), subject=subject,
+                text=text, level=level)
+
+    def pop(self, username: str) -> list[Notification]:
+        """Return and remove the pending notifications of a user.
+
+        username: the user.
+
+        return: the notifications, in the order they were added (to
+            this shard).
+
+        """
+        pending = self._pending.pop(username, {})
+        if len(pending) > 0:
+            for peer in self._peers:
+                peer.notifications_delivered(
+                    username=username, notification_ids=list(pending))
+        return list(pending.values())
+
+    def receive(
+        self, notification_id: str, username: str, timestamp: float,
+        subject: str, text: str, level: str
+    ):
+        """Store a notification added by another shard.
+
+        notification_id: the id given to the notification.
+        username: the user to notify.
+        timestamp: the time of the notification, as a UNIX timestamp.
+        subject: subject of the notification.
+        text: body of the notification.
+        level: one of NOTIFICATION_*.
+
+        """
+        if notification_id in self._forgotten_set:
+            return
+        self._pending.setdefault(username, {})[notification_id] = \
+            Notification(make_datetime(timestamp), subject, text, level)
+
+    def forget(self, username: str, notification_ids: list[str]):
+        """Remove notifications delivered by another shard.
+
+        username: the user the notifications were for.
+        notification_ids: the ids of the notifications.
+
+        """
+        pending = self._pending.get(username, {})
+        for notification_id in notification_ids:
+            if pending.pop(notification_id, None) is None:
+                # Not received yet: remember to ignore it.
+                if len(self._forgotten) == self._forgotten.maxlen:
+                    self._forgotten_set.discard(self._forgotten[0])
+                self._forgotten.append(notification_id)
+                self._forgotten_set.add(notification_id)
+        if len(pending) == 0:
+            self._pending.pop(username, None)
@@ -42,22 +42,24 @@ import logging
 
 from werkzeug.middleware.shared_data import SharedDataMiddleware
 
-from cms import ConfigError, ServiceCoord, config
-from cms.io import WebService
+from cms import ConfigError, ServiceCoord, config, get_service_shards
+from cms.io import WebService, rpc_method
 from cms.locale import get_translations
+from cms.server.contest.authentication import LoginRateLimiter, \
+    LoginTokens, PasswordVerifier
 from cms.server.contest.jinja2_toolbox import CWS_ENVIRONMENT
+from cms.server.file_middleware import SECONDS_IN_A_YEAR
 from cmscommon.binary import hex_to_bin
+from cmscommon.datetime import make_datetime
 from .handlers import HANDLERS
 from .handlers.base import ContestListHandler
 from .handlers.main import MainHandler
+from .notifications import NotificationStore
 
 
 logger = logging.getLogger(__name__)
 
 
-SECONDS_IN_A_YEAR = 365 * 24 * 60 * 60
-
-
 class ContestWebServer(WebService):
     """Service that runs the web server serving the contestants.
 
@@ -108,12 +110,20 @@ class ContestWebServer(WebService):
 
         self.jinja2_environment = CWS_ENVIRONMENT
 
-        # This is a dictionary (indexed by username) of pending
-        # notification. Things like "Yay, your submission went
-        # through.", not things like "Your question has been replied",
-        # that are handled by the db. Each username points to a list
-        # of tuples (timestamp, subject, text, level).
-        self.notifications: dict[str, list[tuple[datetime, str, str, str]]] = {}
+        # The pending notifications, shared with the other shards so
+        # that contestants can be served by any of them.
+        other_shards = [
+            self.connect_to(ServiceCoord("ContestWebServer", i))
+            for i in range(get_service_shards("ContestWebServer"))
+            if i != shard]
+        self.notifications = NotificationStore(shard, other_shards)
+
+        # The login cookies that can be trusted without the database.
+        self.login_tokens = LoginTokens()
+        # Logins verify passwords out of the event loop, and at a
+        # limited rate.
+        self.password_verifier = PasswordVerifier()
+        self.login_rate_limiter = LoginRateLimiter()
 
         # Retrieve the available translations.
         self.translations = get_translations()
@@ -141,6 +151,40 @@ class ContestWebServer(WebService):
         level: one of NOTIFICATION_* (defined above)
 
         """
-        if username not in self.notifications:
-            self.notifications[username] = []
-        self.notifications[username].append((timestamp, subject, text, level))
+        self.notifications.add(username, timestamp, subject, text, level)
+
+    @rpc_method
+    def notification_added(
+        self, notification_id: str, username: str, timestamp: float,
+        subject: str, text: str, level: str
+    ):
+        """Store a notification added by another shard.
+
+        See NotificationStore.receive.
+
+        """
+        self.notifications.receive(notification_id, username, timestamp,
+                                   subject, text, level)
+
+    @rpc_method
+    def notifications_delivered(
+        self, username: str, notification_ids: list[str]
+    ):
+        """Forget notifications delivered by another shard.
+
+        See NotificationStore.forget.
+
+        """
+        self.notifications.forget(username, notification_ids)
+
+    @rpc_method
+    def revoke_login_tokens(self, participation_ids: list[int]):
+        """Stop trusting the login cookies issued so far to some
+        participations, for example because their password changed.
+
+        participation_ids: the ids of the participations.
+
+        """
+        timestamp = make_datetime()
+        for participation_id in participation_ids:
+            self.login_tokens.revoke(participation_id, timestamp)
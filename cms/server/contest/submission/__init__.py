@@ -27,7 +27,8 @@ is irrelevant and duplicates are allowed.
 """
 
 from .check import get_submission_count, check_max_number, \
-    get_latest_submission, check_min_interval, is_last_minutes
+    get_latest_submission, check_min_interval, is_last_minutes, \
+    SubmissionStats, get_submission_stats
 from .file_matching import InvalidFilesOrLanguage, match_files_and_language
 from .file_retrieval import ReceivedFile, InvalidArchive, \
     extract_files_from_archive, extract_files_from_tornado
@@ -40,7 +41,8 @@ from .workflow import UnacceptableSubmission, accept_submission, \
 __all__ = [
     # check.py
     "get_submission_count", "check_max_number", "get_latest_submission",
-    "check_min_interval", "is_last_minutes",
+    "check_min_interval", "is_last_minutes", "SubmissionStats",
+    "get_submission_stats",
     # file_retrieval.py
     "ReceivedFile", "InvalidArchive", "extract_files_from_archive",
     "extract_files_from_tornado",
@@ -34,6 +34,8 @@ exported as they may be of general interest.
 
 """
 from datetime import datetime, timedelta
+import typing
+
 from sqlalchemy import desc, func
 from sqlalchemy.orm import Query
 
@@ -108,6 +110,63 @@ def get_submission_count(
     return q.scalar()
 
 
+class SubmissionStats(typing.NamedTuple):
+    """What the admission checks need to know about past submissions.
+
+    Counts and latest timestamps of the submissions (or user tests) of
+    a participation, on all the tasks of the contest and on one task.
+
+    """
+    contest_count: int
+    contest_latest: datetime | None
+    task_count: int
+    task_latest: datetime | None
+
+
+def get_submission_stats(
+    sql_session: Session,
+    participation: Participation,
+    task: Task,
+    cls: type[Submission | UserTest] = Submission,
+    lock: bool = False,
+) -> SubmissionStats:
+    """Return the data needed by all the admission checks at once.
+
+    This is equivalent to calling get_submission_count and
+    get_latest_submission for the task and for its contest, but it
+    needs a single query.
+
+    sql_session: the SQLAlchemy session to use.
+    participation: the participation to fetch data for.
+    task: the task to fetch data for (the contest is the task's).
+    cls: if the UserTest class is given, look at user tests rather
+        than submissions.
+    lock: if True, first lock the participation's row until the end
+        of the transaction, so that a concurrent request of the same
+        contestant that also locks it waits for this one to commit
+        (and then sees its submission) instead of passing the checks
+        on the same data. The lock does not conflict with the one
+        taken by inserting rows referencing the participation.
+
+    return: the counts and the latest timestamps.
+
+    """
+    if lock:
+        sql_session.query(Participation.id)\
+            .filter(Participation.id == participation.id)\
+            .with_for_update(key_share=True)\
+            .one()
+
+    on_task = cls.task_id == task.id
+    q = sql_session.query(
+        func.count(cls.id),
+        func.max(cls.timestamp),
+        func.count(cls.id).filter(on_task),
+        func.max(cls.timestamp).filter(on_task))
+    q = _filter_submission_query(q, participation, task.contest, None, cls)
+    return SubmissionStats(*q.one())
+
+
 def check_max_number(
     sql_session: Session,
     max_number: int | None,
@@ -115,6 +174,7 @@ def check_max_number(
     contest: Contest | None = None,
     task: Task | None = None,
     cls: type[Submission | UserTest] = Submission,
+    stats: SubmissionStats | None = None,
 ) -> bool:
     """Check whether user already sent in given number of submissions.
 
@@ -131,14 +191,19 @@ def check_max_number(
     task: if given count only on this task (trumps contest).
     cls: if the UserTest class is given, count user tests rather
         than submissions.
+    stats: if given, take the count from here (see
+        get_submission_stats) instead of querying the database.
 
     return: whether the contestant can submit more.
 
     """
     if max_number is None or participation.unrestricted:
         return True
-    count = get_submission_count(
-        sql_session, participation, contest=contest, task=task, cls=cls)
+    if stats is not None:
+        count = stats.task_count if task is not None else stats.contest_count
+    else:
+        count = get_submission_count(
+            sql_session, participation, contest=contest, task=task, cls=cls)
     return count < max_number
 
 
@@ -180,6 +245,7 @@ def check_min_interval(
     contest: Contest | None = None,
     task: Task | None = None,
     cls: type[Submission | UserTest] = Submission,
+    stats: SubmissionStats | None = None,
 ) -> bool:
     """Check whether user sent in latest submission long enough ago.
 
@@ -195,6 +261,8 @@ def check_min_interval(
     task: if given look only at this task (trumps contest).
     cls: if the UserTest class is given, fetch user tests rather
         than submissions.
+    stats: if given, take the latest timestamp from here (see
+        get_submission_stats) instead of querying the database.
 
     return: whether the contestant's "cool down" period has
         expired and they can submit again.
@@ -202,10 +270,14 @@ def check_min_interval(
     """
     if min_interval is None or participation.unrestricted:
         return True
-    submission = get_latest_submission(
-        sql_session, participation, contest=contest, task=task, cls=cls)
-    return (submission is None
-            or timestamp - submission.timestamp >= min_interval)
+    if stats is not None:
+        latest = stats.task_latest if task is not None \
+            else stats.contest_latest
+    else:
+        submission = get_latest_submission(
+            sql_session, participation, contest=contest, task=task, cls=cls)
+        latest = submission.timestamp if submission is not None else None
+    return latest is None or timestamp - latest >= min_interval
 
 
 def is_last_minutes(timestamp: datetime, participation: Participation):
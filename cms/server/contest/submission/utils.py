@@ -30,11 +30,14 @@
 """
 
 from datetime import datetime
+import functools
+import io
 import os.path
 import pickle
 
 from cms import config
 from cms.db import Submission, UserTest
+from cms.db.filecacher import FileCacher
 from cms.db.session import Session
 from cms.db.task import Task
 from cms.db.user import Participation
@@ -111,6 +114,46 @@ def fetch_file_digests_from_previous_submission(
     return digests
 
 
+def store_files(
+    sql_session: Session,
+    file_cacher: FileCacher,
+    files: dict[str, tuple[bytes, str]],
+) -> dict[str, str]:
+    """Store the files sent in for a submission or user test.
+
+    The files up to max_inline_file_length bytes are staged in the
+    given session (see FileCacher.stage_files), so that they are
+    stored in the same transaction as the submission or user test; the
+    larger ones are stored right away, all together (see
+    FileCacher.put_files).
+
+    sql_session: the SQLAlchemy session to use.
+    file_cacher: the file cacher to use to store the files.
+    files: for each codename (filename-with-%l), the content of the
+        file and the description to associate to it.
+
+    return: for each codename, the digest of the file.
+
+    raise (Exception): if storing the files failed.
+
+    """
+    max_length = config.contest_web_server.max_inline_file_length
+    small = [codename for codename, (content, _) in files.items()
+             if len(content) <= max_length]
+    large = [codename for codename in files if codename not in small]
+
+    digests = dict()
+    if len(small) > 0:
+        digests.update(zip(small, file_cacher.stage_files(
+            sql_session, [files[codename] for codename in small])))
+    if len(large) > 0:
+        digests.update(zip(large, file_cacher.put_files(
+            [(functools.partial(io.BytesIO, files[codename][0]),
+              files[codename][1])
+             for codename in large])))
+    return digests
+
+
 class StorageFailed(Exception):
     pass
 
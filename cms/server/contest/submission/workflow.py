@@ -30,6 +30,7 @@
 
 from datetime import datetime
 import logging
+import time
 import typing
 
 if typing.TYPE_CHECKING:
@@ -47,12 +48,15 @@ from cms.db import (
     Session,
 )
 from cms.db.filecacher import FileCacher
+from cms.grading.scoring import invalidate_task_scores
 from cmscommon.datetime import make_timestamp
-from .check import check_max_number, check_min_interval, is_last_minutes
+from cmscommon.tracing import tracer
+from .check import check_max_number, check_min_interval, is_last_minutes, \
+    get_submission_stats
 from .file_matching import InvalidFilesOrLanguage, match_files_and_language
 from .file_retrieval import InvalidArchive, extract_files_from_tornado
 from .utils import fetch_file_digests_from_previous_submission, StorageFailed, \
-    store_local_copy
+    store_files, store_local_copy
 
 
 logger = logging.getLogger(__name__)
@@ -118,14 +122,30 @@ def accept_submission(
         were critical failures in the process.
 
     """
+    start_time = time.monotonic()
     contest = participation.contest
     assert task.contest is contest
 
-    # Check whether the contestant is allowed to submit.
-
-    if not override_max_number:
+    # Check whether the contestant is allowed to submit. The data for
+    # all the checks is fetched at once, if any check is needed.
+
+    check_number = not override_max_number
+    check_interval = not override_min_interval \
+        and not is_last_minutes(timestamp, participation)
+    stats = None
+    if not participation.unrestricted and (
+            (check_number
+             and (contest.max_submission_number is not None
+                  or task.max_submission_number is not None))
+            or (check_interval
+                and (contest.min_submission_interval is not None
+                     or task.min_submission_interval is not None))):
+        stats = get_submission_stats(sql_session, participation, task,
+                                     lock=True)
+
+    if check_number:
         if not check_max_number(sql_session, contest.max_submission_number,
-                                participation, contest=contest):
+                                participation, contest=contest, stats=stats):
             raise UnacceptableSubmission(
                 N_("Too many submissions!"),
                 N_("You have reached the maximum limit of "
@@ -133,16 +153,17 @@ def accept_submission(
                 contest.max_submission_number)
 
         if not check_max_number(sql_session, task.max_submission_number,
-                                participation, task=task):
+                                participation, task=task, stats=stats):
             raise UnacceptableSubmission(
                 N_("Too many submissions!"),
                 N_("You have reached the maximum limit of "
                    "at most %d submissions on this task."),
                 task.max_submission_number)
 
-    if not override_min_interval and not is_last_minutes(timestamp, participation):
+    if check_interval:
         if not check_min_interval(sql_session, contest.min_submission_interval,
-                                  timestamp, participation, contest=contest):
+                                  timestamp, participation, contest=contest,
+                                  stats=stats):
             raise UnacceptableSubmission(
                 N_("Submissions too frequent!"),
                 N_("Among all tasks, you can submit again "
@@ -150,7 +171,8 @@ def accept_submission(
                 contest.min_submission_interval.total_seconds())
 
         if not check_min_interval(sql_session, task.min_submission_interval,
-                                  timestamp, participation, task=task):
+                                  timestamp, participation, task=task,
+                                  stats=stats):
             raise UnacceptableSubmission(
                 N_("Submissions too frequent!"),
                 N_("For this task, you can submit again "
@@ -243,15 +265,15 @@ def accept_submission(
         except StorageFailed:
             logger.error("Submission local copy failed.", exc_info=True)
 
-    # We now have to send all the files to the destination...
+    # We now have to send all the files to the destination (small
+    # files are written in the transaction of the submission).
     try:
-        for codename, content in files.items():
-            digest = file_cacher.put_file_content(
-                content,
-                "Submission file %s sent by %s at %d." % (
-                    codename, participation.user.username,
-                    make_timestamp(timestamp)))
-            digests[codename] = digest
+        digests.update(store_files(sql_session, file_cacher, {
+            codename: (content,
+                       "Submission file %s sent by %s at %d." % (
+                           codename, participation.user.username,
+                           make_timestamp(timestamp)))
+            for codename, content in files.items()}))
 
     # In case of error, the server aborts the submission
     except Exception as error:
@@ -282,6 +304,11 @@ def accept_submission(
         sql_session.add(File(
             filename=codename, digest=digest, submission=submission))
 
+    # The stored task score does not account for the new submission.
+    invalidate_task_scores(sql_session, participation.id, task.id)
+
+    tracer.record("accept_submission", time.monotonic() - start_time,
+                  participation_id=participation.id, task_id=task.id)
     return submission
 
 
@@ -335,6 +362,7 @@ def accept_user_test(
         were critical failures in the process.
 
     """
+    start_time = time.monotonic()
     contest = participation.contest
     assert task.contest is contest
 
@@ -344,10 +372,21 @@ def accept_user_test(
     if not task_type.testable:
         raise TestingNotAllowed()
 
-    # Check whether the contestant is allowed to send a test.
+    # Check whether the contestant is allowed to send a test. The data
+    # for all the checks is fetched at once, if any check is needed.
+
+    stats = None
+    if not participation.unrestricted and (
+            contest.max_user_test_number is not None
+            or task.max_user_test_number is not None
+            or contest.min_user_test_interval is not None
+            or task.min_user_test_interval is not None):
+        stats = get_submission_stats(sql_session, participation, task,
+                                     cls=UserTest, lock=True)
 
     if not check_max_number(sql_session, contest.max_user_test_number,
-                            participation, contest=contest, cls=UserTest):
+                            participation, contest=contest, cls=UserTest,
+                            stats=stats):
         raise UnacceptableUserTest(
             N_("Too many tests!"),
             N_("You have reached the maximum limit of "
@@ -355,7 +394,8 @@ def accept_user_test(
             contest.max_user_test_number)
 
     if not check_max_number(sql_session, task.max_user_test_number,
-                            participation, task=task, cls=UserTest):
+                            participation, task=task, cls=UserTest,
+                            stats=stats):
         raise UnacceptableUserTest(
             N_("Too many tests!"),
             N_("You have reached the maximum limit of "
@@ -364,7 +404,7 @@ def accept_user_test(
 
     if not check_min_interval(sql_session, contest.min_user_test_interval,
                               timestamp, participation, contest=contest,
-                              cls=UserTest):
+                              cls=UserTest, stats=stats):
         raise UnacceptableUserTest(
             N_("Tests too frequent!"),
             N_("Among all tasks, you can test again "
@@ -373,7 +413,7 @@ def accept_user_test(
 
     if not check_min_interval(sql_session, task.min_user_test_interval,
                               timestamp, participation, task=task,
-                              cls=UserTest):
+                              cls=UserTest, stats=stats):
         raise UnacceptableUserTest(
             N_("Tests too frequent!"),
             N_("For this task, you can test again "
@@ -463,15 +503,15 @@ def accept_user_test(
         except StorageFailed:
             logger.error("Test local copy failed.", exc_info=True)
 
-    # We now have to send all the files to the destination...
+    # We now have to send all the files to the destination (small
+    # files are written in the transaction of the user test).
     try:
-        for codename, content in files.items():
-            digest = file_cacher.put_file_content(
-                content,
-                "Test file %s sent by %s at %d." % (
-                    codename, participation.user.username,
-                    make_timestamp(timestamp)))
-            digests[codename] = digest
+        digests.update(store_files(sql_session, file_cacher, {
+            codename: (content,
+                       "Test file %s sent by %s at %d." % (
+                           codename, participation.user.username,
+                           make_timestamp(timestamp)))
+            for codename, content in files.items()}))
 
     # In case of error, the server aborts the submission
     except Exception as error:
@@ -507,4 +547,6 @@ def accept_user_test(
             sql_session.add(UserTestManager(
                 filename=filename, digest=digest, user_test=user_test))
 
+    tracer.record("accept_user_test", time.monotonic() - start_time,
+                  participation_id=participation.id, task_id=task.id)
     return user_test
@@ -34,6 +34,7 @@ from cms.db import Token, Submission
 from cms.db.session import Session
 from cms.db.task import Task
 from cms.db.user import Participation
+from cms.grading.scoring import update_task_score
 
 
 __all__ = [
@@ -380,4 +381,7 @@ def accept_token(
     token = Token(timestamp, submission=submission)
     sql_session.add(token)
 
+    # The token can change the tokened score right away.
+    update_task_score(sql_session, submission.participation, submission.task)
+
     return token
@@ -17,7 +17,12 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import io
+import os
+import typing
 from collections.abc import Callable
+
+from gevent.socket import wait_write
 from werkzeug.exceptions import HTTPException, NotFound, ServiceUnavailable
 from werkzeug.wrappers import Response, Request
 from werkzeug.wsgi import responder, wrap_file
@@ -25,6 +30,82 @@ from werkzeug.wsgi import responder, wrap_file
 from cms.db.filecacher import FileCacher, TombstoneError
 
 
+SECONDS_IN_A_YEAR = 365 * 24 * 60 * 60
+
+
+class FileWrapper:
+    """Iterable over the content of a file, which can also be sent
+    with sendfile.
+
+    This is our wsgi.file_wrapper (see PEP 3333): if the application
+    returns an instance of this class unwrapped, the web server sends
+    the file directly from the kernel; otherwise (e.g., for range
+    requests) it is just read and iterated over.
+
+    """
+
+    def __init__(self, fobj: typing.IO[bytes],
+                 buffer_size: int = io.DEFAULT_BUFFER_SIZE):
+        self.fobj = fobj
+        self.buffer_size = buffer_size
+
+    def __iter__(self) -> typing.Self:
+        return self
+
+    def __next__(self) -> bytes:
+        data = self.fobj.read(self.buffer_size)
+        if len(data) == 0:
+            raise StopIteration()
+        return data
+
+    # Used by werkzeug to serve ranges.
+    def seekable(self) -> bool:
+        return self.fobj.seekable()
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        return self.fobj.seek(offset, whence)
+
+    def tell(self) -> int:
+        return self.fobj.tell()
+
+    def close(self):
+        self.fobj.close()
+
+    def fileno(self) -> int | None:
+        """Return the file descriptor of the file, if it has one."""
+        try:
+            return self.fobj.fileno()
+        except (AttributeError, OSError):
+            return None
+
+    def sendfile(self, sock) -> int:
+        """Send the rest of the file on the given socket.
+
+        sock: a (gevent) socket.
+
+        return: the number of bytes sent.
+
+        """
+        fd = self.fileno()
+        assert fd is not None
+        offset = self.fobj.tell()
+        remaining = os.fstat(fd).st_size - offset
+        sent = 0
+        while remaining > 0:
+            try:
+                count = os.sendfile(sock.fileno(), fd, offset, remaining)
+            except BlockingIOError:
+                wait_write(sock.fileno(), timeout=sock.gettimeout())
+                continue
+            if count == 0:
+                break
+            offset += count
+            remaining -= count
+            sent += count
+        self.fobj.seek(offset)
+        return sent
+
+
 class FileServerMiddleware:
     """Intercept requests wanting to serve files and serve those files.
 
@@ -47,6 +128,7 @@ class FileServerMiddleware:
     DIGEST_HEADER = "X-CMS-File-Digest"
     FILENAME_HEADER = "X-CMS-File-Filename"
     DISPOSITION_HEADER = "X-CMS-File-Disposition"
+    IMMUTABLE_HEADER = "X-CMS-File-Immutable"
 
     def __init__(self, file_cacher: FileCacher, app: Callable):
         """Create an instance.
@@ -86,11 +168,17 @@ class FileServerMiddleware:
         digest = original_response.headers.pop(self.DIGEST_HEADER)
         filename = original_response.headers.pop(self.FILENAME_HEADER, None)
         disposition = original_response.headers.pop(self.DISPOSITION_HEADER, "attachment")
+        immutable = original_response.headers.pop(
+            self.IMMUTABLE_HEADER, None) is not None
         mimetype = original_response.mimetype
 
         try:
             fobj = self.file_cacher.get_file(digest)
-            size = self.file_cacher.get_size(digest)
+            try:
+                # The file usually comes from the local cache.
+                size = os.fstat(fobj.fileno()).st_size
+            except (AttributeError, OSError):
+                size = self.file_cacher.get_size(digest)
         except KeyError:
             return NotFound()
         except TombstoneError:
@@ -106,8 +194,15 @@ class FileServerMiddleware:
             response.headers.add(
                 "Content-Disposition", disposition, filename=filename)
         response.set_etag(digest)
-        response.cache_control.no_cache = True
+        if immutable:
+            # The URL identifies this very content.
+            response.cache_control.max_age = SECONDS_IN_A_YEAR
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
         response.cache_control.private = True
+        response.content_length = size
+        response.accept_ranges = "bytes"
         response.response = \
             wrap_file(environ, fobj, buffer_size=FileCacher.CHUNK_SIZE)
         response.direct_passthrough = True
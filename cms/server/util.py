@@ -75,7 +75,8 @@ class FileHandlerMixin(RequestHandler):
 
     """
 
-    def fetch(self, digest: str, content_type: str, filename: str | None = None, disposition: str | None = None):
+    def fetch(self, digest: str, content_type: str, filename: str | None = None, disposition: str | None = None,
+              immutable: bool = False):
         """Serve the file with the given digest.
 
         This will just add the headers required to trigger
@@ -85,6 +86,9 @@ class FileHandlerMixin(RequestHandler):
         content_type: the MIME type the file should be served as.
         filename: the name the file should be served as.
         disposition: value to set the Content-Disposition header to.
+        immutable: whether the URL of the request identifies this
+            exact content (e.g., because it contains the digest), so
+            that the client can cache it without revalidating.
 
         """
         self.set_header(FileServerMiddleware.DIGEST_HEADER, digest)
@@ -92,6 +96,8 @@ class FileHandlerMixin(RequestHandler):
             self.set_header(FileServerMiddleware.FILENAME_HEADER, filename)
         if disposition is not None:
             self.set_header(FileServerMiddleware.DISPOSITION_HEADER, disposition)
+        if immutable:
+            self.set_header(FileServerMiddleware.IMMUTABLE_HEADER, "1")
         self.set_header("Content-Type", content_type)
         self.finish()
 
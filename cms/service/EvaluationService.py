@@ -30,10 +30,13 @@ the current ranking.
 
 """
 
+import heapq
 import logging
-from collections import defaultdict
+import time
+from collections import Counter, defaultdict
 from datetime import datetime, timedelta
 from functools import wraps
+from typing import TypedDict
 
 import gevent.lock
 from sqlalchemy import func
@@ -42,11 +45,13 @@ from sqlalchemy.exc import IntegrityError
 from cms import ServiceCoord, get_service_shards
 from cms.db.session import Session
 from cms.io.priorityqueue import QueueEntry, QueueEntryDict, QueueItem
-from cmscommon.datetime import make_timestamp
+from cmscommon.datetime import make_datetime, make_timestamp
+from cmscommon.tracing import tracer
 from cms.db import SessionGen, Digest, Dataset, Evaluation, Submission, \
     SubmissionResult, Testcase, UserTest, UserTestResult, get_submissions, \
     get_submission_results, get_datasets_to_judge
 from cms.grading.Job import Job, JobGroup
+from cms.grading.scoring import invalidate_task_scores
 from cms.io import Executor, TriggeredService, rpc_method
 from .esoperations import ESOperation, get_relevant_operations, \
     get_submissions_operations, get_user_tests_operations, \
@@ -59,6 +64,26 @@ from .workerpool import WorkerPool
 logger = logging.getLogger(__name__)
 
 
+class QueueSummaryDict(TypedDict):
+    """Aggregated status of the queue, for sending over RPC."""
+
+    # Number of operations in the queue.
+    operations: int
+    # Number of entries of the cumulative status (roughly, one for
+    # each submission or user test to process).
+    entries: int
+    # Number of operations by type, by priority and by dataset id.
+    by_type: dict[str, int]
+    by_priority: dict[str, int]
+    by_dataset: dict[str, int]
+    # Timestamp of the entry that has been waiting for the longest time
+    # (regardless of its priority), if any.
+    oldest_timestamp: float | None
+    # The requested page of the cumulative entries, ordered by priority
+    # and timestamp.
+    oldest: list[QueueEntryDict]
+
+
 class EvaluationExecutor(Executor[ESOperation]):
 
     # Real maximum number of operations to be sent to a worker.
@@ -89,6 +114,17 @@ class EvaluationExecutor(Executor[ESOperation]):
         # the testcase codename) and keeps track of multiplicity.
         self.queue_status_cumulative: dict[tuple, QueueEntryDict] = dict()
 
+        # Number of operations in the queue, by type, by priority and
+        # by dataset id, updated together with queue_status_cumulative
+        # so that summaries don't need to look at the whole queue.
+        self._count_by_type: Counter[str] = Counter()
+        self._count_by_priority: Counter[int] = Counter()
+        self._count_by_dataset: Counter[int] = Counter()
+
+        # The moment (in monotonic time) in which each operation in the
+        # queue was enqueued, to measure how long it waited there.
+        self._enqueue_time: dict[ESOperation, float] = dict()
+
         for i in range(get_service_shards("Worker")):
             worker = ServiceCoord("Worker", i)
             self.pool.add_worker(worker)
@@ -169,6 +205,8 @@ class EvaluationExecutor(Executor[ESOperation]):
                     "timestamp": make_timestamp(timestamp),
                 }
                 self.queue_status_cumulative[key] = entry
+            self._update_counts(item, priority, 1)
+            self._enqueue_time[item] = time.monotonic()
         return success
 
     def dequeue(self, operation: ESOperation):
@@ -181,6 +219,7 @@ class EvaluationExecutor(Executor[ESOperation]):
         try:
             queue_entry = super().dequeue(operation)
             self._remove_from_cumulative_status(queue_entry)
+            self._enqueue_time.pop(operation, None)
         except KeyError:
             with self._current_execution_lock:
                 for i in range(len(self._currently_executing)):
@@ -192,6 +231,13 @@ class EvaluationExecutor(Executor[ESOperation]):
     def _pop(self, wait=False):
         queue_entry = super()._pop(wait=wait)
         self._remove_from_cumulative_status(queue_entry)
+        enqueue_time = self._enqueue_time.pop(queue_entry.item, None)
+        if enqueue_time is not None:
+            operation = queue_entry.item
+            tracer.record("queue", time.monotonic() - enqueue_time,
+                          type=operation.type_,
+                          object_id=operation.object_id,
+                          dataset_id=operation.dataset_id)
         return queue_entry
 
     def _remove_from_cumulative_status(self, queue_entry: QueueEntry[ESOperation]):
@@ -200,6 +246,42 @@ class EvaluationExecutor(Executor[ESOperation]):
         self.queue_status_cumulative[key]["item"]["multiplicity"] -= 1
         if self.queue_status_cumulative[key]["item"]["multiplicity"] == 0:
             del self.queue_status_cumulative[key]
+        self._update_counts(queue_entry.item, queue_entry.priority, -1)
+
+    def _update_counts(self, item: ESOperation, priority: int, delta: int):
+        for counter, key in ((self._count_by_type, item.type_),
+                             (self._count_by_priority, priority),
+                             (self._count_by_dataset, item.dataset_id)):
+            counter[key] += delta
+            if counter[key] == 0:
+                del counter[key]
+
+    def queue_summary(self, limit: int, offset: int) -> QueueSummaryDict:
+        """Return aggregated information on the queue.
+
+        limit: the maximum number of cumulative entries to return.
+        offset: the number of cumulative entries to skip, in the order
+            in which they will be executed.
+
+        return: the summary of the queue, see QueueSummaryDict.
+
+        """
+        entries = self.queue_status_cumulative.values()
+        page = heapq.nsmallest(
+            offset + limit, entries,
+            key=lambda x: (x["priority"], x["timestamp"]))[offset:]
+        return {
+            "operations": self._count_by_type.total(),
+            "entries": len(self.queue_status_cumulative),
+            "by_type": dict(self._count_by_type),
+            "by_priority": {str(priority): count for priority, count
+                            in self._count_by_priority.items()},
+            "by_dataset": {str(dataset_id): count for dataset_id, count
+                           in self._count_by_dataset.items()},
+            "oldest_timestamp": min((x["timestamp"] for x in entries),
+                                    default=None),
+            "oldest": page,
+        }
 
 
 def with_post_finish_lock(func):
@@ -497,6 +579,7 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
 
         """
         logger.info("Starting commit process...")
+        start_time = time.monotonic()
 
         # Reorganize the results by submission/usertest result and
         # operation type (i.e., group together the testcase
@@ -581,6 +664,8 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
                         (object_id, dataset_id), session)
                     self.user_test_evaluation_ended(user_test_result)
 
+        tracer.record("write_results", time.monotonic() - start_time,
+                      results=len(items))
         logger.info("Done")
 
     def write_results_one_object_and_type(
@@ -857,6 +942,10 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
                 return
 
             self.submission_enqueue_operations(submission)
+            tracer.record(
+                "enqueue",
+                (make_datetime() - submission.timestamp).total_seconds(),
+                submission_id=submission_id)
 
             session.commit()
 
@@ -987,6 +1076,7 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
             ).all()
             logger.info("Submission results to invalidate %s for: %d.",
                         level, len(submission_results))
+            stale_task_scores = set()
             for submission_result in submission_results:
                 # We invalidate the appropriate data and queue the
                 # operations to recompute those data.
@@ -994,6 +1084,17 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
                     submission_result.invalidate_compilation()
                 elif level == "evaluation":
                     submission_result.invalidate_evaluation(testcase_id=testcase_id)
+                submission = submission_result.submission
+                if submission_result.dataset_id \
+                        == submission.task.active_dataset_id:
+                    stale_task_scores.add((submission.participation_id,
+                                           submission.task_id))
+
+            # The scores of the participations on the tasks are not
+            # final anymore: ScoringService recomputes them once the
+            # results are scored again.
+            for participation_id, task_id in stale_task_scores:
+                invalidate_task_scores(session, participation_id, task_id)
 
             # Finally, we re-enqueue the operations for the
             # submissions.
@@ -1067,3 +1168,29 @@ class EvaluationService(TriggeredService[ESOperation, EvaluationExecutor]):
         return sorted(
             self.get_executor().queue_status_cumulative.values(),
             key=lambda x: (x["priority"], x["timestamp"]))
+
+    @rpc_method
+    def queue_summary(self, limit: int = 50,
+                      offset: int = 0) -> QueueSummaryDict:
+        """Return aggregated information on the queue.
+
+        Unlike queue_status, this neither sorts nor sends the whole
+        queue: it scans the entries of the cumulative status,
+        keeping only the first limit + offset, and returns
+        aggregated counts (kept up to date as the queue changes) and
+        that page. Its cost is still linear in the number of entries,
+        but much smaller than queue_status's with a very large queue,
+        e.g., after a rejudge.
+
+        limit: the maximum number of entries of the cumulative status
+            (see queue_status) to return.
+        offset: how many of these entries to skip, to fetch the
+            following pages.
+
+        return: the number of operations in the queue, in total and by
+            type, priority and dataset, and the requested page of the
+            entries of the cumulative status, in the same order as
+            queue_status.
+
+        """
+        return self.get_executor().queue_summary(limit, offset)
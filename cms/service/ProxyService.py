@@ -31,6 +31,7 @@
 import json
 import logging
 import string
+import time
 from urllib.parse import urljoin, urlsplit
 
 import gevent
@@ -45,6 +46,7 @@ from cms.db import SessionGen, Contest, Participation, Task, Submission, \
 from cms.io import Executor, QueueItem, TriggeredService, rpc_method
 from cms.io.priorityqueue import QueueEntry
 from cmscommon.datetime import make_timestamp
+from cmscommon.tracing import tracer
 
 
 logger = logging.getLogger(__name__)
@@ -207,6 +209,7 @@ class ProxyExecutor(Executor[ProxyOperation]):
         for entry in entries:
             data[entry.item.type_].update(entry.item.data)
 
+        start_time = time.monotonic()
         try:
             for i in range(self.TYPE_COUNT):
                 # Send entities of type i.
@@ -222,6 +225,10 @@ class ProxyExecutor(Executor[ProxyOperation]):
                         self._ranking, "%s/" % name, data[i], operation)
                     data[i].clear()
 
+            tracer.record("send", time.monotonic() - start_time,
+                          ranking=self._visible_ranking,
+                          operations=len(entries))
+
         except CannotSendError:
             # A log message has already been produced.
             gevent.sleep(self.FAILURE_WAIT)
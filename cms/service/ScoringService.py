@@ -26,12 +26,16 @@
 """
 
 import logging
+import time
 
 from cms import ServiceCoord, config
-from cms.db import SessionGen, Submission, Dataset, get_submission_results
+from cms.db import SessionGen, Submission, Dataset, Participation, Task, \
+    get_submission_results
+from cms.grading.scoring import invalidate_task_scores, update_task_score
 from cms.io import Executor, TriggeredService, rpc_method
 from cms.io.priorityqueue import QueueEntry
 from cmscommon.datetime import make_datetime
+from cmscommon.tracing import tracer
 from .scoringoperations import ScoringOperation, get_operations
 
 
@@ -39,11 +43,53 @@ logger = logging.getLogger(__name__)
 
 
 class ScoringExecutor(Executor[ScoringOperation]):
+
+    # Maximum number of results scored before updating the scores of
+    # the participations on their tasks.
+    MAX_OPERATIONS_PER_BATCH = 100
+
     def __init__(self, proxy_service):
-        super().__init__()
+        super().__init__(batch_executions=True)
         self.proxy_service = proxy_service
 
-    def execute(self, entry: QueueEntry[ScoringOperation]):
+    def max_operations_per_batch(self) -> int:
+        """See Executor.max_operations_per_batch()."""
+        return ScoringExecutor.MAX_OPERATIONS_PER_BATCH
+
+    def execute(self, entries: list[QueueEntry[ScoringOperation]]):
+        """Assign a score to some submission results.
+
+        Each result is scored in a transaction of its own; then the
+        score of each participation on each task involved is computed
+        once for the whole batch, as computing it needs all the
+        submissions of the participation on the task (so that, e.g.,
+        rescoring a dataset does not recompute it after each of them).
+
+        entries: entries containing the operations to perform.
+
+        """
+        stale_task_scores = set()
+        for entry in entries:
+            try:
+                task_score_key = self._score(entry)
+            except Exception:
+                logger.error("Unexpected error when scoring `%s'.",
+                             entry.item, exc_info=True)
+                continue
+            if task_score_key is not None:
+                stale_task_scores.add(task_score_key)
+
+        for participation_id, task_id in stale_task_scores:
+            try:
+                self._update_task_score(participation_id, task_id)
+            except Exception:
+                logger.error("Unexpected error when updating the score of "
+                             "participation %d on task %d.",
+                             participation_id, task_id, exc_info=True)
+
+    def _score(
+        self, entry: QueueEntry[ScoringOperation]
+    ) -> tuple[int, int] | None:
         """Assign a score to a submission result.
 
         This is the core of ScoringService: here we retrieve the result
@@ -53,8 +99,12 @@ class ScoringExecutor(Executor[ScoringOperation]):
 
         entry: entry containing the operation to perform.
 
+        return: the participation and task ids whose score needs to be
+            updated, if the result is on the active dataset.
+
         """
         operation = entry.item
+        start_time = time.monotonic()
         with SessionGen() as session:
             # Obtain submission.
             submission = Submission.get_from_id(operation.submission_id,
@@ -83,7 +133,7 @@ class ScoringExecutor(Executor[ScoringOperation]):
                 if submission_result.scored():
                     logger.info("Submission result %d(%d) is already scored.",
                                 operation.submission_id, operation.dataset_id)
-                    return
+                    return None
                 else:
                     raise ValueError("The state of the submission result "
                                      "%d(%d) doesn't allow scoring." %
@@ -104,16 +154,50 @@ class ScoringExecutor(Executor[ScoringOperation]):
             if submission_result.scored_at is None:
                 submission_result.scored_at = make_datetime()
 
+            # Drop the materialized task score in the same transaction,
+            # so that readers never see the result scored but the task
+            # score not updated: they compute it themselves until
+            # execute() stores it again.
+            active = dataset is submission.task.active_dataset
+            if active:
+                invalidate_task_scores(session, submission.participation_id,
+                                       submission.task_id)
+
             # Store it.
             session.commit()
+            tracer.record("scoring", time.monotonic() - start_time,
+                          submission_id=operation.submission_id,
+                          dataset_id=operation.dataset_id)
 
             # If dataset is the active one, update RWS.
-            if dataset is submission.task.active_dataset:
-                logger.info(
-                    "Submission scored %.1f seconds after submission",
-                    (make_datetime() - submission.timestamp).total_seconds())
-                self.proxy_service.submission_scored(
-                    submission_id=submission.id)
+            if not active:
+                return None
+            latency = \
+                (make_datetime() - submission.timestamp).total_seconds()
+            logger.info(
+                "Submission scored %.1f seconds after submission",
+                latency)
+            tracer.record("end_to_end", latency,
+                          submission_id=operation.submission_id)
+            self.proxy_service.submission_scored(
+                submission_id=submission.id)
+            return submission.participation_id, submission.task_id
+
+    def _update_task_score(self, participation_id: int, task_id: int):
+        """Compute and store the score of a participation on a task.
+
+        participation_id: the id of the participation.
+        task_id: the id of the task.
+
+        """
+        with SessionGen() as session:
+            participation = Participation.get_from_id(participation_id,
+                                                      session)
+            task = Task.get_from_id(task_id, session)
+            if participation is None or task is None:
+                return
+            update_task_score(session, participation, task)
+            session.commit()
 
 
 class ScoringService(TriggeredService[ScoringOperation, ScoringExecutor]):
@@ -217,9 +301,12 @@ class ScoringService(TriggeredService[ScoringOperation, ScoringExecutor]):
                                        participation_id, task_id,
                                        submission_id, dataset_id).all()
 
+            stale_task_scores = set()
             for sr in submission_results:
                 if sr.scored():
                     sr.invalidate_score()
+                    stale_task_scores.add((sr.submission.participation_id,
+                                           sr.submission.task_id))
                     # We also save the timestamp of the submission, to
                     # rescore them in order (for fairness, not for a
                     # specific need).
@@ -227,6 +314,9 @@ class ScoringService(TriggeredService[ScoringOperation, ScoringExecutor]):
                         ScoringOperation(sr.submission_id, sr.dataset_id),
                         sr.submission.timestamp))
 
+            for participation_id, task_id in stale_task_scores:
+                invalidate_task_scores(session, participation_id, task_id)
+
             session.commit()
 
         for item, timestamp in temp_queue:
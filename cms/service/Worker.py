@@ -30,12 +30,14 @@ import time
 
 import gevent.lock
 
+from cms import config
 from cms.db import SessionGen, Contest, enumerate_files
 from cms.db.filecacher import FileCacher, TombstoneError
 from cms.grading import JobException
 from cms.grading.Job import CompilationJob, EvaluationJob, JobGroup
 from cms.grading.tasktypes import get_task_type
 from cms.io import Service, rpc_method
+from cmscommon.tracing import tracer
 
 
 logger = logging.getLogger(__name__)
@@ -62,6 +64,8 @@ class Worker(Service):
         self._total_busy_time = 0
         self._number_execution = 0
 
+        if fake_worker_time is None:
+            fake_worker_time = config.worker.fake_worker_time
         self._fake_worker_time = fake_worker_time
 
     @rpc_method
@@ -123,16 +127,17 @@ class Worker(Service):
 
                     job.shard = self.shard
 
-                    if self._fake_worker_time is None:
-                        task_type = get_task_type(job.task_type,
-                                                  job.task_type_parameters)
-                        try:
-                            task_type.execute_job(job, self.file_cacher)
-                        except TombstoneError:
-                            job.success = False
-                            job.plus = {"tombstone": True}
-                    else:
-                        self._fake_work(job)
+                    with tracer.time_stage("job", operation=job.info):
+                        if self._fake_worker_time is None:
+                            task_type = get_task_type(
+                                job.task_type, job.task_type_parameters)
+                            try:
+                                task_type.execute_job(job, self.file_cacher)
+                            except TombstoneError:
+                                job.success = False
+                                job.plus = {"tombstone": True}
+                        else:
+                            self._fake_work(job)
 
                     logger.info("Finished job.",
                                 extra={"operation": job.info})
@@ -27,6 +27,7 @@
 
 import logging
 import random
+import time
 from datetime import datetime, timedelta
 import typing
 
@@ -37,6 +38,7 @@ from cms.conf import ServiceCoord
 from cms.db import SessionGen
 from cms.grading.Job import JobGroup
 from cmscommon.datetime import make_datetime, make_timestamp
+from cmscommon.tracing import tracer
 from cms.service.esoperations import ESOperation
 
 if typing.TYPE_CHECKING:
@@ -203,6 +205,8 @@ class WorkerPool:
             self._workers_available_event.clear()
             return None
 
+        start_time = time.monotonic()
+
         # Then we fill the info for future memory.
         self._add_operations(shard, operations)
 
@@ -220,6 +224,8 @@ class WorkerPool:
             job_group_dict=job_group_dict,
             callback=self._service.action_finished,
             plus=shard)
+        tracer.record("dispatch", time.monotonic() - start_time,
+                      shard=shard, operations=len(operations))
         return shard
 
     def release_worker(self, shard: int) -> bool | list[ESOperation]:
@@ -250,6 +256,11 @@ class WorkerPool:
         with self._operation_lock:
             to_ignore = self._operations_to_ignore[shard]
             self._operations_to_ignore[shard] = []
+        if self._start_time[shard] is not None:
+            tracer.record(
+                "worker",
+                (make_datetime() - self._start_time[shard]).total_seconds(),
+                shard=shard)
         self._start_time[shard] = None
         self._ignore[shard] = False
         if self._schedule_disabling[shard]:
@@ -16,8 +16,11 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import functools
+import io
 import logging
 import re
+import threading
 import typing
 import zipfile
 
@@ -29,6 +32,58 @@ from sqlalchemy.orm import Session
 logger = logging.getLogger(__name__)
 
 
+class _ZipMembers:
+    """Open the members of a zip archive from many threads at once.
+
+    A ZipFile cannot be read by several threads at the same time, so
+    each thread (or greenlet, if threading is monkey-patched) opens
+    the archive on its own, the first time it needs a member.
+
+    """
+
+    def __init__(self, archive: str | typing.BinaryIO):
+        """Initialize.
+
+        archive: the path of the zip file, or a file-like object
+            containing it (which is read in memory, as its position
+            cannot be shared).
+
+        """
+        if isinstance(archive, str):
+            self._path = archive
+            self._data = None
+        else:
+            self._path = None
+            archive.seek(0)
+            self._data = archive.read()
+        self._local = threading.local()
+        self._zfps: list[zipfile.ZipFile] = []
+
+    def open(self, name: str) -> typing.IO[bytes]:
+        """Open a member of the archive for the current thread.
+
+        name: the name of the member.
+
+        return: a readable file-like object.
+
+        """
+        zfp = getattr(self._local, "zfp", None)
+        if zfp is None:
+            if self._path is not None:
+                zfp = zipfile.ZipFile(self._path, "r")
+            else:
+                zfp = zipfile.ZipFile(io.BytesIO(self._data), "r")
+            self._local.zfp = zfp
+            self._zfps.append(zfp)
+        return zfp.open(name)
+
+    def close(self):
+        """Close the archives opened by all threads."""
+        for zfp in self._zfps:
+            zfp.close()
+        self._zfps.clear()
+
+
 def import_testcases_from_zipfile(
     session: Session,
     file_cacher: FileCacher,
@@ -79,6 +134,7 @@ def import_testcases_from_zipfile(
             skipped_tc = []
             overwritten_tc = []
             added_tc = []
+            to_add = []
             for codename, testdata in tests.items():
                 # If input or output file isn't found, skip it.
                 if not testdata[0] or not testdata[1]:
@@ -86,44 +142,53 @@ def import_testcases_from_zipfile(
 
                 # Check, whether current testcase already exists.
                 if codename in dataset.testcases:
-                    # If we are allowed, remove existing testcase.
+                    # If we are allowed, replace the existing testcase.
                     # If not - skip this testcase.
                     if overwrite:
-                        testcase = dataset.testcases[codename]
-                        session.delete(testcase)
-                        try:
-                            session.commit()
-                        except Exception:
-                            skipped_tc.append(codename)
-                            continue
                         overwritten_tc.append(codename)
                     else:
                         skipped_tc.append(codename)
                         continue
-
-                # Add current testcase.
-                try:
-                    input_ = archive_zfp.read(testdata[0])
-                    output = archive_zfp.read(testdata[1])
-                except Exception:
-                    raise Exception("Reading testcase %s failed" % codename)
-                try:
-                    input_digest = file_cacher.put_file_content(
-                        input_, "Testcase input for task %s" % task_name)
-                    output_digest = file_cacher.put_file_content(
-                        output, "Testcase output for task %s" % task_name)
-                except Exception:
-                    raise Exception("Testcase storage failed")
-
-                testcase = Testcase(codename, public, input_digest,
-                                    output_digest, dataset=dataset)
-                session.add(testcase)
-                try:
-                    session.commit()
-                except Exception:
-                    raise Exception("Couldn't add test %s" % codename)
-                if codename not in overwritten_tc:
+                else:
                     added_tc.append(codename)
+
+                to_add.append(codename)
+
+            # Store the files of all the testcases to add at once,
+            # before touching the dataset, so that it is left as it
+            # was if this fails. The files are read by many threads,
+            # each needs its own handle on the archive.
+            members = _ZipMembers(archive)
+            files = []
+            for codename in to_add:
+                input_name, output_name = tests[codename]
+                files += [
+                    (functools.partial(members.open, input_name),
+                     "Testcase input for task %s" % task_name),
+                    (functools.partial(members.open, output_name),
+                     "Testcase output for task %s" % task_name)]
+            try:
+                digests = file_cacher.put_files(files)
+            except Exception:
+                raise Exception("Testcase storage failed")
+            finally:
+                members.close()
+
+            # Replace and add the testcases, in a single transaction.
+            # The overwritten ones are deleted first, as the new ones
+            # have the same codenames.
+            try:
+                for codename in overwritten_tc:
+                    del dataset.testcases[codename]
+                session.flush()
+                for i, codename in enumerate(to_add):
+                    testcase = Testcase(codename, public, digests[2 * i],
+                                        digests[2 * i + 1], dataset=dataset)
+                    session.add(testcase)
+                session.commit()
+            except Exception:
+                session.rollback()
+                raise Exception("Couldn't add the testcases")
     except zipfile.BadZipfile:
         raise Exception(
             "The selected file is not a zip file. "
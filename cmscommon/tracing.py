@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Timing of the stages a submission goes through.
+
+Each process keeps a StageTracer (the module-level `tracer') that
+receives timing events for named stages (e.g., "queue", "scoring"),
+logs them with the identifiers of the object they refer to, and
+aggregates their durations in per-stage latency histograms. Services
+expose these histograms through RPC, so that they can be collected
+(for example by the Prometheus exporter).
+
+"""
+
+import bisect
+import logging
+import time
+from collections.abc import Iterator
+from contextlib import contextmanager
+from typing import TypedDict
+
+
+__all__ = [
+    "HistogramDict", "LatencyHistogram", "StageTracer", "tracer",
+]
+
+
+logger = logging.getLogger(__name__)
+
+
+class HistogramDict(TypedDict):
+    """Serialized form of a LatencyHistogram, for sending over RPC."""
+
+    # Pairs of (upper bound, cumulative count), the last upper bound
+    # being None (that is, +infinity).
+    buckets: list[tuple[float | None, int]]
+    count: int
+    sum: float
+
+
+class LatencyHistogram:
+    """Count of the observed durations, split in buckets.
+
+    Buckets are defined by their (inclusive) upper bounds, in seconds;
+    an implicit last bucket collects everything above the largest
+    bound.
+
+    """
+
+    # Spanning from a fast DB query to a slow evaluation.
+    DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                       1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self._bounds = sorted(buckets)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        """Record a new duration.
+
+        value: the duration, in seconds.
+
+        """
+        self._counts[bisect.bisect_left(self._bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self) -> HistogramDict:
+        """Return the histogram with cumulative bucket counts."""
+        buckets: list[tuple[float | None, int]] = []
+        cumulative = 0
+        for bound, count in zip(self._bounds + [None], self._counts):
+            cumulative += count
+            buckets.append((bound, cumulative))
+        return {"buckets": buckets, "count": self.count, "sum": self.sum}
+
+
+class StageTracer:
+    """Collector of the timing events of a process.
+
+    """
+
+    def __init__(self):
+        self._histograms: dict[str, LatencyHistogram] = {}
+
+    def record(self, stage: str, duration: float, **context: object):
+        """Record that an instance of a stage took the given time.
+
+        stage: the name of the stage.
+        duration: how long it took, in seconds.
+        context: identifiers of what the stage worked on (e.g.,
+            submission_id, dataset_id); they are logged together with
+            the event, so that the history of an object can be
+            reconstructed from the logs. The events are logged at
+            DEBUG level, as there are several for each submission and
+            the remote log handler sends INFO and above to LogService.
+
+        """
+        if stage not in self._histograms:
+            self._histograms[stage] = LatencyHistogram()
+        self._histograms[stage].observe(duration)
+
+        logger.debug("Stage `%s' took %.3f seconds%s.", stage, duration,
+                    "".join(" %s=%s" % item for item in context.items()),
+                    extra={"stage": stage, "duration": duration,
+                           "stage_context": context})
+
+    @contextmanager
+    def time_stage(self, stage: str, **context: object) -> Iterator[None]:
+        """Record the time spent in the body of the with statement.
+
+        The time is recorded even if the body raises an exception.
+
+        stage: the name of the stage.
+        context: see record.
+
+        """
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(stage, time.monotonic() - start, **context)
+
+    def get_status(self) -> dict[str, HistogramDict]:
+        """Return the histograms of all the stages seen so far."""
+        return {stage: histogram.to_dict()
+                for stage, histogram in self._histograms.items()}
+
+
+# The tracer of this process.
+tracer = StageTracer()
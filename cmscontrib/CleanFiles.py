@@ -23,19 +23,41 @@ and removes unreferenced file objects from the file store. If required,
 it also replaces all the executable digests in the database with a
 tombstone digest, to make executables removable in the clean pass.
 
+Chunks of files stored in chunks (see ChunkedBackend) are deleted when
+no remaining file uses them.
+
+With --incremental, only the files stored since the last run are
+considered, which is much faster on a large store; files stored before
+that become orphans only later (e.g., when their submission or task is
+deleted), so a full run is still needed from time to time to reclaim
+them. Replacing the executables with the tombstone always implies a
+full run, as the executables it orphans are mostly older than the mark.
+
 """
 
 import argparse
 import logging
+import os
 import sys
 
-from cms.db import SessionGen, Session, Digest, Executable, enumerate_files
-from cms.db.filecacher import FileCacher
+from sqlalchemy import and_, exists, func, select, union_all
+from sqlalchemy.sql import text
+
+from cms import config
+from cms.db import SessionGen, Session, Digest, Executable, FSObject, \
+    metadata
+from cms.db.filecacher import ChunkedBackend, FileCacher
 
 
 logger = logging.getLogger()
 
 
+# Where the oldest transaction still running when the last run
+# started is stored (the files stored by it and by the following ones
+# are the ones an incremental run considers).
+MARK_PATH = os.path.join(config.global_.data_dir, "clean_files.txid")
+
+
 def make_tombstone(session: Session):
     count = 0
     for exe in session.query(Executable).all():
@@ -46,26 +68,188 @@ def make_tombstone(session: Session):
     logger.info("Replaced %d executables with the tombstone.", count)
 
 
-def clean_files(session: Session, dry_run: bool):
-    filecacher = FileCacher()
-    files = set(file[0] for file in filecacher.list())
-    logger.info("A total number of %d files are present in the file store",
-                len(files))
-    found_digests = enumerate_files(session)
-    logger.info("Found %d digests while scanning", len(found_digests))
-    files -= found_digests
-    logger.info("%d digests are orphan.", len(files))
+def is_referenced():
+    """Return a condition on FSObject, true if the file is referenced.
+
+    The file is referenced if any column holding a digest, in any
+    table, has its digest. The columns are not indexed, so they are
+    all read once, as a single subquery, and matched against the
+    files with a (hash) join, rather than looked up for each file.
+
+    """
+    referenced = union_all(*(
+        select([col.label("digest")]).where(col.isnot(None))
+        for table in metadata.sorted_tables
+        for col in table.columns
+        if isinstance(col.type, Digest))).alias("referenced")
+    return exists().where(referenced.c.digest == FSObject.digest)
+
+
+def large_objects_size(session: Session, loids: list[int]) -> int:
+    """Return the total size of the given large objects, in bytes."""
+    if len(loids) == 0:
+        return 0
+    # 262144 is INV_READ; 2 is SEEK_END.
+    return session.execute(
+        text("SELECT coalesce(sum(lo_lseek64(lo_open(l, 262144), 0, 2)), 0) "
+             "FROM unnest(CAST(:loids AS oid[])) AS l"),
+        {"loids": loids}).scalar()
+
+
+def read_mark() -> int | None:
+    try:
+        with open(MARK_PATH, "rt", encoding="utf-8") as f:
+            return int(f.read())
+    except (OSError, ValueError):
+        return None
+
+
+def write_mark(mark: int):
+    with open(MARK_PATH, "wt", encoding="utf-8") as f:
+        f.write("%d\n" % mark)
+
+
+def delete_files(session: Session, orphans: list[tuple[str, int]],
+                 batch_size: int) -> tuple[int, int]:
+    """Delete the given files, if they are still not referenced.
+
+    The files are deleted (together with their large objects, if they
+    are not stored inline) in batches, each in its own transaction.
+
+    session: the session to use.
+    orphans: the digests and large object ids of the files.
+    batch_size: the number of files to delete in each transaction.
+
+    return: the number of files deleted and the bytes reclaimed.
+
+    """
+    deleted = 0
     total_size = 0
-    for orphan in files:
-        total_size += filecacher.get_size(orphan)
-    logger.info("Orphan files take %s bytes of disk space",
-                "{:,}".format(total_size))
+    for i in range(0, len(orphans), batch_size):
+        digests = [digest for digest, _ in orphans[i:i + batch_size]]
+        rows = session.execute(
+            FSObject.__table__.delete()
+            .where(and_(FSObject.digest.in_(digests), ~is_referenced()))
+            .returning(FSObject.loid,
+                       func.octet_length(FSObject.content))).fetchall()
+        loids = [loid for loid, _ in rows if loid is not None]
+        total_size += large_objects_size(session, loids)
+        total_size += sum(size for _, size in rows if size is not None)
+        session.execute(
+            text("SELECT count(lo_unlink(l)) "
+                 "FROM unnest(CAST(:loids AS oid[])) AS l"),
+            {"loids": loids})
+        session.commit()
+        deleted += len(rows)
+        logger.info("%d files deleted from the file store", deleted)
+    return deleted, total_size
+
+
+def used_chunks(session: Session, excluded: set[str]) -> set[str]:
+    """Return the chunks used by the files stored in chunks.
+
+    session: the session to use.
+    excluded: digests of files to ignore (e.g., about to be deleted).
+
+    return: the digests of the chunks.
+
+    """
+    backend = None
+    chunks = set()
+    for digest, in session.query(FSObject.digest).filter(
+            FSObject.description.startswith(
+                ChunkedBackend.MANIFEST_DESCRIPTION_PREFIX,
+                autoescape=True)):
+        if digest in excluded:
+            continue
+        if backend is None:
+            backend = FileCacher().backend
+        try:
+            manifest = backend.read_manifest(digest)
+        except KeyError:
+            continue
+        if manifest is not None:
+            chunks.update(chunk_digest for chunk_digest, _ in manifest)
+    return chunks
+
+
+def clean_files(session: Session, dry_run: bool, incremental: bool = False,
+                batch_size: int = 1000):
+    """Delete the files that are not referenced by any object.
+
+    The orphans are found with a single query, and deleted (together
+    with their large objects) in batches, each in its own transaction;
+    whether they are still orphans is checked again when deleting.
+    Then the same happens for the chunks not used by any remaining
+    file; a file being stored in chunks while this runs may lose some
+    of them, so this should run while no worker is active.
+
+    session: the session to use.
+    dry_run: if True, only report what would be deleted.
+    incremental: if True, only consider the files stored by the
+        transactions that were not finished yet when the last run
+        started (see FSObject.created_txid); older files that became
+        orphans since are left for the next full run.
+    batch_size: the number of files to delete in each transaction.
+
+    """
+    total = session.query(func.count(FSObject.digest)).scalar()
+    logger.info("A total number of %d files are present in the file store",
+                total)
+    # The files stored by the transactions still running now may not
+    # be visible to this run: the next one must consider them.
+    new_mark = session.execute(
+        text("SELECT txid_snapshot_xmin(txid_current_snapshot())")).scalar()
+
+    mark = None
+    if incremental:
+        mark = read_mark()
+        if mark is None:
+            logger.info("No previous run found, considering all files.")
+        else:
+            logger.info("Considering files stored from transaction %d.",
+                        mark)
+
+    query = session.query(FSObject.digest, FSObject.loid) \
+        .filter(~is_referenced()) \
+        .filter(FSObject.description.is_distinct_from(
+            ChunkedBackend.CHUNK_DESCRIPTION))
+    if mark is not None:
+        query = query.filter(FSObject.created_txid >= mark)
+    orphans = query.order_by(FSObject.loid).all()
+    logger.info("%d digests are orphan.", len(orphans))
+
     if not dry_run:
-        for count, orphan in enumerate(files):
-            filecacher.delete(orphan)
-            if count % 100 == 0:
-                logger.info("%d files deleted from the file store", count)
-        logger.info("All orphan files have been deleted")
+        _, total_size = delete_files(session, orphans, batch_size)
+
+    # In a dry run the orphans are still there, but their chunks
+    # would be freed too.
+    chunks = used_chunks(session, set(digest for digest, _ in orphans)
+                         if dry_run else set())
+    query = session.query(FSObject.digest, FSObject.loid) \
+        .filter(FSObject.description == ChunkedBackend.CHUNK_DESCRIPTION)
+    if mark is not None:
+        query = query.filter(FSObject.created_txid >= mark)
+    orphan_chunks = [(digest, loid)
+                     for digest, loid in query.order_by(FSObject.loid)
+                     if digest not in chunks]
+    if len(orphan_chunks) > 0:
+        logger.info("%d chunks are not used anymore.", len(orphan_chunks))
+
+    if dry_run:
+        total_size = large_objects_size(
+            session, [loid for _, loid in orphans + orphan_chunks
+                      if loid is not None])
+        logger.info("Orphan files take %s bytes of disk space",
+                    "{:,}".format(total_size))
+        return
+
+    _, chunks_size = delete_files(session, orphan_chunks, batch_size)
+    total_size += chunks_size
+    logger.info("All orphan files have been deleted, reclaiming %s bytes",
+                "{:,}".format(total_size))
+
+    write_mark(new_mark)
 
 
 def main():
@@ -74,11 +258,26 @@ def main():
         "If -t is specified, also replace all executables with the tombstone")
     parser.add_argument("-t", "--tombstone", action="store_true")
     parser.add_argument("-n", "--dry-run", action="store_true")
+    parser.add_argument(
+        "-i", "--incremental", action="store_true",
+        help="only consider the files stored after the last run (older "
+        "files that became orphans since are left for a full run, which "
+        "should still be done periodically); ignored with -t")
+    parser.add_argument(
+        "-b", "--batch-size", type=int, default=1000,
+        help="number of files to delete in each transaction")
     args = parser.parse_args()
+    incremental = args.incremental
+    if args.tombstone and incremental:
+        # The executables replaced with the tombstone are mostly older
+        # than the mark, and an incremental run would not delete them.
+        logger.warning("Ignoring --incremental, as --tombstone requires "
+                       "considering all files.")
+        incremental = False
     with SessionGen() as session:
         if args.tombstone:
             make_tombstone(session)
-        clean_files(session, args.dry_run)
+        clean_files(session, args.dry_run, incremental, args.batch_size)
         if not args.dry_run:
             session.commit()
     return 0
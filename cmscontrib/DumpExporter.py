@@ -31,14 +31,21 @@ import gevent.monkey
 gevent.monkey.patch_all()  # noqa
 
 import argparse
+import io
 import json
 import logging
 import os
+import shutil
 import sys
 import tarfile
 import tempfile
+import time
+import typing
+from abc import ABCMeta, abstractmethod
 from datetime import date
 
+import gevent.pool
+
 from sqlalchemy.types import (
     Boolean,
     Integer,
@@ -51,8 +58,10 @@ from sqlalchemy.types import (
     TypeEngine,
 )
 from sqlalchemy.dialects.postgresql import ARRAY, CIDR, JSONB
+from sqlalchemy.orm import class_mapper, selectinload
+from sqlalchemy.sql import tuple_
 
-from cms import rmtree, utf8_decoder
+from cms import utf8_decoder
 from cms.db import (
     version as model_version,
     Codename,
@@ -71,11 +80,12 @@ from cms.db import (
     Announcement,
     Participation,
     Base,
+    Session,
     enumerate_files,
 )
 from cms.db.filecacher import FileCacher
 from cmscommon.datetime import make_timestamp
-from cmscommon.digest import path_digest
+from cmscommon.digest import Digester
 
 
 logger = logging.getLogger(__name__)
@@ -151,6 +161,107 @@ def encode_value(type_: TypeEngine, value: object) -> object:
         raise RuntimeError("Unknown SQLAlchemy column type: %s" % type_)
 
 
+class ExportWriter(metaclass=ABCMeta):
+    """Destination of the exported data, laid out as a directory
+    containing contest.json and the files and descriptions
+    subdirectories.
+
+    """
+
+    @abstractmethod
+    def add_file(self, path: str, fobj: typing.IO[bytes], size: int):
+        """Write a file to the export.
+
+        path: the path of the file, relative to the export root.
+        fobj: the content of the file.
+        size: the size of the content.
+
+        """
+        pass
+
+    def close(self):
+        """Complete the export."""
+        pass
+
+    @abstractmethod
+    def abort(self):
+        """Give up on the export, removing what was written."""
+        pass
+
+
+class DirectoryExportWriter(ExportWriter):
+    """Export to a new directory."""
+
+    def __init__(self, path: str):
+        """Create the directory structure.
+
+        path: the directory to create.
+
+        raise (OSError): if the directory cannot be created (e.g.,
+            because it exists already).
+
+        """
+        logger.info("Creating dir structure.")
+        os.mkdir(path)
+        self.path = path
+        os.mkdir(os.path.join(path, "files"))
+        os.mkdir(os.path.join(path, "descriptions"))
+
+    def add_file(self, path, fobj, size):
+        with open(os.path.join(self.path, path), "wb") as fout:
+            shutil.copyfileobj(fobj, fout, FileCacher.CHUNK_SIZE)
+
+    def abort(self):
+        # The directory did not exist before, so it is all ours.
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+class TarExportWriter(ExportWriter):
+    """Export to a (possibly compressed) tar archive, written as a
+    stream without staging the content on disk.
+
+    """
+
+    def __init__(self, path: str, mode: str, basename: str):
+        """Create the archive.
+
+        path: the path of the archive.
+        mode: the mode for tarfile.open.
+        basename: the name of the root directory in the archive.
+
+        """
+        self.path = path
+        self.basename = basename
+        self.mtime = time.time()
+        self.archive = tarfile.open(path, mode)
+        for dir_path in ["", "files", "descriptions"]:
+            info = self._tarinfo(dir_path)
+            info.type = tarfile.DIRTYPE
+            info.mode = 0o755
+            self.archive.addfile(info)
+
+    def _tarinfo(self, path: str) -> tarfile.TarInfo:
+        info = tarfile.TarInfo(os.path.join(self.basename, path).rstrip("/"))
+        info.mtime = self.mtime
+        info.mode = 0o644
+        return info
+
+    def add_file(self, path, fobj, size):
+        info = self._tarinfo(path)
+        info.size = size
+        self.archive.addfile(info, fobj)
+
+    def close(self):
+        self.archive.close()
+
+    def abort(self):
+        self.archive.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
 class DumpExporter:
 
     """This service exports every data that CMS knows. The process of
@@ -158,6 +269,12 @@ class DumpExporter:
 
     """
 
+    # Files up to this size are kept in memory between fetching them
+    # and writing them to the export.
+    SPOOL_SIZE = 4 * 1024 * 1024  # 4 MiB
+    # Max number of objects whose relationships are loaded together.
+    LOAD_BATCH_SIZE = 1000
+
     def __init__(
         self,
         contest_ids: list[int] | None,
@@ -168,6 +285,7 @@ class DumpExporter:
         skip_submissions: bool,
         skip_user_tests: bool,
         skip_users: bool,
+        concurrency: int = 8,
     ):
         if contest_ids is None:
             with SessionGen() as session:
@@ -195,6 +313,7 @@ class DumpExporter:
         self.skip_submissions = skip_submissions
         self.skip_user_tests = skip_user_tests
         self.skip_users = skip_users
+        self.concurrency = concurrency
         self.export_target = export_target
 
         # If target is not provided, we use the contest's name.
@@ -209,7 +328,6 @@ class DumpExporter:
         """Run the actual export code."""
         logger.info("Starting export.")
 
-        export_dir = self.export_target
         archive_info = get_archive_info(self.export_target)
 
         if archive_info["write_mode"] != "":
@@ -218,86 +336,203 @@ class DumpExporter:
                 logger.critical("The specified file already exists, "
                                 "I won't overwrite it.")
                 return False
-            export_dir = os.path.join(tempfile.mkdtemp(),
-                                      archive_info["basename"])
+            writer: ExportWriter = TarExportWriter(
+                self.export_target, archive_info["write_mode"],
+                archive_info["basename"])
+        else:
+            try:
+                writer = DirectoryExportWriter(self.export_target)
+            except OSError:
+                logger.critical("The specified directory already exists, "
+                                "I won't overwrite it.")
+                return False
 
-        logger.info("Creating dir structure.")
         try:
-            os.mkdir(export_dir)
-        except OSError:
-            logger.critical("The specified directory already exists, "
-                            "I won't overwrite it.")
-            return False
-
-        files_dir = os.path.join(export_dir, "files")
-        descr_dir = os.path.join(export_dir, "descriptions")
-        os.mkdir(files_dir)
-        os.mkdir(descr_dir)
-
-        with SessionGen() as session:
-            # Export files.
-            logger.info("Exporting files.")
-            if self.dump_files:
-                for contest_id in self.contests_ids:
-                    contest = Contest.get_from_id(contest_id, session)
-                    files = enumerate_files(
-                        session, contest,
-                        skip_submissions=self.skip_submissions,
-                        skip_user_tests=self.skip_user_tests,
-                        skip_users=self.skip_users,
-                        skip_generated=self.skip_generated)
-                    for file_ in files:
-                        if not self.safe_get_file(file_,
-                                                  os.path.join(files_dir,
-                                                               file_),
-                                                  os.path.join(descr_dir,
-                                                               file_)):
-                            return False
-
-            # Export data in JSON format.
-            if self.dump_model:
-                logger.info("Exporting data to a JSON file.")
-
-                # We use strings because they'll be the keys of a JSON
-                # object
-                self.ids: dict[object, str] = {}
-                self.queue: list[Base] = []
-
-                data: dict[str, object] = dict()
-
-                for cls, lst in [(Contest, self.contests_ids),
-                                 (User, self.users_ids),
-                                 (Task, self.tasks_ids)]:
-                    for i in lst:
-                        cls: type[Base]
-                        obj = cls.get_from_id(i, session)
-                        self.get_id(obj)
-
-                # Specify the "root" of the data graph
-                data["_objects"] = list(self.ids.values())
-
-                while len(self.queue) > 0:
-                    obj = self.queue.pop(0)
-                    data[self.ids[obj.sa_identity_key]] = \
-                        self.export_object(obj)
-
-                data["_version"] = model_version
-
-                destination = os.path.join(export_dir, "contest.json")
-                with open(destination, "wt", encoding="utf-8") as fout:
-                    json.dump(data, fout, indent=4, sort_keys=True)
-
-        # If the admin requested export to file, we do that.
-        if archive_info["write_mode"] != "":
-            with tarfile.open(self.export_target,
-                              archive_info["write_mode"]) as archive:
-                archive.add(export_dir, arcname=archive_info["basename"])
-            rmtree(export_dir)
+            with SessionGen() as session:
+                # Export files.
+                logger.info("Exporting files.")
+                if self.dump_files:
+                    digests: set[str] = set()
+                    for contest_id in self.contests_ids:
+                        contest = Contest.get_from_id(contest_id, session)
+                        digests |= enumerate_files(
+                            session, contest,
+                            skip_submissions=self.skip_submissions,
+                            skip_user_tests=self.skip_user_tests,
+                            skip_users=self.skip_users,
+                            skip_generated=self.skip_generated)
+                    if not self.export_files(writer, sorted(digests)):
+                        writer.abort()
+                        return False
+
+                # Export data in JSON format.
+                if self.dump_model:
+                    logger.info("Exporting data to a JSON file.")
+                    with tempfile.TemporaryFile() as fobj:
+                        fout = io.TextIOWrapper(fobj, encoding="utf-8")
+                        self.export_model(session, fout)
+                        # This also flushes fout.
+                        fout.detach()
+                        size = fobj.tell()
+                        fobj.seek(0)
+                        writer.add_file("contest.json", fobj, size)
+        except BaseException:
+            writer.abort()
+            raise
+
+        writer.close()
 
         logger.info("Export finished.")
 
         return True
 
+    def export_files(self, writer: "ExportWriter", digests: list[str]) -> bool:
+        """Write the given files and their descriptions to the export.
+
+        Files are fetched concurrently from the storage (bypassing the
+        local cache, which would end up holding a copy of the whole
+        export) and then written one at a time.
+
+        writer: where to write the files.
+        digests: the digests of the files to export.
+
+        return: True if all ok, False if something wrong.
+
+        """
+        pool = gevent.pool.Pool(self.concurrency)
+        try:
+            exported = 0
+            for digest, fetched in pool.imap_unordered(
+                    self.fetch_file, digests, maxsize=self.concurrency):
+                if fetched is None:
+                    return False
+                fobj, size, description = fetched
+                with fobj:
+                    writer.add_file(os.path.join("files", digest), fobj, size)
+                data = description.encode("utf-8")
+                writer.add_file(os.path.join("descriptions", digest),
+                                io.BytesIO(data), len(data))
+                exported += 1
+                if exported % 1000 == 0:
+                    logger.info("Exported %d files out of %d.",
+                                exported, len(digests))
+        finally:
+            pool.kill()
+        return True
+
+    def fetch_file(
+        self, digest: str
+    ) -> tuple[str, tuple[typing.IO[bytes], int, str] | None]:
+        """Get a file from the storage ensuring that the digest is
+        correct.
+
+        digest: the digest of the file to retrieve.
+
+        return: the digest and, if all ok, a file object positioned at
+            the start of the content, the size of the content and the
+            description of the file; None if something wrong.
+
+        """
+        fobj = tempfile.SpooledTemporaryFile(max_size=self.SPOOL_SIZE)
+        hasher = Digester()
+        try:
+            with self.file_cacher.backend.get_file(digest) as src:
+                buf = src.read(FileCacher.CHUNK_SIZE)
+                while len(buf) > 0:
+                    hasher.update(buf)
+                    fobj.write(buf)
+                    buf = src.read(FileCacher.CHUNK_SIZE)
+            description = self.file_cacher.describe(digest)
+        except Exception:
+            logger.error("File %s could not retrieved from file server.",
+                         digest, exc_info=True)
+            fobj.close()
+            return digest, None
+
+        calc_digest = hasher.digest()
+        if digest != calc_digest:
+            logger.critical("File %s has wrong hash %s.",
+                            digest, calc_digest)
+            fobj.close()
+            return digest, None
+
+        size = fobj.tell()
+        fobj.seek(0)
+        return digest, (fobj, size, description)
+
+    def export_model(self, session: Session, fout: typing.TextIO):
+        """Write the JSON description of the data to export.
+
+        The objects are written as soon as they are exported, rather
+        than collected in a single dict, and they are loaded from the
+        database in batches (see load_objects).
+
+        session: the session to load the objects with.
+        fout: the file to write the JSON to.
+
+        """
+        # We use strings because they'll be the keys of a JSON
+        # object
+        self.ids: dict[object, str] = {}
+        self.queue: list[Base] = []
+
+        for cls, lst in [(Contest, self.contests_ids),
+                         (User, self.users_ids),
+                         (Task, self.tasks_ids)]:
+            for i in lst:
+                cls: type[Base]
+                obj = cls.get_from_id(i, session)
+                self.get_id(obj)
+
+        def write_item(key: str, value: object, last: bool = False):
+            fout.write("    %s: %s%s\n" % (
+                json.dumps(key), json.dumps(value, sort_keys=True),
+                "" if last else ","))
+
+        fout.write("{\n")
+        # Specify the "root" of the data graph
+        write_item("_objects", list(self.ids.values()))
+
+        while len(self.queue) > 0:
+            batch, self.queue = self.queue, []
+            self.load_objects(session, batch)
+            for obj in batch:
+                write_item(self.ids[obj.sa_identity_key],
+                           self.export_object(obj))
+
+        write_item("_version", model_version, last=True)
+        fout.write("}\n")
+
+    def load_objects(self, session: Session, objs: list[Base]):
+        """Load the relationships to export of the given objects.
+
+        Relationships would otherwise be loaded one object at a time
+        when exporting; instead, we load them with a few queries for
+        each class, with a batch of objects at a time.
+
+        session: the session the objects belong to.
+        objs: the objects to prepare for exporting.
+
+        """
+        by_class: dict[type[Base], list[tuple]] = {}
+        for obj in objs:
+            by_class.setdefault(type(obj), []).append(
+                obj.sa_identity_key[1])
+
+        for cls, pks in by_class.items():
+            options = [selectinload(getattr(cls, prp.key))
+                       for prp in self.exported_rel_props(cls)]
+            if len(options) == 0:
+                continue
+            pk_cols = class_mapper(cls).primary_key
+            for i in range(0, len(pks), self.LOAD_BATCH_SIZE):
+                chunk = pks[i:i + self.LOAD_BATCH_SIZE]
+                if len(pk_cols) == 1:
+                    condition = pk_cols[0].in_(pk[0] for pk in chunk)
+                else:
+                    condition = tuple_(*pk_cols).in_(chunk)
+                session.query(cls).filter(condition).options(*options).all()
+
     def get_id(self, obj: Base) -> str:
         obj_key = obj.sa_identity_key
         if obj_key not in self.ids:
@@ -307,6 +542,48 @@ class DumpExporter:
 
         return self.ids[obj_key]
 
+    def exported_rel_props(self, cls: type[Base]) -> list:
+        """Return the relationships of the class that are exported.
+
+        Relationships are exported unless they lead to objects that we
+        were asked to skip (see export_object).
+
+        cls: the class.
+
+        return: the relationship properties to export.
+
+        """
+        ret = []
+        for prp in cls._rel_props:
+            other_cls = prp.mapper.class_
+
+            # Skip submissions if requested
+            if self.skip_submissions and other_cls is Submission:
+                continue
+
+            # Skip user_tests if requested
+            if self.skip_user_tests and other_cls is UserTest:
+                continue
+
+            if self.skip_users:
+                skip = False
+                # User-related classes reachable from root
+                for rel_class in [Participation, Submission, UserTest,
+                                  Announcement]:
+                    if other_cls is rel_class:
+                        skip = True
+                        break
+                if skip:
+                    continue
+
+            # Skip generated data if requested
+            if self.skip_generated and other_cls in (SubmissionResult,
+                                                     UserTestResult):
+                continue
+
+            ret.append(prp)
+        return ret
+
     def export_object(self, obj: Base):
 
         """Export the given object, returning a JSON-encodable dict.
@@ -343,33 +620,9 @@ class DumpExporter:
             val = getattr(obj, prp.key)
             data[prp.key] = encode_value(col.type, val)
 
-        for prp in cls._rel_props:
+        for prp in self.exported_rel_props(cls):
             other_cls = prp.mapper.class_
 
-            # Skip submissions if requested
-            if self.skip_submissions and other_cls is Submission:
-                continue
-
-            # Skip user_tests if requested
-            if self.skip_user_tests and other_cls is UserTest:
-                continue
-
-            if self.skip_users:
-                skip = False
-                # User-related classes reachable from root
-                for rel_class in [Participation, Submission, UserTest,
-                                  Announcement]:
-                    if other_cls is rel_class:
-                        skip = True
-                        break
-                if skip:
-                    continue
-
-            # Skip generated data if requested
-            if self.skip_generated and other_cls in (SubmissionResult,
-                                                     UserTestResult):
-                continue
-
             val = getattr(obj, prp.key)
             if val is None:
                 data[prp.key] = None
@@ -386,44 +639,6 @@ class DumpExporter:
 
         return data
 
-    def safe_get_file(
-        self, digest: str, path: str, descr_path: str | None = None
-    ) -> bool:
-        """Get file from FileCacher ensuring that the digest is
-        correct.
-
-        digest: the digest of the file to retrieve.
-        path: the path where to save the file.
-        descr_path: the path where to save the description.
-
-        return: True if all ok, False if something wrong.
-
-        """
-
-        # TODO - Probably this method could be merged in FileCacher
-
-        # First get the file
-        try:
-            self.file_cacher.get_file_to_path(digest, path)
-        except Exception:
-            logger.error("File %s could not retrieved from file server.",
-                         digest, exc_info=True)
-            return False
-
-        # Then check the digest
-        calc_digest = path_digest(path)
-        if digest != calc_digest:
-            logger.critical("File %s has wrong hash %s.",
-                            digest, calc_digest)
-            return False
-
-        # If applicable, retrieve also the description
-        if descr_path is not None:
-            with open(descr_path, 'wt', encoding='utf-8') as fout:
-                fout.write(self.file_cacher.describe(digest))
-
-        return True
-
 
 def main():
     """Parse arguments and launch process."""
@@ -444,6 +659,8 @@ def main():
                         help="don't export user tests")
     parser.add_argument("-X", "--no-users", action="store_true",
                         help="don't export users")
+    parser.add_argument("-j", "--jobs", type=int, default=8,
+                        help="number of files to fetch concurrently")
     parser.add_argument("export_target", action="store",
                         type=utf8_decoder, nargs='?', default="",
                         help="target directory or archive for export")
@@ -457,7 +674,8 @@ def main():
                             skip_generated=args.no_generated,
                             skip_submissions=args.no_submissions,
                             skip_user_tests=args.no_user_tests,
-                            skip_users=args.no_users)
+                            skip_users=args.no_users,
+                            concurrency=args.jobs)
     success = exporter.do_export()
     return 0 if success is True else 1
 
@@ -34,13 +34,16 @@ import gevent.monkey
 gevent.monkey.patch_all()  # noqa
 
 import argparse
+import functools
 import ipaddress
 import json
 import logging
 import os
 import sys
+import time
 from datetime import datetime, timedelta
 
+from sqlalchemy import inspect
 from sqlalchemy.types import (
     Boolean,
     Integer,
@@ -53,6 +56,9 @@ from sqlalchemy.types import (
     TypeEngine,
 )
 from sqlalchemy.dialects.postgresql import ARRAY, CIDR, JSONB
+from sqlalchemy.orm import class_mapper
+from sqlalchemy.orm.interfaces import MANYTOONE, ONETOMANY
+from sqlalchemy.sql import and_, bindparam, text
 
 import cms.db as class_hook
 from cms import utf8_decoder
@@ -73,14 +79,15 @@ from cms.db import (
     UserTestResult,
     Announcement,
     Base,
+    Session,
     init_db,
     drop_db,
     enumerate_files,
+    metadata,
 )
 from cms.db.filecacher import FileCacher
 from cmscommon.archive import Archive
 from cmscommon.datetime import make_datetime
-from cmscommon.digest import path_digest
 
 
 logger = logging.getLogger(__name__)
@@ -151,6 +158,11 @@ class DumpImporter:
 
     """
 
+    # Rows inserted with a single statement in bulk mode.
+    INSERT_BATCH_SIZE = 1000
+    # Files stored between two progress reports.
+    FILES_BATCH_SIZE = 1000
+
     def __init__(
         self,
         drop: bool,
@@ -161,6 +173,8 @@ class DumpImporter:
         skip_submissions: bool,
         skip_user_tests: bool,
         skip_users: bool,
+        bulk: bool = False,
+        concurrency: int = 8,
     ):
         self.drop = drop
         self.load_files = load_files
@@ -169,6 +183,8 @@ class DumpImporter:
         self.skip_submissions = skip_submissions
         self.skip_user_tests = skip_user_tests
         self.skip_users = skip_users
+        self.bulk = bulk
+        self.concurrency = concurrency
 
         self.import_source = import_source
         self.import_dir = import_source
@@ -300,16 +316,17 @@ class DumpImporter:
                 # contest. This will add on cascade all dependent
                 # objects, and not add orphaned objects (like those
                 # that depended on submissions or user tests that we
-                # might have removed above).
-                for id_ in self.datas["_objects"]:
-
-                    # It could have been removed by request
-                    if id_ not in self.objs:
-                        continue
-
-                    obj = self.objs[id_]
-                    session.add(obj)
-                    session.flush()
+                # might have removed above). They could have been
+                # removed by request, too.
+                roots = [self.objs[id_] for id_ in self.datas["_objects"]
+                         if id_ in self.objs]
+                if self.bulk:
+                    self.bulk_add(session, roots)
+
+                for obj in roots:
+                    if not self.bulk:
+                        session.add(obj)
+                        session.flush()
 
                     if isinstance(obj, Contest):
                         contest_id += [obj.id]
@@ -357,15 +374,12 @@ class DumpImporter:
                 if contest_files is not None:
                     files &= contest_files
 
-                for digest in files:
-                    file_ = os.path.join(files_dir, digest)
-                    desc = os.path.join(descr_dir, digest)
-                    if not self.safe_put_file(file_, desc):
-                        logger.critical("Unable to put file `%s' in the DB. "
-                                        "Aborting. Please remove the contest "
-                                        "from the database.", file_)
-                        # TODO: remove contest from the database.
-                        return False
+                if not self.put_files(files_dir, descr_dir, sorted(files)):
+                    logger.critical("Unable to put the files in the DB. "
+                                    "Aborting. Please remove the contest "
+                                    "from the database.")
+                    # TODO: remove contest from the database.
+                    return False
 
         # Clean up, if an archive was used
         if archive is not None:
@@ -456,40 +470,210 @@ class DumpImporter:
                 raise RuntimeError(
                     "Unknown RelationshipProperty value: %s" % type(val))
 
-    def safe_put_file(self, path: str, descr_path: str) -> bool:
-        """Put a file to FileCacher signaling every error (including
+    def bulk_add(self, session: Session, roots: list[Base]):
+        """Insert the given objects, and those depending on them, in
+        the database without going through the ORM.
+
+        This has the same effect as adding the objects to the session
+        and flushing it, but the rows are built directly from the
+        objects and inserted many at a time, in dependency order. The
+        objects themselves are not added to the session; only their
+        primary keys are set.
+
+        session: the session to use to access the database.
+        roots: the top-level objects to insert.
+
+        raise (RuntimeError): if an object refers to another that is
+            neither being inserted nor already in the database.
+
+        """
+        start = time.monotonic()
+
+        # Find the objects that session.add would cascade to (those
+        # already in the database are only referred to).
+        objs: dict[Base, dict[str, object]] = {}
+        to_visit = list(roots)
+        while len(to_visit) > 0:
+            obj = to_visit.pop()
+            if obj in objs or inspect(obj).has_identity:
+                continue
+            objs[obj] = {}
+            for prp in type(obj)._rel_props:
+                if not prp.cascade.save_update:
+                    continue
+                val = getattr(obj, prp.key)
+                if val is None:
+                    continue
+                if isinstance(val, dict):
+                    to_visit.extend(val.values())
+                elif isinstance(val, list):
+                    to_visit.extend(val)
+                else:
+                    to_visit.append(val)
+
+        by_table: dict[object, list[Base]] = {}
+        for obj in objs:
+            by_table.setdefault(class_mapper(type(obj)).local_table,
+                                []).append(obj)
+        tables = [table for table in metadata.sorted_tables
+                  if table in by_table]
+
+        # Allocate the primary keys.
+        for table in tables:
+            # Only the serial columns (see Column.autoincrement).
+            pk_cols = list(table.primary_key.columns)
+            if len(pk_cols) != 1 or not isinstance(pk_cols[0].type, Integer):
+                continue
+            pk_col, = pk_cols
+            if pk_col.autoincrement is False or (
+                    pk_col.autoincrement == "auto"
+                    and len(pk_col.foreign_keys) > 0):
+                continue
+            ids = session.execute(
+                text("SELECT nextval(pg_get_serial_sequence(:table, :col)) "
+                     "FROM generate_series(1, :count)"),
+                {"table": table.name, "col": pk_col.name,
+                 "count": len(by_table[table])}).fetchall()
+            for obj, (id_,) in zip(by_table[table], ids):
+                setattr(obj, pk_col.key, id_)
+
+        def referred_key(obj: Base, prp, val: Base | None, remote) -> object:
+            """Return the value of the remote column of the object val
+            referred to by obj through prp.
+
+            """
+            if val is None:
+                return None
+            if val in objs:
+                return objs[val][remote.key]
+            # As the ORM would, use the row of an object already in
+            # the database, and refuse to silently drop the reference
+            # to any other (it would be a bug in the caller).
+            if inspect(val).has_identity:
+                return getattr(val, class_mapper(type(val))
+                               .get_property_by_column(remote).key)
+            raise RuntimeError(
+                "%r refers to %r (through %s), which is neither being "
+                "imported nor in the database." % (obj, val, prp.key))
+
+        # Build the rows. The foreign keys are then set from the rows
+        # of the objects they refer to, parents first (as their
+        # foreign keys could be referred to in turn).
+        for obj, row in objs.items():
+            for prp in class_mapper(type(obj)).column_attrs:
+                if prp.key in obj.__dict__:
+                    row[prp.columns[0].key] = obj.__dict__[prp.key]
+        post_updates: dict[tuple[object, tuple[str, ...]],
+                           list[dict[str, object]]] = {}
+        for table in tables:
+            for obj in by_table[table]:
+                row = objs[obj]
+                for prp in type(obj)._rel_props:
+                    if prp.key not in obj.__dict__:
+                        continue
+                    val = obj.__dict__[prp.key]
+                    if prp.direction is MANYTOONE:
+                        values = {local.key: referred_key(obj, prp, val,
+                                                          remote)
+                                  for local, remote in prp.local_remote_pairs}
+                        if prp.post_update:
+                            # Set after all rows have been inserted.
+                            for key in values:
+                                row[key] = None
+                            if val is not None:
+                                post_updates.setdefault(
+                                    (table, tuple(values)), []).append(
+                                    {**{"pk_%s" % col.key: row[col.key]
+                                        for col in table.primary_key},
+                                     **{"value_%s" % key: value
+                                        for key, value in values.items()}})
+                        else:
+                            row.update(values)
+                    elif prp.direction is ONETOMANY and val is not None:
+                        children = val.values() if isinstance(val, dict) \
+                            else val
+                        for child in children:
+                            if child in objs:
+                                for local, remote in prp.local_remote_pairs:
+                                    objs[child][remote.key] = row[local.key]
+
+        total = 0
+        for table in tables:
+            table_start = time.monotonic()
+            # Rows inserted together need to have the same columns.
+            by_columns: dict[frozenset[str], list[dict[str, object]]] = {}
+            for obj in by_table[table]:
+                by_columns.setdefault(frozenset(objs[obj]),
+                                      []).append(objs[obj])
+            for rows in by_columns.values():
+                for i in range(0, len(rows), self.INSERT_BATCH_SIZE):
+                    session.execute(table.insert().values(
+                        rows[i:i + self.INSERT_BATCH_SIZE]))
+            count = len(by_table[table])
+            total += count
+            elapsed = time.monotonic() - table_start
+            logger.info("Inserted %d rows in table %s (%.0f rows/s).",
+                        count, table.name, count / max(elapsed, 1e-6))
+
+        for (table, keys), updates in post_updates.items():
+            session.execute(
+                table.update()
+                .where(and_(*(col == bindparam("pk_%s" % col.key)
+                              for col in table.primary_key)))
+                .values({key: bindparam("value_%s" % key) for key in keys}),
+                updates)
+
+        elapsed = time.monotonic() - start
+        logger.info("Inserted %d rows in %.1f seconds (%.0f rows/s).",
+                    total, elapsed, total / max(elapsed, 1e-6))
+
+    def put_files(self, files_dir: str, descr_dir: str,
+                  digests: list[str]) -> bool:
+        """Put files to FileCacher signaling every error (including
         digest mismatch).
 
-        path: the path from which to load the file.
-        descr_path: same for description.
+        files_dir: the directory containing the files, named after
+            their digest.
+        descr_dir: same for the descriptions.
+        digests: the digests of the files to put.
 
         return: True if all ok, False if something wrong.
 
         """
+        start = time.monotonic()
+        for i in range(0, len(digests), self.FILES_BATCH_SIZE):
+            batch = digests[i:i + self.FILES_BATCH_SIZE]
+            files = []
+            for digest in batch:
+                try:
+                    with open(os.path.join(descr_dir, digest), 'rt',
+                              encoding='utf-8') as fin:
+                        description = fin.read()
+                except OSError:
+                    description = ''
+                files.append((functools.partial(
+                    open, os.path.join(files_dir, digest), 'rb'),
+                    description))
 
-        # TODO - Probably this method could be merged in FileCacher
+            try:
+                calc_digests = self.file_cacher.put_files(
+                    files, concurrency=self.concurrency)
+            except Exception as error:
+                logger.critical("Files could not be put to file server "
+                                "(%r), aborting.", error)
+                return False
 
-        # First read the description.
-        try:
-            with open(descr_path, 'rt', encoding='utf-8') as fin:
-                description = fin.read()
-        except OSError:
-            description = ''
+            for digest, calc_digest in zip(batch, calc_digests):
+                if digest != calc_digest:
+                    logger.critical("File %s has hash %s, aborting.",
+                                    os.path.join(files_dir, digest),
+                                    calc_digest)
+                    return False
 
-        # Put the file.
-        try:
-            digest = self.file_cacher.put_file_from_path(path, description)
-        except Exception as error:
-            logger.critical("File %s could not be put to file server (%r), "
-                            "aborting.", path, error)
-            return False
-
-        # Then check the digest.
-        calc_digest = path_digest(path)
-        if digest != calc_digest:
-            logger.critical("File %s has hash %s, but the server returned %s, "
-                            "aborting.", path, calc_digest, digest)
-            return False
+            done = i + len(batch)
+            elapsed = time.monotonic() - start
+            logger.info("Imported %d files out of %d (%.0f files/s).",
+                        done, len(digests), done / max(elapsed, 1e-6))
 
         return True
 
@@ -514,6 +698,11 @@ def main():
                         help="don't import user tests")
     parser.add_argument("-X", "--no-users", action="store_true",
                         help="don't import users")
+    parser.add_argument("-b", "--bulk", action="store_true",
+                        help="insert the rows in bulk, bypassing the ORM "
+                        "(faster for big dumps)")
+    parser.add_argument("-j", "--jobs", type=int, default=8,
+                        help="number of files to store concurrently")
     parser.add_argument("import_source", action="store", type=utf8_decoder,
                         help="source directory or compressed file")
 
@@ -526,7 +715,9 @@ def main():
                             skip_generated=args.no_generated,
                             skip_submissions=args.no_submissions,
                             skip_user_tests=args.no_user_tests,
-                            skip_users=args.no_users)
+                            skip_users=args.no_users,
+                            bulk=args.bulk,
+                            concurrency=args.jobs)
     success = importer.do_import()
     return 0 if success is True else 1
 
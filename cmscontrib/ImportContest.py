@@ -48,8 +48,8 @@ from cms import utf8_decoder
 from cms.db.session import Session
 from cms.db import SessionGen, User, Team, Participation, Task, Contest, Group
 from cms.db.filecacher import FileCacher
-from cmscontrib.importing import ImportDataError, update_contest, \
-    update_group, update_task
+from cmscontrib.importing import ImportDataError, task_fingerprint, \
+    update_contest, update_group, update_task
 from cmscontrib.loaders import choose_loader, build_epilog
 from cmscontrib.loaders.base_loader import BaseLoader, ContestLoader
 
@@ -75,6 +75,7 @@ class ContestImporter:
         no_statements: bool,
         delete_stale_participations: bool,
         loader_class: type[ContestLoader],
+        ignore_fingerprints: bool = False,
     ):
         self.yes = yes
         self.zero_time = zero_time
@@ -83,6 +84,7 @@ class ContestImporter:
         self.update_tasks = update_tasks
         self.no_statements = no_statements
         self.delete_stale_participations = delete_stale_participations
+        self.ignore_fingerprints = ignore_fingerprints
         self.file_cacher = FileCacher()
 
         self.loader = loader_class(os.path.abspath(path), self.file_cacher)
@@ -226,34 +228,54 @@ class ContestImporter:
                     "Task \"%s\" not found in database. "
                     "Use --import-task to import it." % taskname)
 
+            # Computed before loading the task, so that if the data
+            # changes while we load it we'll notice next time.
+            fingerprint = task_fingerprint(
+                task_loader, get_statements=not self.no_statements)
             task = task_loader.get_task(get_statement=not self.no_statements)
             if task is None:
                 raise ImportDataError(
                     "Could not import task \"%s\"." % taskname)
 
+            task.import_fingerprint = fingerprint
             session.add(task)
 
         elif not task_loader.task_has_changed():
-            # Task is in the DB and has not changed, nothing to do.
+            # Task is in the DB and has not changed, nothing to do. This
+            # is checked before the fingerprint, which reads all the
+            # data of the task, while this usually just looks at the
+            # modification times of the files.
             logger.info("Task \"%s\" data has not changed.", taskname)
 
-        elif self.update_tasks:
-            # Task is in the DB, but has changed, and the user asked us to
-            # update it. We do so.
-            new_task = task_loader.get_task(
-                get_statement=not self.no_statements)
-            if new_task is None:
-                raise ImportDataError(
-                    "Could not reimport task \"%s\"." % taskname)
-            logger.info("Task \"%s\" data has changed, updating it.", taskname)
-            update_task(task, new_task, get_statements=not self.no_statements)
-
-        else:
+        elif not self.update_tasks:
             # Task is in the DB, has changed, and the user didn't ask to update
             # it; we just show a warning.
             logger.warning("Not updating task \"%s\", even if it has changed. "
                            "Use --update-tasks to update it.", taskname)
 
+        else:
+            # Task is in the DB, may have changed, and the user asked us
+            # to update it. We do so, unless it was imported from the
+            # same data (e.g., its files were just touched), in which
+            # case we don't even need to load it.
+            fingerprint = task_fingerprint(
+                task_loader, get_statements=not self.no_statements)
+            if not self.ignore_fingerprints and fingerprint is not None \
+                    and fingerprint == task.import_fingerprint:
+                logger.info("Task \"%s\" data has not changed (same "
+                            "fingerprint).", taskname)
+            else:
+                new_task = task_loader.get_task(
+                    get_statement=not self.no_statements)
+                if new_task is None:
+                    raise ImportDataError(
+                        "Could not reimport task \"%s\"." % taskname)
+                logger.info("Task \"%s\" data has changed, updating it.",
+                            taskname)
+                new_task.import_fingerprint = fingerprint
+                update_task(task, new_task,
+                            get_statements=not self.no_statements)
+
         # Finally we tie the task to the contest, if it is not already used
         # elsewhere.
         if task.contest is not None and task.contest.name != contest.name:
@@ -464,6 +486,13 @@ If updating a contest already in the DB:
         action="store_true",
         help="do not import / update task statements"
     )
+    parser.add_argument(
+        "--ignore-fingerprints",
+        action="store_true",
+        help="when updating tasks, load them even if the data they are "
+        "loaded from is the same as in the last import (e.g., to undo "
+        "changes made in AWS)"
+    )
     parser.add_argument(
         "--delete-stale-participations",
         action="store_true",
@@ -493,7 +522,8 @@ If updating a contest already in the DB:
         update_tasks=args.update_tasks,
         no_statements=args.no_statements,
         delete_stale_participations=args.delete_stale_participations,
-        loader_class=loader_class)
+        loader_class=loader_class,
+        ignore_fingerprints=args.ignore_fingerprints)
     success = importer.do_import()
     return 0 if success is True else 1
 
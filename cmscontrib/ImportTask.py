@@ -44,7 +44,8 @@ from cms.db.contest import Contest
 from cms.db.session import Session
 from cms.db import SessionGen, Task
 from cms.db.filecacher import FileCacher
-from cmscontrib.importing import ImportDataError, contest_from_db, update_task
+from cmscontrib.importing import ImportDataError, contest_from_db, \
+    task_fingerprint, update_task
 from cmscontrib.loaders import choose_loader, build_epilog
 from cmscontrib.loaders.base_loader import TaskLoader
 
@@ -96,11 +97,16 @@ class TaskImporter:
         task_has_changed = False
         if self.update:
             task_has_changed = self.loader.task_has_changed()
+        # Remembered, so that ImportContest can skip the task if it
+        # does not change.
+        fingerprint = task_fingerprint(
+            self.loader, get_statements=not self.no_statement)
 
         # Get the task
         task = self.loader.get_task(get_statement=not self.no_statement)
         if task is None:
             return False
+        task.import_fingerprint = fingerprint
 
         # Override name, if necessary
         if self.override_name:
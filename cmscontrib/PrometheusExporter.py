@@ -23,10 +23,14 @@ gevent.monkey.patch_all()  # noqa
 
 import argparse
 import logging
+import time
+from datetime import timedelta
 
 from prometheus_client import start_http_server
+from prometheus_client.metrics_core import Metric
 from prometheus_client.registry import Collector
-from prometheus_client.core import REGISTRY, CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.core import REGISTRY, CounterMetricFamily, \
+    GaugeMetricFamily, HistogramMetricFamily
 from sqlalchemy import func, distinct
 
 from cms import ServiceCoord
@@ -46,11 +50,24 @@ from cms.db import (
 from cms.io.service import Service
 from cms.io.rpc import RPCError, RemoteServiceClient
 from cms.server.admin.server import AdminWebServer
+from cmscommon.datetime import make_datetime
 
 logger = logging.getLogger(__name__)
 
 
 class PrometheusExporter(Service, Collector):
+    # The services whose latency histograms (see cmscommon.tracing) we
+    # collect: those handling a submission during its lifecycle.
+    TRACED_SERVICES = ["ContestWebServer", "EvaluationService", "Worker",
+                       "ScoringService", "ProxyService"]
+
+    # Submissions older than this many seconds are assumed to be
+    # committed, and are added to the running totals.
+    STABLE_SUBMISSION_AGE = 60
+    # The running totals are recomputed from scratch at least this
+    # often (in seconds), in case they drifted undetected.
+    LANGUAGE_RECOUNT_INTERVAL = 15 * 60
+
     def __init__(self, args):
         super().__init__()
 
@@ -62,15 +79,72 @@ class PrometheusExporter(Service, Collector):
         self.export_queue = not args.no_queue
         self.export_communiactions = not args.no_communications
         self.export_users = not args.no_users
+        self.export_latency = not args.no_latency
+        self.refresh_interval: float = args.refresh_interval
         self.evaluation_service: RemoteServiceClient | None = None
 
+        # The metrics computed by the last refresh, served to every
+        # scrape until the next one.
+        self._metrics: list[Metric] = []
+        self._refresh_count = 0
+        self._last_refresh_duration: float | None = None
+        self._last_refresh_timestamp: float | None = None
+
+        # Number of submissions per language, among those with id up
+        # to _language_watermark, counted from scratch at the given
+        # (monotonic) time.
+        self._language_counts: dict[str | None, int] = {}
+        self._language_watermark = 0
+        self._language_recount_time: float | None = None
+
     def run(self):
         REGISTRY.register(self)
+        self.add_timeout(self._refresh, None, self.refresh_interval,
+                         immediately=True)
         start_http_server(self.port, addr=self.host)
         logger.info("Started at http://%s:%s/metric", self.host, self.port)
         super().run()
 
     def collect(self):
+        yield from self._metrics
+
+        metric = CounterMetricFamily(
+            "cms_exporter_refreshes", "Number of refreshes of the metrics")
+        metric.add_metric([], self._refresh_count)
+        yield metric
+
+        metric = GaugeMetricFamily(
+            "cms_exporter_refresh_duration_seconds",
+            "Time spent computing the metrics in the last refresh")
+        if self._last_refresh_duration is not None:
+            metric.add_metric([], self._last_refresh_duration)
+        yield metric
+
+        metric = GaugeMetricFamily(
+            "cms_exporter_last_refresh_timestamp_seconds",
+            "Timestamp of the end of the last refresh of the metrics")
+        if self._last_refresh_timestamp is not None:
+            metric.add_metric([], self._last_refresh_timestamp)
+        yield metric
+
+    def _refresh(self):
+        """Compute all the metrics, replacing the cached ones.
+
+        Called periodically in the background, so that scrapes (possibly
+        by several Prometheus instances) don't hit the database and the
+        other services.
+
+        """
+        start = time.monotonic()
+        metrics = list(self._collect_all())
+        self._last_refresh_duration = time.monotonic() - start
+        self._last_refresh_timestamp = time.time()
+        self._refresh_count += 1
+        self._metrics = metrics
+        logger.debug("Refreshed metrics in %.3f seconds.",
+                     self._last_refresh_duration)
+
+    def _collect_all(self):
         with SessionGen() as session:
             if self.export_submissions:
                 yield from self._collect_submissions(session)
@@ -89,7 +163,7 @@ class PrometheusExporter(Service, Collector):
                     if self.export_workers:
                         yield from self._collect_workers()
                     if self.export_queue:
-                        yield from self._collect_queue()
+                        yield from self._collect_queue(session)
                 except RPCError:
                     self.evaluation_service = None
 
@@ -97,6 +171,9 @@ class PrometheusExporter(Service, Collector):
             metric.add_metric([], 1 if self.evaluation_service is not None else 0)
             yield metric
 
+        if self.export_latency:
+            yield from self._collect_latency()
+
     def _collect_submissions(self, session: Session):
         # compiling / max_compilations / compilation_fail / evaluating /
         # max_evaluations / scoring / scored / total
@@ -133,15 +210,84 @@ class PrometheusExporter(Service, Collector):
             "Number of submissions per language",
             labels=["language"],
         )
+        for language, count in self._count_languages(session).items():
+            metric.add_metric([language], count)
+        yield metric
+
+    def _count_languages(self, session: Session) -> dict[str | None, int]:
+        """Return the number of submissions for each language.
+
+        Instead of counting all submissions by language at each
+        refresh, only those recent enough to be possibly still
+        uncommitted are counted again every time; the others are added
+        to running totals. The totals are wrong if a submission below
+        the watermark commits late or is deleted: this is detected by
+        comparing them with the number of submissions below the
+        watermark (a much cheaper count), and they are then recomputed
+        from scratch, as they are anyway every
+        LANGUAGE_RECOUNT_INTERVAL seconds.
+
+        """
+        now = time.monotonic()
+        if self._language_recount_time is None \
+                or now - self._language_recount_time \
+                >= self.LANGUAGE_RECOUNT_INTERVAL:
+            recount = True
+        else:
+            stable_count = session.query(func.count(Submission.id))\
+                .filter(Submission.id <= self._language_watermark)\
+                .scalar()
+            recount = stable_count != sum(self._language_counts.values())
+            if recount:
+                logger.info("Submissions were added or deleted below id "
+                            "%d, counting languages from scratch.",
+                            self._language_watermark)
+        if recount:
+            self._language_counts = {}
+            self._language_watermark = 0
+            self._language_recount_time = now
+
+        stable_before = make_datetime() - timedelta(
+            seconds=self.STABLE_SUBMISSION_AGE)
+        new_submissions = session.query(Submission)\
+            .filter(Submission.id > self._language_watermark)
+
+        # The watermark can advance up to (excluded) the first recent
+        # submission, so that the ones after it are counted again later.
+        first_recent = new_submissions\
+            .filter(Submission.timestamp >= stable_before)\
+            .with_entities(func.min(Submission.id)).scalar()
+        if first_recent is not None:
+            watermark = first_recent - 1
+        else:
+            watermark = new_submissions\
+                .with_entities(func.max(Submission.id)).scalar() \
+                or self._language_watermark
+
         data = (
-            session.query(Submission.language, func.count(Submission.id))
-            .select_from(Submission)
+            new_submissions
+            .filter(Submission.id <= watermark)
+            .with_entities(Submission.language, func.count(Submission.id))
             .group_by(Submission.language)
             .all()
         )
         for language, count in data:
-            metric.add_metric([language], count)
-        yield metric
+            self._language_counts.setdefault(language, 0)
+            self._language_counts[language] += count
+        self._language_watermark = watermark
+
+        counts = dict(self._language_counts)
+        data = (
+            new_submissions
+            .filter(Submission.id > watermark)
+            .with_entities(Submission.language, func.count(Submission.id))
+            .group_by(Submission.language)
+            .all()
+        )
+        for language, count in data:
+            counts.setdefault(language, 0)
+            counts[language] += count
+        return counts
 
     def _collect_workers(self):
         status = self.evaluation_service.workers_status().get()
@@ -159,34 +305,82 @@ class PrometheusExporter(Service, Collector):
         )
         yield metric
 
-    def _collect_queue(self):
-        status = self.evaluation_service.queue_status().get()
+    def _collect_queue(self, session: Session):
+        summary = self.evaluation_service.queue_summary(limit=0).get()
 
         metric = GaugeMetricFamily("cms_queue_length", "Number of entries in the queue")
-        metric.add_metric([], len(status))
+        metric.add_metric([], summary["entries"])
         yield metric
 
         metric = GaugeMetricFamily(
             "cms_queue_item_types",
-            "Types of items in the queue",
+            "Number of operations in the queue per type",
             labels=["type"],
         )
-        types = {}
-        for item in status:
-            typ = item["item"]["type"]
-            types.setdefault(typ, 0)
-            types[typ] += 1
-        for typ, count in types.items():
+        for typ, count in summary["by_type"].items():
             metric.add_metric([typ], count)
         yield metric
 
+        metric = GaugeMetricFamily(
+            "cms_queue_priorities",
+            "Number of operations in the queue per priority",
+            labels=["priority"],
+        )
+        for priority, count in summary["by_priority"].items():
+            metric.add_metric([priority], count)
+        yield metric
+
+        metric = GaugeMetricFamily(
+            "cms_queue_task_operations",
+            "Number of operations in the queue per task",
+            labels=["task", "dataset"],
+        )
+        dataset_ids = [int(dataset_id) for dataset_id in summary["by_dataset"]]
+        task_names = {}
+        if dataset_ids:
+            task_names = dict(
+                session.query(Dataset.id, Task.name)
+                .join(Task, Dataset.task_id == Task.id)
+                .filter(Dataset.id.in_(dataset_ids))
+                .all()
+            )
+        for dataset_id, count in summary["by_dataset"].items():
+            metric.add_metric(
+                [task_names.get(int(dataset_id), ""), dataset_id], count
+            )
+        yield metric
+
         metric = GaugeMetricFamily(
             "cms_queue_oldest_job",
             "Timestamp of the oldest job in the queue",
         )
-        if status:
-            oldest = min(status, key=lambda x: x["timestamp"])
-            metric.add_metric([], oldest["timestamp"])
+        if summary["oldest_timestamp"] is not None:
+            metric.add_metric([], summary["oldest_timestamp"])
+        yield metric
+
+    def _collect_latency(self):
+        metric = HistogramMetricFamily(
+            "cms_stage_latency_seconds",
+            "Time spent by submissions in each stage of their lifecycle",
+            labels=["service", "shard", "stage"],
+        )
+        for coord in config.services:
+            if coord.name not in self.TRACED_SERVICES:
+                continue
+            try:
+                histograms = self.connect_to(coord).latency_histograms().get()
+            except RPCError:
+                continue
+            for stage, histogram in histograms.items():
+                buckets = [
+                    ("+Inf" if bound is None else str(bound), count)
+                    for bound, count in histogram["buckets"]
+                ]
+                metric.add_metric(
+                    [coord.name, str(coord.shard), stage],
+                    buckets,
+                    histogram["sum"],
+                )
         yield metric
 
     def _collect_communications(self, session: Session):
@@ -310,6 +504,12 @@ def main():
         default=config.prometheus.listen_port,
         type=int,
     )
+    parser.add_argument(
+        "--refresh-interval",
+        help="Seconds between two computations of the metrics",
+        default=config.prometheus.refresh_interval,
+        type=float,
+    )
     parser.add_argument(
         "--no-submissions",
         help="Do not export submissions metrics",
@@ -335,6 +535,11 @@ def main():
         help="Do not export users metrics",
         action="store_true",
     )
+    parser.add_argument(
+        "--no-latency",
+        help="Do not export the latency histograms of the services",
+        action="store_true",
+    )
 
     # unsed, but passed by ResourceService
     parser.add_argument("shard", default="", help="unused")
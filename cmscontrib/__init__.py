@@ -21,6 +21,11 @@
 """Utilities for cmscontrib"""
 
 import os
+from collections.abc import Iterable
+
+import gevent.threadpool
+
+from cmscommon.digest import Digester, path_digest
 
 
 # Taken from
@@ -35,3 +40,59 @@ def touch(path: str):
     """
     with open(path, 'ab'):
         os.utime(path, None)
+
+
+def _walk_files(path: str) -> list[tuple[str, str]]:
+    """Return the files under path, skipping the hidden ones.
+
+    return: pairs of the path of each file and its path relative to
+        path, sorted by the latter.
+
+    """
+    if os.path.isfile(path):
+        return [(path, "")]
+    files = []
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames[:] = [d for d in dirnames if not d.startswith(".")]
+        for filename in filenames:
+            file_path = os.path.join(dirpath, filename)
+            if not filename.startswith(".") and os.path.isfile(file_path):
+                files.append((file_path, os.path.relpath(file_path, path)))
+    return sorted(files, key=lambda f: f[1])
+
+
+def fingerprint_paths(paths: Iterable[str], concurrency: int = 8) -> str | None:
+    """Return a digest of the content of some files and directories.
+
+    The digest covers the names and the content of all the files
+    (recursively, for directories), so it changes whenever a file is
+    added, removed, renamed or modified. Hidden files and directories
+    (e.g., the ones where the loaders save the time of the last
+    import, or the metadata of version control systems) are ignored.
+
+    paths: the files and directories; those not existing are ignored.
+    concurrency: how many files to read at the same time.
+
+    return: the digest, or None if none of the paths exists.
+
+    """
+    files = []
+    for index, path in enumerate(paths):
+        if os.path.exists(path):
+            files.extend(("%d/%s" % (index, name), file_path)
+                         for file_path, name in _walk_files(path))
+    if len(files) == 0:
+        return None
+
+    # Hashing releases the GIL, so it runs in parallel in threads.
+    threadpool = gevent.threadpool.ThreadPool(concurrency)
+    try:
+        digests = list(threadpool.imap(path_digest,
+                                       [file_path for _, file_path in files]))
+    finally:
+        threadpool.kill()
+
+    d = Digester()
+    for (name, _), digest in zip(files, digests):
+        d.update(("%s\0%s\n" % (name, digest)).encode("utf-8"))
+    return d.digest()
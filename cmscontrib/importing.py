@@ -28,10 +28,11 @@ import typing
 from cms.db import Contest, Dataset, Task, Group
 from cms.db.base import Base
 from cms.db.session import Session
+from cmscontrib.loaders.base_loader import TaskLoader
 
 
 __all__ = [
-    "contest_from_db", "task_from_db",
+    "contest_from_db", "task_from_db", "task_fingerprint",
     "update_contest", "update_task", "update_group"
 ]
 
@@ -80,6 +81,26 @@ def task_from_db(task_name: str | None, session: Session) -> Task | None:
     return task
 
 
+def task_fingerprint(task_loader: TaskLoader, get_statements: bool) -> str | None:
+    """Return the fingerprint of the task as it would be imported
+
+    The fingerprint covers the data of the task (see
+    TaskLoader.get_fingerprint) and the options that affect the
+    import, to be stored in Task.import_fingerprint.
+
+    task_loader: the loader of the task.
+    get_statements: whether the statements are imported.
+
+    return: the fingerprint, or None if the loader cannot compute it.
+
+    """
+    fingerprint = task_loader.get_fingerprint()
+    if fingerprint is None:
+        return None
+    return "%s:%d:%s" % (
+        type(task_loader).__name__, get_statements, fingerprint)
+
+
 def _update_columns(old_object: Base, new_object: Base, spec=None):
     """Update the scalar columns of the object
 
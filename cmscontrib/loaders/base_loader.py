@@ -23,6 +23,7 @@ from cms.db.contest import Contest
 from cms.db.filecacher import FileCacher
 from cms.db.task import Task
 from cms.db.user import Team, User
+from cmscontrib import fingerprint_paths
 
 LANGUAGE_MAP = {
     'afrikaans': 'af',
@@ -179,6 +180,30 @@ class TaskLoader(BaseLoader):
         """
         pass
 
+    def get_fingerprint_paths(self) -> list[str]:
+        """Return the files and directories the task is loaded from.
+
+        Loaders reading data from outside the directory of the task
+        must extend this.
+
+        return: the paths.
+
+        """
+        return [self.path]
+
+    def get_fingerprint(self) -> str | None:
+        """Return a digest of the data the task is loaded from.
+
+        If the fingerprint is the same as when the task was last
+        imported, get_task() would produce the same task, so the
+        importers skip it altogether. Unlike task_has_changed(), this
+        is not affected by importing the task somewhere else.
+
+        return: the fingerprint, or None if it cannot be computed.
+
+        """
+        return fingerprint_paths(self.get_fingerprint_paths())
+
 
 class UserLoader(BaseLoader):
     """Base class for deriving user loaders.
@@ -831,13 +831,18 @@ class YamlLoader(ContestLoader, TaskLoader, UserLoader, TeamLoader):
                     task.submission_format.extend(["output_%s.txt" % s for s in sorted(output_codenames)])
 
         args["testcases"] = []
+        testcase_files = []
         for i in range(n_input):
-            input_digest = self.file_cacher.put_file_from_path(
-                os.path.join(self.path, "input", "input%d.txt" % i),
-                "Input %d for task %s" % (i, task.name))
-            output_digest = self.file_cacher.put_file_from_path(
-                os.path.join(self.path, "output", "output%d.txt" % i),
-                "Output %d for task %s" % (i, task.name))
+            testcase_files += [
+                (os.path.join(self.path, "input", "input%d.txt" % i),
+                 "Input %d for task %s" % (i, task.name)),
+                (os.path.join(self.path, "output", "output%d.txt" % i),
+                 "Output %d for task %s" % (i, task.name))]
+        testcase_digests = \
+            self.file_cacher.put_files_from_paths(testcase_files)
+        for i in range(n_input):
+            input_digest = testcase_digests[2 * i]
+            output_digest = testcase_digests[2 * i + 1]
             test_codename = "%03d" % i
             args["testcases"] += [
                 Testcase(test_codename, False, input_digest, output_digest)]
@@ -912,6 +917,11 @@ class YamlLoader(ContestLoader, TaskLoader, UserLoader, TeamLoader):
         # TODO Improve this.
         return self.contest_has_changed()
 
+    def get_fingerprint_paths(self):
+        """See docstring in class TaskLoader."""
+        name = os.path.split(self.path)[1]
+        return [self.path, os.path.join(self.path, "..", name + ".yaml")]
+
     def task_has_changed(self):
         """See docstring in class TaskLoader."""
         name = os.path.split(self.path)[1]
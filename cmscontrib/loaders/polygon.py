@@ -227,6 +227,7 @@ class PolygonTaskLoader(TaskLoader):
 
             args["testcases"] = {}
 
+            testcase_files = []
             for i in range(testcases):
                 infile = os.path.join(self.path, testset_name,
                                       "%02d" % (i + 1))
@@ -235,14 +236,16 @@ class PolygonTaskLoader(TaskLoader):
                 if self.dos2unix_found:
                     os.system('dos2unix -q %s' % (infile, ))
                     os.system('dos2unix -q %s' % (outfile, ))
-                input_digest = self.file_cacher.put_file_from_path(
-                    infile,
-                    "Input %d for task %s" % (i, name))
-                output_digest = self.file_cacher.put_file_from_path(
-                    outfile,
-                    "Output %d for task %s" % (i, name))
+                testcase_files += [
+                    (infile, "Input %d for task %s" % (i, name)),
+                    (outfile, "Output %d for task %s" % (i, name))]
+
+            testcase_digests = \
+                self.file_cacher.put_files_from_paths(testcase_files)
+            for i in range(testcases):
                 testcase = Testcase("%03d" % (i, ), False,
-                                    input_digest, output_digest)
+                                    testcase_digests[2 * i],
+                                    testcase_digests[2 * i + 1])
                 testcase.public = True
                 args["testcases"][testcase.codename] = testcase
 
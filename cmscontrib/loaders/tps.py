@@ -349,6 +349,7 @@ class TpsTaskLoader(TaskLoader):
         # Testcases
         args["testcases"] = {}
 
+        testcase_files = []
         for codename in testcase_codenames:
             infile = os.path.join(testcases_dir, "%s.in" % codename)
             outfile = os.path.join(testcases_dir, "%s.out" % codename)
@@ -358,14 +359,16 @@ class TpsTaskLoader(TaskLoader):
                 logger.critical('Aborting...')
                 return
 
-            input_digest = self.file_cacher.put_file_from_path(
-                infile,
-                "Input %s for task %s" % (codename, name))
-            output_digest = self.file_cacher.put_file_from_path(
-                outfile,
-                "Output %s for task %s" % (codename, name))
+            testcase_files += [
+                (infile, "Input %s for task %s" % (codename, name)),
+                (outfile, "Output %s for task %s" % (codename, name))]
+
+        testcase_digests = \
+            self.file_cacher.put_files_from_paths(testcase_files)
+        for i, codename in enumerate(testcase_codenames):
             testcase = Testcase(codename, True,
-                                input_digest, output_digest)
+                                testcase_digests[2 * i],
+                                testcase_digests[2 * i + 1])
             args["testcases"][codename] = testcase
 
         # Score Type
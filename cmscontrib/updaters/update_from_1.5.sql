@@ -105,4 +105,37 @@ ALTER TABLE contests DROP COLUMN analysis_stop;
 -- https://github.com/cms-dev/cms/pull/1672
 ALTER TABLE contests DROP COLUMN per_user_time;
 
+-- Fingerprints of imported tasks.
+ALTER TABLE tasks ADD COLUMN import_fingerprint varchar;
+
+-- Materialized scores of participations on tasks.
+CREATE TABLE task_scores (
+    participation_id integer NOT NULL,
+    task_id integer NOT NULL,
+    dataset_id integer NOT NULL,
+    score double precision NOT NULL,
+    public_score double precision NOT NULL,
+    tokened_score double precision NOT NULL,
+    partial boolean NOT NULL,
+    submission_count integer NOT NULL,
+    token_count integer NOT NULL,
+    PRIMARY KEY (participation_id, task_id)
+);
+CREATE INDEX ix_task_scores_task_id ON task_scores USING btree (task_id);
+CREATE INDEX ix_task_scores_dataset_id ON task_scores USING btree (dataset_id);
+ALTER TABLE task_scores ADD CONSTRAINT task_scores_participation_id_fkey
+    FOREIGN KEY (participation_id) REFERENCES participations(id) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE task_scores ADD CONSTRAINT task_scores_task_id_fkey
+    FOREIGN KEY (task_id) REFERENCES tasks(id) ON UPDATE CASCADE ON DELETE CASCADE;
+ALTER TABLE task_scores ADD CONSTRAINT task_scores_dataset_id_fkey
+    FOREIGN KEY (dataset_id) REFERENCES datasets(id) ON UPDATE CASCADE ON DELETE CASCADE;
+
+-- Small files stored inline instead of in large objects.
+ALTER TABLE fsobjects ALTER COLUMN loid DROP NOT NULL;
+ALTER TABLE fsobjects ADD COLUMN content bytea;
+
+-- Transaction storing each file, for incremental runs of cmsCleanFiles.
+ALTER TABLE fsobjects ADD COLUMN created_txid bigint DEFAULT txid_current();
+CREATE INDEX ix_fsobjects_created_txid ON fsobjects USING btree (created_txid);
+
 COMMIT;
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Benchmark of the rendering of the score details of a submission.
+
+Scores a synthetic submission with a group score type and reports, as
+JSON, the time needed to render its score details as shown in CWS and
+AWS, both without and with the cache of ScoreType.get_html_details.
+
+"""
+
+import argparse
+import json
+import sys
+import time
+from unittest.mock import Mock
+
+from cms import FEEDBACK_LEVEL_FULL, FEEDBACK_LEVEL_RESTRICTED
+from cms.grading.scoretypes import get_score_type
+from cms.locale import DEFAULT_TRANSLATION
+
+
+def make_submission_result(testcases):
+    """Return a fake, evaluated, submission result.
+
+    testcases: the codenames of the testcases.
+
+    """
+    sr = Mock()
+    sr.evaluated.return_value = True
+    sr.evaluations = []
+    for i, codename in enumerate(testcases):
+        evaluation = Mock()
+        evaluation.codename = codename
+        # Make some testcases fail, so that the details are not all
+        # the same.
+        evaluation.outcome = 0.0 if i % 7 == 0 else 1.0
+        evaluation.execution_memory = 1024 * 1024 * (i + 1)
+        evaluation.execution_time = 0.01 * (i + 1)
+        evaluation.execution_wall_clock_time = 0.02 * (i + 1)
+        evaluation.text = ["Output is correct"] if i % 7 != 0 \
+            else ["Output isn't correct"]
+        sr.evaluations.append(evaluation)
+    sr.submission.task.score_precision = 2
+    return sr
+
+
+def measure(function, repetitions):
+    """Return the mean seconds taken by function over the repetitions."""
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        function()
+    return (time.perf_counter() - start) / repetitions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the rendering time of the score details.")
+    parser.add_argument(
+        "-n", "--testcases", action="store", type=int, default=100,
+        help="set the number of testcases of the task (default 100)")
+    parser.add_argument(
+        "-g", "--groups", action="store", type=int, default=10,
+        help="set the number of groups of testcases (default 10)")
+    parser.add_argument(
+        "-s", "--score-type", action="store", default="GroupMin",
+        help="set the (group) score type to use (default GroupMin)")
+    parser.add_argument(
+        "-r", "--repetitions", action="store", type=int, default=200,
+        help="set the number of renderings to time (default 200)")
+    args = parser.parse_args()
+
+    if args.groups <= 0 or args.testcases < args.groups:
+        parser.error("There must be at least a testcase in each group.")
+
+    per_group = args.testcases // args.groups
+    last_group = args.testcases - per_group * (args.groups - 1)
+    testcases = ["%03d" % i for i in range(args.testcases)]
+    parameters = [[100 / args.groups, per_group]] * (args.groups - 1) \
+        + [[100 / args.groups, last_group]]
+    score_type = get_score_type(
+        args.score_type, parameters,
+        {codename: True for codename in testcases})
+    _, details, _, _, _ = score_type.compute_score(
+        make_submission_result(testcases))
+
+    report = {
+        "score_type": args.score_type,
+        "testcases": args.testcases,
+        "groups": args.groups,
+        "repetitions": args.repetitions,
+    }
+    for feedback_level in [FEEDBACK_LEVEL_RESTRICTED, FEEDBACK_LEVEL_FULL]:
+        uncached = measure(
+            lambda: score_type.get_html_details(
+                details, feedback_level, DEFAULT_TRANSLATION),
+            args.repetitions)
+        cached = measure(
+            lambda: score_type.get_html_details(
+                details, feedback_level, DEFAULT_TRANSLATION,
+                cache_key=(1, 1, "score_details")),
+            args.repetitions)
+        report[feedback_level] = {
+            "uncached_ms": uncached * 1000,
+            "cached_ms": cached * 1000,
+            "speedup": uncached / cached if cached > 0 else None,
+        }
+
+    json.dump(report, sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,406 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""End-to-end throughput benchmark of the evaluation pipeline.
+
+Creates a synthetic contest, starts the services needed to evaluate
+and score submissions (with workers that only pretend to run jobs, so
+that the sandbox is out of the picture), injects submissions at a
+configurable rate and reports, as JSON: sustained submissions and
+evaluations per second, submit and end-to-end latency percentiles,
+queue depth over time, DB write rate and the per-stage latency
+histograms collected by the services.
+
+"""
+
+import argparse
+import json
+import logging
+import os
+import re
+import sys
+import tempfile
+import time
+
+from sqlalchemy import func, text
+
+from cms.db import Contest, Dataset, Evaluation, Group, Participation, \
+    SessionGen, Submission, SubmissionResult, Task, Testcase, User
+from cms.db.filecacher import FileCacher
+from cmscontrib.AddSubmission import add_submission
+from cmstestsuite import CONFIG
+from cmstestsuite.profiling import PROFILER_NONE
+from cmstestsuite.programstarter import ProgramStarter, RemoteService
+
+
+logger = logging.getLogger(__name__)
+
+
+# A solution printing its input, which is also the expected output of
+# the synthetic testcases: it is correct even with real workers.
+SOURCE = b"""\
+#include <stdio.h>
+int main() {
+    int c;
+    while ((c = getchar()) != EOF)
+        putchar(c);
+    return 0;
+}
+"""
+LANGUAGE = "C11 / gcc"
+
+
+def percentiles(values: list[float]) -> dict[str, float | None]:
+    """Return the usual percentiles of a list of values.
+
+    values: the observed values (in any order).
+
+    return: a dictionary from the name of the percentile (e.g., "p50")
+        to its value (nearest-rank method), or None if values is empty.
+
+    """
+    values = sorted(values)
+    ret: dict[str, float | None] = {}
+    for p in (50, 90, 95, 99):
+        if len(values) == 0:
+            ret["p%d" % p] = None
+        else:
+            rank = max(0, -(-p * len(values) // 100) - 1)
+            ret["p%d" % p] = values[rank]
+    ret["max"] = values[-1] if len(values) > 0 else None
+    return ret
+
+
+def write_benchmark_config(config_path: str, fake_worker_time: float) -> str:
+    """Write a copy of the CMS config enabling the fake workers.
+
+    config_path: path of the TOML configuration to copy.
+    fake_worker_time: the value for worker.fake_worker_time.
+
+    return: the path of the new configuration file.
+
+    """
+    with open(config_path, "rt", encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    lines = [line for line in lines
+             if not re.match(r"\s*fake_worker_time\s*=", line)]
+    setting = "fake_worker_time = %r" % fake_worker_time
+    try:
+        index = [line.strip() for line in lines].index("[worker]")
+    except ValueError:
+        lines += ["", "[worker]", setting]
+    else:
+        lines.insert(index + 1, setting)
+
+    fd, path = tempfile.mkstemp(prefix="cms-benchmark-", suffix=".toml")
+    with os.fdopen(fd, "wt", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    return path
+
+
+class ThroughputBenchmark:
+    def __init__(self, num_tasks: int, num_testcases: int, num_workers: int):
+        self.num_tasks = num_tasks
+        self.num_testcases = num_testcases
+        self.num_workers = num_workers
+
+        self.suffix = "%d" % time.time()
+        self.username = "benchmark_%s" % self.suffix
+        self.task_names = ["bench%d_%s" % (i, self.suffix)
+                           for i in range(num_tasks)]
+        self.contest_id: int | None = None
+
+        self.ps = ProgramStarter()
+        self.cms_config = self.ps.cms_config
+        if num_workers > len(self.cms_config["services"]["Worker"]):
+            raise ValueError("Only %d workers are configured."
+                             % len(self.cms_config["services"]["Worker"]))
+
+    def create_contest(self):
+        """Create the synthetic contest, its tasks and its user."""
+        file_cacher = FileCacher()
+        with SessionGen() as session:
+            group = Group(name="default")
+            contest = Contest(name="benchmark_%s" % self.suffix,
+                              description="Throughput benchmark",
+                              languages=[LANGUAGE],
+                              groups=[group], main_group=group)
+            session.add(contest)
+            for num, name in enumerate(self.task_names):
+                task = Task(name=name, title=name, num=num, contest=contest,
+                            submission_format=["echo.%l"])
+                dataset = Dataset(
+                    task=task, description="Default",
+                    task_type="Batch",
+                    task_type_parameters=["alone", ["", ""], "diff"],
+                    score_type="Sum",
+                    score_type_parameters=100 / self.num_testcases)
+                for i in range(self.num_testcases):
+                    digest = file_cacher.put_file_content(
+                        b"%d\n" % i, "Benchmark testcase %d" % i)
+                    Testcase(dataset=dataset, codename="%03d" % i,
+                             public=True, input=digest, output=digest)
+                session.add(dataset)
+                session.flush()
+                task.active_dataset = dataset
+            user = User(username=self.username, password="",
+                        first_name="Bench", last_name="Mark")
+            session.add(Participation(user=user, contest=contest,
+                                      group=group))
+            session.commit()
+            self.contest_id = contest.id
+        logger.info("Created contest %d.", self.contest_id)
+
+    def start_services(self):
+        self.ps.start("LogService")
+        self.ps.start("ScoringService")
+        self.ps.start("EvaluationService", contest=self.contest_id)
+        self.ps.start("ProxyService", contest=self.contest_id)
+        for shard in range(self.num_workers):
+            self.ps.start("Worker", shard)
+        self.ps.wait()
+
+    def stop_services(self):
+        self.ps.stop_all()
+
+    def queue_depth(self) -> int:
+        """Return the number of operations queued in ES."""
+        es = RemoteService(self.cms_config, "EvaluationService", 0)
+        reply = es.call("queue_summary", {"limit": 0})
+        return reply["__data"]["operations"]
+
+    def counts(self) -> dict[str, int]:
+        """Return the progress of the pipeline, as seen in the DB."""
+        with SessionGen() as session:
+            submissions = session.query(func.count(Submission.id))\
+                .join(Submission.task)\
+                .filter(Task.contest_id == self.contest_id).scalar()
+            evaluations = session.query(func.count(Evaluation.id))\
+                .join(Evaluation.submission).join(Submission.task)\
+                .filter(Task.contest_id == self.contest_id).scalar()
+            scored = session.query(func.count(SubmissionResult.submission_id))\
+                .join(SubmissionResult.submission).join(Submission.task)\
+                .filter(Task.contest_id == self.contest_id)\
+                .filter(SubmissionResult.filter_scored()).scalar()
+            # Statistics are updated asynchronously by PostgreSQL, hence
+            # they are only meaningful over long enough intervals.
+            writes = session.execute(text(
+                "SELECT tup_inserted + tup_updated + tup_deleted "
+                "FROM pg_stat_database "
+                "WHERE datname = current_database()")).scalar()
+        return {"submissions": submissions, "evaluations": evaluations,
+                "scored": scored, "db_writes": int(writes or 0)}
+
+    def end_to_end_latencies(self) -> list[float]:
+        """Return the time from submission to score of each submission."""
+        with SessionGen() as session:
+            rows = session.query(Submission.timestamp,
+                                 SubmissionResult.scored_at)\
+                .join(SubmissionResult.submission).join(Submission.task)\
+                .filter(Task.contest_id == self.contest_id)\
+                .filter(SubmissionResult.filter_scored()).all()
+        return [(scored_at - timestamp).total_seconds()
+                for timestamp, scored_at in rows]
+
+    def stage_histograms(self) -> dict[str, dict]:
+        """Return the latency histograms of the running services."""
+        histograms = {}
+        services = [("EvaluationService", 0), ("ScoringService", 0)] + \
+            [("Worker", shard) for shard in range(self.num_workers)]
+        for name, shard in services:
+            try:
+                reply = RemoteService(self.cms_config, name, shard)\
+                    .call("latency_histograms", {})
+            except OSError as error:
+                logger.warning("Cannot reach %s/%d: %s.", name, shard, error)
+                continue
+            histograms["%s/%d" % (name, shard)] = reply["__data"]
+        return histograms
+
+    def run(self, num_submissions: int, rate: float,
+            sample_interval: float, timeout: float) -> dict:
+        """Inject the submissions and wait until all are scored.
+
+        num_submissions: how many submissions to inject.
+        rate: submissions per second to inject.
+        sample_interval: seconds between two samples of the state.
+        timeout: seconds to wait, after the last submission, for the
+            pipeline to drain.
+
+        return: the report of the run.
+
+        """
+        with tempfile.NamedTemporaryFile(suffix=".c") as source:
+            source.write(SOURCE)
+            source.flush()
+
+            samples = []
+            submit_latencies = []
+            start = time.monotonic()
+            initial = self.counts()
+            next_sample = start
+            submitted = 0
+            deadline = None
+            while True:
+                now = time.monotonic()
+                if now >= next_sample:
+                    counts = self.counts()
+                    samples.append({
+                        "time": now - start,
+                        "queue_depth": self.queue_depth(),
+                        "submitted": submitted,
+                        "scored": counts["scored"],
+                        "db_writes": counts["db_writes"]
+                        - initial["db_writes"],
+                    })
+                    next_sample += sample_interval
+                    if submitted == num_submissions \
+                            and counts["scored"] >= num_submissions:
+                        break
+                    if deadline is not None and now > deadline:
+                        logger.error("Timed out waiting for the scores.")
+                        break
+
+                if submitted < num_submissions \
+                        and now >= start + submitted / rate:
+                    task_name = self.task_names[
+                        submitted % len(self.task_names)]
+                    submit_start = time.monotonic()
+                    if not add_submission(
+                            self.contest_id, self.username, task_name,
+                            time.time(), {"echo.%l": source.name},
+                            LANGUAGE):
+                        raise RuntimeError("Cannot add submission.")
+                    submit_latencies.append(
+                        time.monotonic() - submit_start)
+                    submitted += 1
+                    if submitted == num_submissions:
+                        deadline = time.monotonic() + timeout
+                    continue
+
+                next_submission = start + submitted / rate \
+                    if submitted < num_submissions else next_sample
+                time.sleep(max(0.0, min(next_sample, next_submission)
+                               - time.monotonic()))
+            elapsed = time.monotonic() - start
+
+        final = self.counts()
+        return {
+            "parameters": {
+                "tasks": self.num_tasks,
+                "testcases": self.num_testcases,
+                "workers": self.num_workers,
+                "submissions": num_submissions,
+                "rate": rate,
+            },
+            "elapsed": elapsed,
+            "throughput": {
+                "submissions_per_second": submitted / elapsed,
+                "evaluations_per_second":
+                    (final["evaluations"] - initial["evaluations"])
+                    / elapsed,
+                "scored_per_second":
+                    (final["scored"] - initial["scored"]) / elapsed,
+                "db_writes_per_second":
+                    (final["db_writes"] - initial["db_writes"]) / elapsed,
+            },
+            "latency": {
+                "submit": percentiles(submit_latencies),
+                "end_to_end": percentiles(self.end_to_end_latencies()),
+            },
+            "samples": samples,
+            "stages": self.stage_histograms(),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Measure the throughput of the evaluation pipeline.")
+    parser.add_argument(
+        "-t", "--tasks", action="store", type=int, default=1,
+        help="set the number of tasks in the contest (default 1)")
+    parser.add_argument(
+        "-n", "--testcases", action="store", type=int, default=10,
+        help="set the number of testcases of each task (default 10)")
+    parser.add_argument(
+        "-w", "--workers", action="store", type=int, default=4,
+        help="set the number of workers to use (default 4)")
+    parser.add_argument(
+        "-f", "--fake-worker-time", action="store", type=float,
+        default=0.01,
+        help="set the seconds a fake worker spends on each job "
+             "(default 0.01)")
+    parser.add_argument(
+        "-s", "--submissions", action="store", type=int, default=100,
+        help="set the number of submissions to inject (default 100)")
+    parser.add_argument(
+        "-r", "--rate", action="store", type=float, default=10.0,
+        help="set the submissions injected per second (default 10)")
+    parser.add_argument(
+        "-i", "--sample-interval", action="store", type=float, default=1.0,
+        help="set the seconds between samples of the queue (default 1)")
+    parser.add_argument(
+        "--timeout", action="store", type=float, default=300.0,
+        help="set the seconds to wait for the last scores (default 300)")
+    parser.add_argument(
+        "-o", "--output", action="store",
+        help="write the JSON report to this file instead of stdout")
+    parser.add_argument(
+        "-v", "--verbose", action="count", default=0,
+        help="print debug information (use multiple times for more)")
+    args = parser.parse_args()
+
+    if args.rate <= 0:
+        parser.error("The rate must be positive.")
+
+    CONFIG["VERBOSITY"] = args.verbose
+    CONFIG["COVERAGE"] = False
+    CONFIG["PROFILER"] = PROFILER_NONE
+
+    # The services read their configuration from CMS_CONFIG, so we
+    # point them at a copy with the fake workers enabled.
+    config_path = os.environ.get(
+        "CMS_CONFIG", os.path.join(sys.prefix, "etc/cms.toml"))
+    CONFIG["CONFIG_PATH"] = write_benchmark_config(
+        config_path, args.fake_worker_time)
+    os.environ["CMS_CONFIG"] = CONFIG["CONFIG_PATH"]
+
+    benchmark = ThroughputBenchmark(args.tasks, args.testcases, args.workers)
+    try:
+        benchmark.create_contest()
+        benchmark.start_services()
+        report = benchmark.run(args.submissions, args.rate,
+                               args.sample_interval, args.timeout)
+    finally:
+        benchmark.stop_services()
+        os.remove(CONFIG["CONFIG_PATH"])
+
+    if args.output is not None:
+        with open(args.output, "wt", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    logger.info("%.2f submissions/s, %.2f evaluations/s sustained.",
+                report["throughput"]["submissions_per_second"],
+                report["throughput"]["evaluations_per_second"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
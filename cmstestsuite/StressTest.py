@@ -21,26 +21,66 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+"""Stress tester for CMS.
+
+Simulates contestants using CWS, each one an actor running in its own
+greenlet, so that thousands of them can be driven from one machine.
+Actors log in and then perform requests at randomized times, either
+with a fixed behaviour (RandomActor, SubmitActor) or picking them
+according to a traffic mix (MixActor), while polling notifications and
+the statuses of their submissions as the pages of CWS would. Actors can
+be started gradually according to a ramp-up schedule, and the latencies
+of the requests, by type, can be written to JSON or CSV.
+
+"""
+
+# We enable monkey patching to make many libraries gevent-friendly
+# (for instance, urllib3, used by requests)
+import gevent.monkey
+gevent.monkey.patch_all()  # noqa
+
 import argparse
 import ast
+import csv
+import json
+import math
 import os
 import random
 import sys
-import threading
 import time
 
+import gevent
+
 import cmstestsuite.web
 from cms import config, ServiceCoord, get_service_address, utf8_decoder
 from cms.db import Contest, SessionGen
 from cmscommon.crypto import parse_authentication
-from cmstestsuite.web import Browser
+from cmstestsuite.web import Browser, GenericRequest
 from cmstestsuite.web.CWSRequests import HomepageRequest, CWSLoginRequest, \
-    TaskRequest, TaskStatementRequest, SubmitRandomRequest
+    TaskRequest, TaskStatementRequest, SubmitRandomRequest, \
+    TaskSubmissionsRequest, NotificationsRequest, StatusRequest
 
 
 cmstestsuite.web.debug = True
 
 
+OUTCOMES = [GenericRequest.OUTCOME_SUCCESS, GenericRequest.OUTCOME_FAILURE,
+            GenericRequest.OUTCOME_ERROR, GenericRequest.OUTCOME_UNDECIDED]
+
+PERCENTILES = [50, 90, 95, 99]
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Return the p-th percentile of values (nearest-rank method).
+
+    values: the values, sorted and not empty.
+    p: the percentile, between 0 and 100.
+
+    """
+    rank = max(1, math.ceil(p / 100 * len(values)))
+    return values[rank - 1]
+
+
 class RequestLog:
 
     def __init__(self, log_dir=None):
@@ -52,6 +92,11 @@ class RequestLog:
         self.total_time = 0.0
         self.max_time = 0.0
 
+        # For each type of request, the count of each outcome and the
+        # durations of the requests.
+        self.outcomes: dict[str, dict[str, int]] = {}
+        self.durations: dict[str, list[float]] = {}
+
         self.log_dir = log_dir
         if self.log_dir is not None:
             try:
@@ -59,6 +104,21 @@ class RequestLog:
             except OSError:
                 pass
 
+    def record(self, request):
+        """Account for an executed request.
+
+        request: the request, after its execution.
+
+        """
+        request_type = request.__class__.__name__
+        self.__dict__[request.outcome] += 1
+        self.total_time += request.duration
+        self.max_time = max(self.max_time, request.duration)
+        outcomes = self.outcomes.setdefault(
+            request_type, dict.fromkeys(OUTCOMES, 0))
+        outcomes[request.outcome] += 1
+        self.durations.setdefault(request_type, []).append(request.duration)
+
     def print_stats(self):
         print("TOTAL:          %5d" % (self.total), file=sys.stderr)
         print("SUCCESS:        %5d" % (self.success), file=sys.stderr)
@@ -69,6 +129,16 @@ class RequestLog:
         print("Average time: %7.3f" % (self.total_time / self.total),
               file=sys.stderr)
         print("Max time:     %7.3f" % (self.max_time), file=sys.stderr)
+        print("", file=sys.stderr)
+        print("%-24s %7s %7s %7s %7s %7s %7s %7s" %
+              ("Request", "Count", "Failed", "p50", "p90", "p95", "p99",
+               "Max"), file=sys.stderr)
+        for request_type, stats in sorted(self.get_stats().items()):
+            print("%-24s %7d %7d %7.3f %7.3f %7.3f %7.3f %7.3f" %
+                  (request_type, stats["total"],
+                   stats["total"] - stats["success"], stats["p50"],
+                   stats["p90"], stats["p95"], stats["p99"], stats["max"]),
+                  file=sys.stderr)
 
     def merge(self, log2):
         self.total += log2.total
@@ -78,6 +148,51 @@ class RequestLog:
         self.undecided += log2.undecided
         self.total_time += log2.total_time
         self.max_time = max(self.max_time, log2.max_time)
+        for request_type, outcomes in log2.outcomes.items():
+            my_outcomes = self.outcomes.setdefault(
+                request_type, dict.fromkeys(OUTCOMES, 0))
+            for outcome, count in outcomes.items():
+                my_outcomes[outcome] += count
+        for request_type, durations in log2.durations.items():
+            self.durations.setdefault(request_type, []).extend(durations)
+
+    def get_stats(self) -> dict[str, dict[str, float]]:
+        """Return the statistics of the requests, by type.
+
+        return: for each type of request, the count of each outcome,
+            the total, and the mean, the percentiles (as "p50", ...)
+            and the maximum of the durations, in seconds.
+
+        """
+        stats = {}
+        for request_type, durations in self.durations.items():
+            durations = sorted(durations)
+            stats[request_type] = dict(self.outcomes[request_type])
+            stats[request_type]["total"] = len(durations)
+            stats[request_type]["mean"] = sum(durations) / len(durations)
+            for p in PERCENTILES:
+                stats[request_type]["p%d" % p] = percentile(durations, p)
+            stats[request_type]["max"] = durations[-1]
+        return stats
+
+    def store_stats(self, path):
+        """Write the statistics of the requests to a file.
+
+        path: the file to write; it is in CSV format if its extension
+            is .csv, and in JSON format otherwise.
+
+        """
+        stats = self.get_stats()
+        with open(path, "wt", encoding="utf-8", newline="") as f:
+            if path.endswith(".csv"):
+                fields = ["request", "total"] + OUTCOMES + ["mean"] \
+                    + ["p%d" % p for p in PERCENTILES] + ["max"]
+                writer = csv.DictWriter(f, fields)
+                writer.writeheader()
+                for request_type, row in sorted(stats.items()):
+                    writer.writerow(dict(row, request=request_type))
+            else:
+                json.dump(stats, f, indent=2, sort_keys=True)
 
     def store_to_file(self, request):
         if self.log_dir is None:
@@ -104,7 +219,7 @@ class ActorDying(Exception):
     pass
 
 
-class Actor(threading.Thread):
+class Actor:
     """Class that simulates the behaviour of a user of the system. It
     performs some requests at randomized times (checking CMS pages,
     doing submissions, ...), checking for their success or failure.
@@ -112,12 +227,13 @@ class Actor(threading.Thread):
     The probability that the users doing actions depends on the value
     specified in an object called "metrics".
 
+    Each actor runs in its own greenlet (plus the ones it spawns for
+    the requests it does in the background).
+
     """
 
     def __init__(self, username, password, metrics, tasks,
                  log=None, base_url=None, submissions_path=None):
-        threading.Thread.__init__(self)
-
         self.username = username
         self.password = password
         self.metrics = metrics
@@ -126,18 +242,41 @@ class Actor(threading.Thread):
         self.base_url = base_url
         self.submissions_path = submissions_path
 
-        self.name = "Actor thread for user %s" % (self.username)
-
         self.browser = Browser()
+        self.greenlets: list[gevent.Greenlet] = []
         self.die = False
 
+    def start(self):
+        self.spawn(self.run)
+
+    def spawn(self, function, *args):
+        """Run a function in a new greenlet, that is killed with the
+        actor.
+
+        """
+        # The actor might be going on for a while after being stopped,
+        # since killing its greenlets is asynchronous.
+        if self.die:
+            raise ActorDying()
+        greenlet = gevent.spawn(function, *args)
+        self.greenlets.append(greenlet)
+        greenlet.link(self.greenlets.remove)
+        return greenlet
+
+    def stop(self):
+        self.die = True
+        gevent.killall(list(self.greenlets), block=False)
+
+    def join(self):
+        gevent.joinall(list(self.greenlets))
+
     def run(self):
         try:
             print("Starting actor for user %s" % (self.username),
                   file=sys.stderr)
             self.act()
 
-        except ActorDying:
+        except (ActorDying, gevent.GreenletExit):
             print("Actor dying for user %s" % (self.username), file=sys.stderr)
 
     def act(self):
@@ -148,8 +287,9 @@ class Actor(threading.Thread):
         raise Exception("Not implemented. Please subclass Action"
                         "and overwrite act().")
 
-    def do_step(self, request):
-        self.wait_next()
+    def do_step(self, request, wait=True):
+        if wait:
+            self.wait_next()
         self.log.total += 1
         try:
             request.execute()
@@ -157,9 +297,7 @@ class Actor(threading.Thread):
             print("Unhandled exception while executing the request: %s" % exc,
                   file=sys.stderr)
             return
-        self.log.__dict__[request.outcome] += 1
-        self.log.total_time += request.duration
-        self.log.max_time = max(self.log.max_time, request.duration)
+        self.log.record(request)
         self.log.store_to_file(request)
 
     def wait_next(self):
@@ -168,24 +306,14 @@ class Actor(threading.Thread):
         exponentially distributed random variable, with parameter
         time_lambda in metrics.
 
-        The total waiting time is divided in lots of little sleep()
-        call each one of 0.1 seconds, so that the waiting gets
-        interrupted if a die signal arrives.
-
         If a die signal is received, an ActorDying exception is
-        raised.
+        raised (the wait is interrupted by stop() killing the
+        greenlet).
 
         """
-        SLEEP_PERIOD = 0.1
         time_to_wait = self.metrics['time_coeff'] * \
             random.expovariate(self.metrics['time_lambda'])
-        sleep_num = int(time_to_wait // SLEEP_PERIOD)
-        remaining_sleep = time_to_wait - (sleep_num * SLEEP_PERIOD)
-        for _ in range(sleep_num):
-            time.sleep(SLEEP_PERIOD)
-            if self.die:
-                raise ActorDying()
-        time.sleep(remaining_sleep)
+        gevent.sleep(time_to_wait)
         if self.die:
             raise ActorDying()
 
@@ -247,6 +375,98 @@ class SubmitActor(Actor):
                 submissions_path=self.submissions_path))
 
 
+class MixActor(Actor):
+    """Actor that picks each action at random according to the weights
+    in metrics["mix"], and meanwhile polls what the pages of CWS poll:
+    the notifications, every metrics["notifications_period"] seconds,
+    and the statuses of the submissions of a task after submitting to
+    it, every metrics["status_period"] seconds, backing off by 1.4
+    like the submissions page does (a period of 0 disables them).
+
+    """
+
+    # Backoff factor of the polling of the statuses, as in CWS.
+    STATUS_BACKOFF = 1.4
+    # Maximum number of polls of the statuses after a submission.
+    STATUS_MAX_POLLS = 30
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # The tasks whose statuses are being polled.
+        self.polling_tasks: set[str] = set()
+
+    def act(self):
+        self.login()
+
+        if self.metrics["notifications_period"] > 0:
+            self.spawn(self.poll_notifications)
+
+        actions = list(self.metrics["mix"])
+        weights = [self.metrics["mix"][action] for action in actions]
+        while True:
+            action = random.choices(actions, weights)[0]
+            task = random.choice(self.tasks)
+            if action == "submit" and self.submissions_path is not None:
+                self.do_step(SubmitRandomRequest(
+                    self.browser,
+                    task,
+                    base_url=self.base_url,
+                    submissions_path=self.submissions_path))
+                if self.metrics["status_period"] > 0 \
+                        and task[1] not in self.polling_tasks:
+                    self.spawn(self.poll_statuses, task[1])
+            elif action == "statement" and task[2] != []:
+                self.do_step(TaskStatementRequest(self.browser,
+                                                  task[1],
+                                                  random.choice(task[2]),
+                                                  base_url=self.base_url))
+            elif action == "submissions":
+                self.do_step(TaskSubmissionsRequest(self.browser,
+                                                    task[1],
+                                                    base_url=self.base_url))
+            elif action == "homepage":
+                self.do_step(HomepageRequest(self.browser,
+                                             self.username,
+                                             loggedin=True,
+                                             base_url=self.base_url))
+            else:
+                self.do_step(TaskRequest(self.browser,
+                                         task[1],
+                                         base_url=self.base_url))
+
+    def poll_notifications(self):
+        period = self.metrics["notifications_period"]
+        last_notification = None
+        # Desynchronize the actors started together.
+        gevent.sleep(random.uniform(0, period))
+        while True:
+            request = NotificationsRequest(self.browser,
+                                           last_notification,
+                                           base_url=self.base_url)
+            self.do_step(request, wait=False)
+            last_notification = \
+                request.get_last_notification() or last_notification
+            gevent.sleep(period)
+
+    def poll_statuses(self, task_name):
+        self.polling_tasks.add(task_name)
+        try:
+            delay = self.metrics["status_period"]
+            etag = None
+            for _ in range(self.STATUS_MAX_POLLS):
+                gevent.sleep(delay)
+                request = StatusRequest(self.browser, task_name, etag,
+                                        base_url=self.base_url)
+                self.do_step(request, wait=False)
+                if request.outcome != GenericRequest.OUTCOME_SUCCESS \
+                        or not request.is_pending():
+                    break
+                etag = request.etag
+                delay *= self.STATUS_BACKOFF
+        finally:
+            self.polling_tasks.discard(task_name)
+
+
 def harvest_contest_data(contest_id: int) -> tuple[dict[str, dict], list[str]]:
     """Retrieve the couples username, password and the task list for a
     given contest.
@@ -282,6 +502,105 @@ def harvest_contest_data(contest_id: int) -> tuple[dict[str, dict], list[str]]:
 DEFAULT_METRICS = {'time_coeff': 10.0,
                    'time_lambda': 2.0}
 
+# The default weights of the actions of MixActor: most of the time
+# contestants read the statements and the task pages.
+DEFAULT_MIX = "statement=5,task=3,submissions=2,homepage=1,submit=1"
+
+MIX_ACTIONS = ["homepage", "task", "statement", "submissions", "submit"]
+
+
+def parse_mix(spec: str) -> dict[str, float]:
+    """Parse a traffic mix for MixActor.
+
+    spec: comma-separated action=weight pairs, with the actions in
+        MIX_ACTIONS.
+
+    return: the weight of each action.
+
+    raise (ValueError): if the specification is not valid.
+
+    """
+    mix = {}
+    for item in spec.split(","):
+        action, _, weight = item.partition("=")
+        action = action.strip()
+        if action not in MIX_ACTIONS:
+            raise ValueError("Unknown action %r, valid ones are %s."
+                             % (action, ", ".join(MIX_ACTIONS)))
+        mix[action] = float(weight)
+        if mix[action] < 0:
+            raise ValueError("Negative weight for action %r." % action)
+    if sum(mix.values()) <= 0:
+        raise ValueError("At least an action must have positive weight.")
+    return mix
+
+
+def parse_ramp_up(spec: str, actor_num: int) -> list[tuple[float, int]]:
+    """Parse a ramp-up schedule.
+
+    spec: either a number of seconds S, to start all actors gradually
+        in the first S seconds, or comma-separated time:actors pairs,
+        meaning that at the given second (from the start of the test)
+        the given number of actors must be running; actors are started
+        gradually between one step and the next.
+    actor_num: the total number of actors.
+
+    return: the steps of the schedule, as (time, actors) pairs, sorted
+        and ending with all actors running.
+
+    raise (ValueError): if the specification is not valid.
+
+    """
+    if ":" not in spec:
+        steps = [(float(spec), actor_num)]
+    else:
+        steps = []
+        for item in spec.split(","):
+            seconds, _, actors = item.partition(":")
+            steps.append((float(seconds), min(int(actors), actor_num)))
+        if steps[-1][1] < actor_num:
+            steps.append((steps[-1][0], actor_num))
+    previous = (0.0, 0)
+    for step in steps:
+        if step[0] < previous[0] or step[1] < previous[1]:
+            raise ValueError("Times and actors in the ramp-up schedule "
+                             "must not decrease.")
+        previous = step
+    return steps
+
+
+def get_start_times(
+    steps: list[tuple[float, int]], actor_num: int
+) -> list[float]:
+    """Return when to start each actor, according to a schedule.
+
+    steps: the schedule, as returned by parse_ramp_up.
+    actor_num: the total number of actors.
+
+    return: the time (in seconds from the start of the test) at which
+        to start each actor, in order.
+
+    """
+    start_times = []
+    previous_time, previous_actors = 0.0, 0
+    for step_time, step_actors in steps:
+        new_actors = step_actors - previous_actors
+        for i in range(new_actors):
+            # Spread the new actors evenly in the interval, the last
+            # one being started at the end of the step.
+            start_times.append(previous_time + (step_time - previous_time)
+                               * (i + 1) / new_actors)
+        previous_time, previous_actors = step_time, step_actors
+    return start_times[:actor_num]
+
+
+def start_actors(actors, start_times):
+    """Start each actor at its time, counting from now."""
+    start = time.monotonic()
+    for actor, start_time in zip(actors, start_times):
+        gevent.sleep(max(0.0, start + start_time - time.monotonic()))
+        actor.start()
+
 
 def main():
     parser = argparse.ArgumentParser(description="Stress tester for CMS")
@@ -313,6 +632,42 @@ def main():
     parser.add_argument(
         "-o", "--only-submit", action="store_true",
         help="whether the actor only submits solutions")
+    parser.add_argument(
+        "-m", "--mix", action="store", nargs="?", const=DEFAULT_MIX,
+        type=utf8_decoder,
+        help="use a traffic mix, with weights given as comma-separated "
+             "action=weight pairs, with actions among %s (default %s), "
+             "and poll notifications and statuses as CWS pages do"
+             % (", ".join(MIX_ACTIONS), DEFAULT_MIX))
+    parser.add_argument(
+        "--notifications-period", action="store", type=float, default=30.0,
+        help="seconds between polls of the notifications with a traffic "
+             "mix, 0 to disable them (default 30)")
+    parser.add_argument(
+        "--status-period", action="store", type=float, default=1.0,
+        help="seconds before the first poll of the statuses after a "
+             "submission with a traffic mix, 0 to disable them (default 1)")
+    parser.add_argument(
+        "-R", "--ramp-up", action="store", type=utf8_decoder,
+        help="start the actors gradually, either in the given number of "
+             "seconds or following comma-separated time:actors pairs")
+    parser.add_argument(
+        "-d", "--duration", action="store", type=float,
+        help="stop after the given number of seconds (default: at "
+             "keyboard interrupt)")
+    parser.add_argument(
+        "-O", "--output", action="append", type=utf8_decoder, default=[],
+        help="write the latencies by type of request to this file, as "
+             "CSV if its extension is .csv and as JSON otherwise (can be "
+             "given more than once)")
+    parser.add_argument(
+        "-l", "--log-dir", action="store", type=utf8_decoder,
+        default="./test_logs",
+        help="directory where to store the requests done by each actor "
+             "(default ./test_logs)")
+    parser.add_argument(
+        "--no-request-logs", action="store_true",
+        help="do not store the requests done, nor print each of them")
     args = parser.parse_args()
 
     # If prepare_path is specified we only need to save some useful
@@ -329,6 +684,16 @@ def main():
     assert args.time_coeff > 0.0
     assert not (args.only_submit and len(args.submissions_path) == 0)
 
+    mix = None
+    if args.mix is not None:
+        try:
+            mix = parse_mix(args.mix)
+        except ValueError as error:
+            parser.error("Invalid traffic mix: %s" % error)
+
+    if args.no_request_logs:
+        cmstestsuite.web.debug = False
+
     users = []
     tasks = []
 
@@ -365,25 +730,43 @@ def main():
 
     metrics = DEFAULT_METRICS
     metrics["time_coeff"] = args.time_coeff
+    metrics["mix"] = mix
+    metrics["notifications_period"] = args.notifications_period
+    metrics["status_period"] = args.status_period
     actor_class = RandomActor
     if args.only_submit:
         actor_class = SubmitActor
+    elif mix is not None:
+        actor_class = MixActor
     actors = [actor_class(username, data['password'], metrics, tasks,
-                          log=RequestLog(log_dir=os.path.join('./test_logs',
-                                                              username)),
+                          log=RequestLog(
+                              log_dir=None if args.no_request_logs
+                              else os.path.join(args.log_dir, username)),
                           base_url=base_url,
                           submissions_path=args.submissions_path)
               for username, data in users.items()]
-    for actor in actors:
-        actor.start()
+
+    start_times = [0.0] * len(actors)
+    if args.ramp_up is not None:
+        try:
+            start_times = get_start_times(
+                parse_ramp_up(args.ramp_up, len(actors)), len(actors))
+        except ValueError as error:
+            parser.error("Invalid ramp-up schedule: %s" % error)
+    starter = gevent.spawn(start_actors, actors, start_times)
 
     try:
-        while True:
-            time.sleep(1)
+        if args.duration is not None:
+            gevent.sleep(args.duration)
+        else:
+            while True:
+                gevent.sleep(1)
     except KeyboardInterrupt:
-        print("Taking down actors", file=sys.stderr)
-        for actor in actors:
-            actor.die = True
+        pass
+    print("Taking down actors", file=sys.stderr)
+    starter.kill()
+    for actor in actors:
+        actor.stop()
 
     # Uncomment to turn on some memory profiling.
     # from meliae import scanner
@@ -400,7 +783,12 @@ def main():
     for actor in actors:
         great_log.merge(actor.log)
 
+    if great_log.total == 0:
+        print("No requests done.", file=sys.stderr)
+        return
     great_log.print_stats()
+    for path in args.output:
+        great_log.store_stats(path)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the importers module"""
+
+import re
+import unittest
+import zipfile
+from io import BytesIO
+from unittest.mock import MagicMock
+
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.db.filecacher import FileCacher
+from cmscommon.digest import bytes_digest
+from cmscommon.importers import import_testcases_from_zipfile
+
+
+INPUT_RE = re.compile(r"input_(.*)\.txt")
+OUTPUT_RE = re.compile(r"output_(.*)\.txt")
+
+
+def make_archive(testcases):
+    """Return a zip file with the given testcases.
+
+    testcases: dictionary from codename to the contents of the input
+        and output.
+
+    """
+    archive = BytesIO()
+    with zipfile.ZipFile(archive, "w") as zfp:
+        for codename, (input_, output) in testcases.items():
+            zfp.writestr("input_%s.txt" % codename, input_)
+            zfp.writestr("output_%s.txt" % codename, output)
+    archive.seek(0)
+    return archive
+
+
+class TestImportTestcasesFromZipfile(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.file_cacher = FileCacher()
+        self.dataset = self.add_dataset()
+        self.old = self.add_testcase(self.dataset, codename="1")
+        self.session.commit()
+        self.archive = make_archive({"1": (b"in 1", b"out 1"),
+                                     "2": (b"in 2", b"out 2")})
+
+    def tearDown(self):
+        self.delete_data()
+        super().tearDown()
+
+    def do_import(self, file_cacher, overwrite):
+        return import_testcases_from_zipfile(
+            self.session, file_cacher, self.dataset, self.archive,
+            INPUT_RE, OUTPUT_RE, overwrite, public=False)
+
+    def assertTestcases(self, expected):
+        self.session.expire_all()
+        self.assertEqual(
+            {codename: (testcase.input, testcase.output)
+             for codename, testcase in self.dataset.testcases.items()},
+            expected)
+
+    def test_overwrite(self):
+        _, text = self.do_import(self.file_cacher, overwrite=True)
+        self.assertEqual(text, "Added: 2; overwritten: 1; skipped: none")
+        self.assertTestcases({
+            "1": (bytes_digest(b"in 1"), bytes_digest(b"out 1")),
+            "2": (bytes_digest(b"in 2"), bytes_digest(b"out 2")),
+        })
+
+    def test_no_overwrite(self):
+        old = (self.old.input, self.old.output)
+        _, text = self.do_import(self.file_cacher, overwrite=False)
+        self.assertEqual(text, "Added: 2; overwritten: none; skipped: 1")
+        self.assertTestcases({
+            "1": old,
+            "2": (bytes_digest(b"in 2"), bytes_digest(b"out 2")),
+        })
+
+    def test_storage_failure(self):
+        # The overwritten testcases are kept if the files can't be
+        # stored.
+        old = (self.old.input, self.old.output)
+        file_cacher = MagicMock()
+        file_cacher.put_files.side_effect = OSError("disk full")
+        with self.assertRaises(Exception):
+            self.do_import(file_cacher, overwrite=True)
+        self.assertTestcases({"1": old})
+
+
+if __name__ == "__main__":
+    unittest.main()
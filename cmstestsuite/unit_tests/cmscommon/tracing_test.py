@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the tracing module"""
+
+import logging
+import unittest
+from unittest.mock import patch
+
+from cmscommon.tracing import LatencyHistogram, StageTracer
+
+
+class TestLatencyHistogram(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.histogram = LatencyHistogram(buckets=(1.0, 0.1, 10.0))
+
+    def test_empty(self):
+        self.assertEqual(self.histogram.to_dict(), {
+            "buckets": [(0.1, 0), (1.0, 0), (10.0, 0), (None, 0)],
+            "count": 0,
+            "sum": 0.0,
+        })
+
+    def test_cumulative(self):
+        for value in [0.05, 0.1, 0.5, 5.0, 50.0, 500.0]:
+            self.histogram.observe(value)
+        status = self.histogram.to_dict()
+        self.assertEqual(status["buckets"],
+                         [(0.1, 2), (1.0, 3), (10.0, 4), (None, 6)])
+        self.assertEqual(status["count"], 6)
+        self.assertAlmostEqual(status["sum"], 555.65)
+
+
+class TestStageTracer(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tracer = StageTracer()
+
+    def test_record(self):
+        self.tracer.record("queue", 0.2, submission_id=1)
+        self.tracer.record("queue", 0.3, submission_id=2)
+        self.tracer.record("scoring", 2.0)
+        status = self.tracer.get_status()
+        self.assertEqual(set(status.keys()), {"queue", "scoring"})
+        self.assertEqual(status["queue"]["count"], 2)
+        self.assertAlmostEqual(status["queue"]["sum"], 0.5)
+        self.assertEqual(status["scoring"]["count"], 1)
+
+    def test_record_logs_at_debug(self):
+        with self.assertLogs("cmscommon.tracing", logging.DEBUG) as logs:
+            self.tracer.record("queue", 0.25, submission_id=1)
+        self.assertEqual([r.levelno for r in logs.records], [logging.DEBUG])
+        self.assertIn("submission_id=1", logs.output[0])
+
+    def test_time_stage(self):
+        with patch("cmscommon.tracing.time.monotonic",
+                   side_effect=[10.0, 12.5]):
+            with self.tracer.time_stage("job", operation="x"):
+                pass
+        self.assertEqual(self.tracer.get_status()["job"]["sum"], 2.5)
+
+    def test_time_stage_exception(self):
+        with self.assertRaises(ValueError):
+            with self.tracer.time_stage("job"):
+                raise ValueError()
+        self.assertEqual(self.tracer.get_status()["job"]["count"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the CleanFiles script"""
+
+import unittest
+from unittest.mock import patch
+
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.db import FSObject
+from cms.db.filecacher import DBBackend
+from cmscommon.digest import bytes_digest
+from cmscontrib import CleanFiles
+from cmscontrib.CleanFiles import clean_files
+from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
+
+
+class TestCleanFiles(DatabaseMixin, FileSystemMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch.object(
+            CleanFiles, "MARK_PATH", self.get_path("clean_files.txid"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.task = self.add_task(contest=self.contest)
+        self.submission = self.add_submission(self.task, self.participation)
+        self.session.commit()
+
+    def tearDown(self):
+        self.delete_data()
+        super().tearDown()
+
+    def add_large_object(self, content):
+        """Store a file as a large object, return its digest."""
+        digest = bytes_digest(content)
+        self.add_fsobject(digest, content)
+        return digest
+
+    def add_inline(self, content):
+        """Store a file inline (without a large object), return its
+        digest.
+
+        """
+        digest = bytes_digest(content)
+        DBBackend().put_file_contents([(digest, content, "inline")])
+        return digest
+
+    def stored_digests(self):
+        self.session.expire_all()
+        return set(digest for digest, in self.session.query(FSObject.digest))
+
+    def test_full(self):
+        referenced = self.add_large_object(b"referenced")
+        self.add_file(submission=self.submission, digest=referenced)
+        self.session.commit()
+        self.add_large_object(b"orphan")
+        self.add_inline(b"orphan inline")
+
+        clean_files(self.session, dry_run=False)
+
+        self.assertEqual(self.stored_digests(), {referenced})
+
+    def test_dry_run(self):
+        orphan = self.add_large_object(b"orphan")
+        orphan_inline = self.add_inline(b"orphan inline")
+
+        clean_files(self.session, dry_run=True)
+
+        self.assertEqual(self.stored_digests(), {orphan, orphan_inline})
+
+    def test_incremental(self):
+        old = self.add_large_object(b"old")
+        old_inline = self.add_inline(b"old inline")
+        file_ = self.add_file(submission=self.submission, digest=old)
+        file_inline = self.add_file(submission=self.submission,
+                                    digest=old_inline)
+        self.session.commit()
+        # The first incremental run considers all files.
+        clean_files(self.session, dry_run=False, incremental=True)
+        self.assertEqual(self.stored_digests(), {old, old_inline})
+
+        # The old files become orphans after the mark.
+        self.session.delete(file_)
+        self.session.delete(file_inline)
+        self.session.commit()
+        self.add_large_object(b"new")
+        self.add_inline(b"new inline")
+        new_referenced = self.add_inline(b"new referenced")
+        self.add_file(submission=self.submission, digest=new_referenced)
+        self.session.commit()
+
+        # Only the new files are considered, inline ones included.
+        clean_files(self.session, dry_run=False, incremental=True)
+        self.assertEqual(self.stored_digests(),
+                         {old, old_inline, new_referenced})
+
+        # A full run deletes the old ones too.
+        clean_files(self.session, dry_run=False)
+        self.assertEqual(self.stored_digests(), {new_referenced})
+
+
+if __name__ == "__main__":
+    unittest.main()
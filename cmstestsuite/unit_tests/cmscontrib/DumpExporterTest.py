@@ -20,14 +20,17 @@
 
 import json
 import os
+import tarfile
 import unittest
+from io import BytesIO
 
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
 from cms.db import Contest, Executable, Participation, Statement, Submission, \
     SubmissionResult, Task, User, version
 from cmscommon.digest import bytes_digest
-from cmscontrib.DumpExporter import DumpExporter
+from cmscontrib.DumpExporter import DirectoryExportWriter, DumpExporter, \
+    ExportWriter, TarExportWriter
 from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
 
 
@@ -288,5 +291,52 @@ class TestDumpExporter(DatabaseMixin, FileSystemMixin, unittest.TestCase):
         self.assertFileNotInDump(self.exe_digest)
 
 
+class TestExportWriters(FileSystemMixin, unittest.TestCase):
+
+    def add_file(self, writer):
+        writer.add_file(os.path.join("files", "digest"), BytesIO(b"data"), 4)
+
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            ExportWriter()
+
+    def test_directory(self):
+        path = self.get_path("target")
+        writer = DirectoryExportWriter(path)
+        self.add_file(writer)
+        writer.close()
+        with open(os.path.join(path, "files", "digest"), "rb") as f:
+            self.assertEqual(f.read(), b"data")
+
+    def test_directory_abort(self):
+        path = self.get_path("target")
+        writer = DirectoryExportWriter(path)
+        self.add_file(writer)
+        writer.abort()
+        self.assertFalse(os.path.exists(path))
+
+    def test_directory_exists(self):
+        path = self.makedirs("target")
+        with self.assertRaises(OSError):
+            DirectoryExportWriter(path)
+        self.assertTrue(os.path.isdir(path))
+
+    def test_tar(self):
+        path = self.get_path("target.tar.gz")
+        writer = TarExportWriter(path, "w:gz", "target")
+        self.add_file(writer)
+        writer.close()
+        with tarfile.open(path) as archive:
+            self.assertEqual(
+                archive.extractfile("target/files/digest").read(), b"data")
+
+    def test_tar_abort(self):
+        path = self.get_path("target.tar.gz")
+        writer = TarExportWriter(path, "w:gz", "target")
+        self.add_file(writer)
+        writer.abort()
+        self.assertFalse(os.path.exists(path))
+
+
 if __name__ == "__main__":
     unittest.main()
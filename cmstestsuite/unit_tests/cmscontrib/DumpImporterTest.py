@@ -24,7 +24,7 @@ import unittest
 
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
-from cms.db import Contest, User, FSObject, Session, version
+from cms.db import Contest, User, FSObject, Session, Task, version
 from cmscommon.digest import bytes_digest
 from cmscontrib.DumpImporter import DumpImporter
 from cmstestsuite.unit_tests.filesystemmixin import FileSystemMixin
@@ -144,7 +144,7 @@ class TestDumpImporter(DatabaseMixin, FileSystemMixin, unittest.TestCase):
 
     def do_import(self, drop=False, load_files=True,
                   skip_generated=False, skip_submissions=False,
-                  skip_users=False):
+                  skip_users=False, bulk=False):
         """Create an importer and call do_import in a convenient way"""
         return DumpImporter(
             drop,
@@ -154,7 +154,8 @@ class TestDumpImporter(DatabaseMixin, FileSystemMixin, unittest.TestCase):
             skip_generated=skip_generated,
             skip_submissions=skip_submissions,
             skip_user_tests=False,
-            skip_users=skip_users).do_import()
+            skip_users=skip_users,
+            bulk=bulk).do_import()
 
     def write_dump(self, dump):
         destination = self.get_path("contest.json")
@@ -241,6 +242,60 @@ class TestDumpImporter(DatabaseMixin, FileSystemMixin, unittest.TestCase):
         self.assertFileInDb(
             TestDumpImporter.NON_GENERATED_FILE_DIGEST, "subsource", b"source")
 
+    def test_bulk_add_refers_to_existing(self):
+        """Objects already in the database are referred to by the
+        inserted ones, and not inserted again.
+
+        """
+        contest = self.add_contest()
+        self.session.flush()
+        task = self.get_task(contest=contest)
+        # The backref cascaded it into the session, as the importer's
+        # objects are not.
+        self.session.expunge(task)
+
+        DumpImporter(False, self.base_dir, load_files=False, load_model=True,
+                     skip_generated=False, skip_submissions=False,
+                     skip_user_tests=False, skip_users=False,
+                     bulk=True).bulk_add(self.session, [task])
+
+        self.assertIsNotNone(task.id)
+        self.assertEqual(
+            self.session.query(Task.contest_id)
+            .filter(Task.id == task.id).scalar(), contest.id)
+        self.assertEqual(self.session.query(Contest)
+                         .filter(Contest.id == contest.id).count(), 1)
+
+    def test_import_bulk(self):
+        """Test importing everything with bulk inserts."""
+        self.write_dump(TestDumpImporter.DUMP)
+        self.write_files(TestDumpImporter.FILES)
+        self.assertTrue(self.do_import(bulk=True))
+
+        self.assertContestInDb("contestname", "contest description 你好",
+                               [("taskname", "task title")],
+                               [("username", "Last Name")])
+        self.assertContestInDb(
+            self.other_contest_name, self.other_contest_description, [], [])
+        contest = self.session.query(Contest)\
+            .filter(Contest.name == "contestname").one()
+        self.assertEqual(contest.main_group.name, "default")
+        task = contest.tasks[0]
+        self.assertEqual(task.active_dataset.description,
+                         "dataset description")
+        submission, = task.submissions
+        self.assertEqual(submission.participation.user.username, "username")
+        self.assertEqual(submission.files["source"].digest,
+                         TestDumpImporter.NON_GENERATED_FILE_DIGEST)
+        self.assertEqual(
+            submission.get_result(task.active_dataset).executables["exe"]
+            .digest, TestDumpImporter.GENERATED_FILE_DIGEST)
+
+        self.assertFileInDb(
+            TestDumpImporter.GENERATED_FILE_DIGEST, "desc", b"content")
+        self.assertFileInDb(
+            TestDumpImporter.NON_GENERATED_FILE_DIGEST, "subsource", b"source")
+
     def test_import_with_drop(self):
         """Test importing everything, but dropping existing data."""
         self.write_dump(TestDumpImporter.DUMP)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the fingerprints of the importers' inputs."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cmscontrib import fingerprint_paths
+
+
+class TestFingerprintPaths(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.base = tempfile.mkdtemp()
+        self.task = os.path.join(self.base, "task")
+        self.write("task/statement.pdf", "statement")
+        self.write("task/input/input0.txt", "1 2")
+        self.write("task.yaml", "name: task")
+
+    def tearDown(self):
+        shutil.rmtree(self.base)
+        super().tearDown()
+
+    def write(self, name, content):
+        path = os.path.join(self.base, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wt", encoding="utf-8") as f:
+            f.write(content)
+
+    def fingerprint(self):
+        return fingerprint_paths(
+            [self.task, os.path.join(self.base, "task.yaml")])
+
+    def test_stable(self):
+        self.assertIsNotNone(self.fingerprint())
+        self.assertEqual(self.fingerprint(), self.fingerprint())
+
+    def test_content_changed(self):
+        before = self.fingerprint()
+        self.write("task/input/input0.txt", "1 3")
+        self.assertNotEqual(before, self.fingerprint())
+
+    def test_file_added(self):
+        before = self.fingerprint()
+        self.write("task/input/input1.txt", "")
+        self.assertNotEqual(before, self.fingerprint())
+
+    def test_file_moved(self):
+        # Same files, but attributed to another of the paths.
+        before = fingerprint_paths([self.task, self.base])
+        self.assertNotEqual(before, fingerprint_paths([self.base, self.task]))
+
+    def test_hidden_ignored(self):
+        before = self.fingerprint()
+        self.write("task/.import_error", "")
+        self.write("task/.git/HEAD", "ref")
+        self.assertEqual(before, self.fingerprint())
+
+    def test_missing(self):
+        self.assertIsNone(
+            fingerprint_paths([os.path.join(self.base, "missing")]))
+
+
+if __name__ == "__main__":
+    unittest.main()
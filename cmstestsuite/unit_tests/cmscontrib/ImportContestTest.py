@@ -19,6 +19,7 @@
 """Tests for the ImportContest script"""
 
 import unittest
+from unittest.mock import patch
 
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
@@ -32,6 +33,7 @@ def fake_loader_factory(
     contest_has_changed: bool = False,
     tasks: list[tuple[str, bool]] | None = None,
     usernames: list[str] | None = None,
+    fingerprints: dict[str, str] | None = None,
 ):
     """Return a Loader class always returning the same information
 
@@ -39,6 +41,7 @@ def fake_loader_factory(
     contest_has_changed: what to return from contest_has_changed
     tasks: list of task names and whether they have changed
     usernames: list of usernames of participations
+    fingerprints: fingerprints of the tasks, by name
 
     """
 
@@ -51,6 +54,7 @@ def fake_loader_factory(
         "has_changed": has_changed
     }) for t, has_changed in tasks)
     participations = [{"username": u} for u in usernames]
+    fingerprints = fingerprints if fingerprints is not None else {}
 
     class FakeLoader(ContestLoader):
         @staticmethod
@@ -76,6 +80,9 @@ def fake_loader_factory(
                 def task_has_changed(self):
                     return tasks_by_name.get(taskname, None)["has_changed"]
 
+                def get_fingerprint(self):
+                    return fingerprints.get(taskname)
+
             return FakeTaskLoader(self.path, self.file_cacher)
 
     return FakeLoader
@@ -115,13 +122,14 @@ class TestImportContest(DatabaseMixin, unittest.TestCase):
     def do_import(contest, tasks, participations,
                   contest_has_changed=False, update_contest=False,
                   import_tasks=False, update_tasks=False,
-                  delete_stale_participations=False):
+                  delete_stale_participations=False, fingerprints=None):
         """Create an importer and call do_import in a convenient way"""
         return ContestImporter(
             "path", True, False, import_tasks, update_contest, update_tasks,
             False, delete_stale_participations,
             fake_loader_factory(contest, contest_has_changed,
-                                tasks, participations)).do_import()
+                                tasks, participations,
+                                fingerprints)).do_import()
 
     def assertContestInDb(self, name, description, task_names_and_titles,
                           usernames_and_last_names):
@@ -281,6 +289,59 @@ class TestImportContest(DatabaseMixin, unittest.TestCase):
                                [(self.username, self.last_name)])
         self.assertSubmissionCount(1)
 
+    def test_update_task_same_fingerprint(self):
+        # The first update stores the fingerprint, the second one skips
+        # the task even if the loader says it has changed.
+        contest = self.get_contest(name=self.name,
+                                   description=self.description)
+        task = self.get_task(name=self.task_name, title="first_title",
+                             contest=contest)
+        ret = self.do_import(contest, [(task, True)], [],
+                             update_contest=True, update_tasks=True,
+                             fingerprints={self.task_name: "fp"})
+        self.assertTrue(ret)
+        self.assertContestInDb(self.name, self.description,
+                               [(self.task_name, "first_title")],
+                               [(self.username, self.last_name)])
+
+        contest = self.get_contest(name=self.name,
+                                   description=self.description)
+        task = self.get_task(name=self.task_name, title="second_title",
+                             contest=contest)
+        ret = self.do_import(contest, [(task, True)], [],
+                             update_contest=True, update_tasks=True,
+                             fingerprints={self.task_name: "fp"})
+        self.assertTrue(ret)
+        self.assertContestInDb(self.name, self.description,
+                               [(self.task_name, "first_title")],
+                               [(self.username, self.last_name)])
+
+        ret = self.do_import(contest, [(task, True)], [],
+                             update_contest=True, update_tasks=True,
+                             fingerprints={self.task_name: "other"})
+        self.assertTrue(ret)
+        self.assertContestInDb(self.name, self.description,
+                               [(self.task_name, "second_title")],
+                               [(self.username, self.last_name)])
+
+    def test_update_task_not_changed_no_fingerprint(self):
+        # If the loader says the task has not changed, the fingerprint
+        # (which reads all its data) is not even computed.
+        contest = self.get_contest(name=self.name,
+                                   description=self.description)
+        task = self.get_task(name=self.task_name, title="new_title",
+                             contest=contest)
+        with patch("cmscontrib.ImportContest.task_fingerprint") \
+                as task_fingerprint:
+            ret = self.do_import(contest, [(task, False)], [],
+                                 update_contest=True, update_tasks=True,
+                                 fingerprints={self.task_name: "fp"})
+        self.assertTrue(ret)
+        task_fingerprint.assert_not_called()
+        self.assertContestInDb(self.name, self.description,
+                               [(self.task_name, self.task_title)],
+                               [(self.username, self.last_name)])
+
     def test_import_participation_in_db(self):
         # Completely new contest, no tasks, a new participation for an existing
         # user, whose existing submission should be retained.
@@ -23,15 +23,25 @@
 
 """
 
+import atexit
+import functools
 import os
 import random
 import shutil
+import tempfile
 import unittest
 from io import BytesIO
+from unittest.mock import Mock, patch
+
+import gevent
 
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
-from cms.db.filecacher import FileCacher
+from cms import config
+from cms.db import FSObject
+from cms.db.filecacher import ChunkedBackend, CompressedBackend, \
+    FileCacher, FSBackend, KnownDigests, content_defined_chunks, \
+    copyfileobj, known_digests, _GEAR, _gear_flags
 from cmscommon.digest import Digester, bytes_digest
 
 
@@ -113,6 +123,34 @@ class HashingFile:
         pass
 
 
+class TestCopyFileObj(unittest.TestCase):
+
+    def read_sizes(self, content, *args):
+        source = BytesIO(content)
+        sizes = []
+        read = source.read
+
+        def recording_read(size):
+            sizes.append(size)
+            return read(size)
+
+        source.read = recording_read
+        destination = BytesIO()
+        copyfileobj(source, destination, *args)
+        self.assertEqual(destination.getvalue(), content)
+        return sizes
+
+    def test_fixed_buffer(self):
+        self.assertEqual(self.read_sizes(b"x" * 10, 4), [4, 4, 4, 4])
+
+    def test_growing_buffer(self):
+        self.assertEqual(self.read_sizes(b"x" * 100, 4, 32),
+                         [4, 8, 16, 32, 32, 32, 32])
+
+    def test_growing_buffer_small_file(self):
+        self.assertEqual(self.read_sizes(b"x" * 3, 4, 32), [4, 4])
+
+
 class TestFileCacherBase:
     """Base class for performing tests for the FileCacher service.
 
@@ -123,6 +161,9 @@ class TestFileCacherBase:
 
     def setUp(self, file_cacher):
         """Common initialization that should be called by derived classes."""
+        # The storages are emptied between tests, behind the back of
+        # the file cachers.
+        known_digests.clear()
         self.file_cacher = file_cacher
         self.cache_base_path = self.file_cacher.file_dir
         self.cache_path = None
@@ -358,6 +399,112 @@ class TestFileCacherBase:
         # Check that the file was stored correctly.
         self.check_stored_file(digest)
 
+    def test_put_files(self):
+        """Store many files at once, some of them already stored or
+        duplicated.
+
+        """
+        contents = [os.urandom(100), os.urandom(2 * FileCacher.CHUNK_SIZE),
+                    os.urandom(100)]
+        contents.append(contents[0])
+        existing_digest = self.file_cacher.put_file_content(contents[2])
+        self.file_cacher.backend.create_file = Mock(
+            wraps=self.file_cacher.backend.create_file)
+
+        digests = self.file_cacher.put_files(
+            [(lambda content=content: BytesIO(content), "File %d" % i)
+             for i, content in enumerate(contents)])
+
+        self.assertEqual(digests, [bytes_digest(c) for c in contents])
+        self.assertEqual(digests[2], existing_digest)
+        # Only the first two files needed to be uploaded.
+        self.assertEqual(
+            sorted(call.args[0]
+                   for call in self.file_cacher.backend.create_file
+                   .call_args_list),
+            sorted(digests[:2]))
+        for digest in digests:
+            self.check_stored_file(digest)
+        for digest in set(digests):
+            self.file_cacher.delete(digest)
+
+    def test_put_files_empty(self):
+        self.assertEqual(self.file_cacher.put_files([]), [])
+
+    def test_file_contents(self):
+        """Store and retrieve many files at once."""
+        contents = [os.urandom(100), b"", os.urandom(100)]
+        digests = [bytes_digest(content) for content in contents]
+        backend = self.file_cacher.backend
+        backend.put_file_contents(
+            [(digest, content, "File")
+             for digest, content in zip(digests, contents)])
+        # Already stored files are left as they are.
+        backend.put_file_contents([(digests[0], contents[0], "File")])
+
+        self.assertEqual(backend.get_file_contents(digests[::-1]),
+                         contents[::-1])
+        with self.assertRaises(KeyError):
+            backend.get_file_contents([bytes_digest(b"missing")])
+        for digest in digests:
+            self.check_stored_file(digest)
+            self.file_cacher.delete(digest)
+
+    def test_put_files_changed(self):
+        """A file changing between hashing and uploading is not stored,
+        and what was written of it is discarded.
+
+        """
+        contents = [os.urandom(100), os.urandom(100)]
+        opened = iter(contents)
+        self.file_cacher.backend.discard_file = Mock(
+            wraps=self.file_cacher.backend.discard_file)
+
+        with self.assertRaises(RuntimeError):
+            self.file_cacher.put_files([(lambda: BytesIO(next(opened)), "")])
+
+        self.file_cacher.backend.discard_file.assert_called_once()
+        for content in contents:
+            with self.assertRaises(KeyError):
+                self.file_cacher.backend.describe(bytes_digest(content))
+
+    def test_known_digests(self):
+        """Storing again a file stored by this process does not upload
+        it again, unless it was deleted in the meantime.
+
+        """
+        content = os.urandom(100)
+        digest = self.file_cacher.put_file_content(content)
+        self.file_cacher.backend.create_file = Mock(
+            wraps=self.file_cacher.backend.create_file)
+
+        # Also from another file cacher on the same storage.
+        for file_cacher in [self.file_cacher, type(self).make_file_cacher()]:
+            file_cacher.backend.create_file = \
+                self.file_cacher.backend.create_file
+            self.assertEqual(file_cacher.put_file_content(content), digest)
+        self.file_cacher.backend.create_file.assert_not_called()
+
+        self.file_cacher.delete(digest)
+        self.assertEqual(self.file_cacher.put_file_content(content), digest)
+        self.file_cacher.backend.create_file.assert_called_once_with(digest)
+        self.check_stored_file(digest)
+        self.file_cacher.backend.create_file.reset_mock()
+
+        # Also if deleted by another process, without this one knowing.
+        self.file_cacher.backend.delete(digest)
+        self.assertTrue(self.file_cacher._is_known(digest))
+        self.assertEqual(self.file_cacher.put_file_content(content), digest)
+        self.file_cacher.backend.create_file.assert_called_once_with(digest)
+        self.check_stored_file(digest)
+        self.assertEqual(self.file_cacher.put_files(
+            [(functools.partial(BytesIO, content), "")]), [digest])
+        self.file_cacher.backend.delete(digest)
+        self.assertEqual(self.file_cacher.put_files(
+            [(functools.partial(BytesIO, content), "")]), [digest])
+        self.check_stored_file(digest)
+        self.file_cacher.delete(digest)
+
 
 class TestFileCacherDB(TestFileCacherBase, DatabaseMixin, unittest.TestCase):
     """Tests for the FileCacher service with a database backend."""
@@ -367,7 +514,101 @@ class TestFileCacherDB(TestFileCacherBase, DatabaseMixin, unittest.TestCase):
 
     def setUp(self):
         DatabaseMixin.setUp(self)
-        TestFileCacherBase.setUp(self, FileCacher())
+        TestFileCacherBase.setUp(self, self.make_file_cacher())
+
+    @staticmethod
+    def make_file_cacher():
+        return FileCacher()
+
+    def test_stage_files(self):
+        """Small files are stored inline, when the session of the
+        caller is committed.
+
+        """
+        contents = [os.urandom(100), os.urandom(200)]
+        contents.append(contents[0])
+        existing_digest = self.file_cacher.put_file_content(contents[1])
+
+        digests = self.file_cacher.stage_files(
+            self.session,
+            [(content, "File %d" % i) for i, content in enumerate(contents)])
+        self.assertEqual(digests, [bytes_digest(c) for c in contents])
+        self.session.commit()
+
+        fso = FSObject.get_from_digest(digests[0], self.session)
+        self.assertIsNone(fso.loid)
+        self.assertEqual(fso.description, "File 0")
+        # The file already stored is left as it was.
+        fso = FSObject.get_from_digest(existing_digest, self.session)
+        self.assertIsNotNone(fso.loid)
+        for digest, content in zip(digests, contents):
+            self.assertEqual(self.file_cacher.get_file_content(digest),
+                             content)
+            self.assertEqual(self.file_cacher.get_size(digest),
+                             len(content))
+        for digest in set(digests):
+            self.file_cacher.delete(digest)
+        self.assertIsNone(FSObject.get_from_digest(digests[0], self.session))
+
+    def test_stage_files_deleted_elsewhere(self):
+        """Known files are staged again, as another process may have
+        deleted them.
+
+        """
+        content = os.urandom(100)
+        digest = self.file_cacher.put_file_content(content)
+        # As if deleted by another process.
+        self.file_cacher.backend.delete(digest)
+        self.assertTrue(self.file_cacher._is_known(digest))
+
+        self.file_cacher.stage_files(self.session, [(content, "File")])
+        self.session.commit()
+        self.file_cacher.drop(digest)
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+
+    def test_stage_files_with_magic(self):
+        """Staged files starting like compressed files or manifests are
+        read as they are.
+
+        """
+        contents = [CompressedBackend.MAGIC + b"g" + os.urandom(100),
+                    ChunkedBackend.MAGIC + os.urandom(100)]
+        for name, value in [("file_compression", "gzip"),
+                            ("chunked_storage", True)]:
+            patcher = patch.object(config.global_, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        file_cacher = FileCacher()
+        digests = file_cacher.stage_files(
+            self.session, [(content, "File") for content in contents])
+        self.session.commit()
+        for digest, content in zip(digests, contents):
+            self.assertEqual(file_cacher.get_size(digest), len(content))
+            self.assertEqual(file_cacher.get_file_content(digest), content)
+
+    def test_put_files_changed_unlinks(self):
+        """The large object of a file that changed while being stored
+        is removed.
+
+        """
+        def count_lobjects():
+            return self.session.execute(
+                "SELECT count(*) FROM pg_largeobject_metadata;").scalar()
+
+        before = count_lobjects()
+        opened = iter([os.urandom(100), os.urandom(100)])
+        with self.assertRaises(RuntimeError):
+            self.file_cacher.put_files([(lambda: BytesIO(next(opened)), "")])
+        self.assertEqual(count_lobjects(), before)
+
+    def test_stage_files_rollback(self):
+        """Staged files are not stored if the session is rolled back."""
+        digest, = self.file_cacher.stage_files(
+            self.session, [(os.urandom(100), "File")])
+        self.session.rollback()
+
+        with self.assertRaises(KeyError):
+            self.file_cacher.describe(digest)
 
 
 class TestFileCacherFS(TestFileCacherBase, unittest.TestCase):
@@ -377,11 +618,388 @@ class TestFileCacherFS(TestFileCacherBase, unittest.TestCase):
     __test__ = True
 
     def setUp(self):
-        super().setUp(FileCacher(path="fs-storage"))
+        super().setUp(self.make_file_cacher())
+
+    @staticmethod
+    def make_file_cacher():
+        return FileCacher(path="fs-storage")
+
+    def tearDown(self):
+        shutil.rmtree("fs-storage", ignore_errors=True)
+
+    def test_put_files_changed_removes_temp_file(self):
+        opened = iter([os.urandom(100), os.urandom(100)])
+        with self.assertRaises(RuntimeError):
+            self.file_cacher.put_files([(lambda: BytesIO(next(opened)), "")])
+        self.assertEqual(os.listdir("fs-storage"), [])
+
+    def test_stage_files(self):
+        """Without a database, staged files are stored right away."""
+        contents = [os.urandom(100), os.urandom(100)]
+        digests = self.file_cacher.stage_files(
+            None, [(content, "File") for content in contents])
+
+        self.assertEqual(digests, [bytes_digest(c) for c in contents])
+        for digest, content in zip(digests, contents):
+            self.assertEqual(self.file_cacher.get_file_content(digest),
+                             content)
+
+
+class TestFileCacherCompressedFS(TestFileCacherBase, unittest.TestCase):
+    """Tests for the FileCacher service with a compressed filesystem
+    backend.
+
+    """
+
+    # Tell pytest to collect this class as test
+    __test__ = True
+
+    def setUp(self):
+        patcher = patch.object(config.global_, "file_compression", "gzip")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super().setUp(self.make_file_cacher())
+
+    def tearDown(self):
+        shutil.rmtree("fs-storage", ignore_errors=True)
+
+    @staticmethod
+    def make_file_cacher():
+        return FileCacher(path="fs-storage")
+
+    def test_compressed(self):
+        content = b"0 1 2 3 4 5 6 7 8 9\n" * 10000
+        digest = self.file_cacher.put_file_content(content)
+        self.assertIsInstance(self.file_cacher.backend.backend,
+                              CompressedBackend)
+        self.assertLess(os.path.getsize(os.path.join("fs-storage", digest)),
+                        len(content) // 10)
+        self.assertEqual(self.file_cacher.get_size(digest), len(content))
+        self.file_cacher.drop(digest)
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+        self.assertTrue(self.file_cacher.check_backend_integrity())
+
+    def test_uncompressed(self):
+        # Files stored before enabling compression are still readable.
+        content = os.urandom(100)
+        with patch.object(config.global_, "file_compression", None):
+            digest = FileCacher(path="fs-storage").put_file_content(content)
+        self.assertEqual(self.file_cacher.get_size(digest), len(content))
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+
+    def test_compressed_empty(self):
+        digest = self.file_cacher.put_file_content(b"")
+        self.file_cacher.drop(digest)
+        self.assertEqual(self.file_cacher.get_file_content(digest), b"")
+
+    def test_compression_disabled(self):
+        # Compressed files are still readable once compression is
+        # disabled, but new files are stored as they are.
+        content = b"0 1 2 3 4 5 6 7 8 9\n" * 10000
+        digest = self.file_cacher.put_file_content(content)
+        with patch.object(config.global_, "file_compression", None):
+            file_cacher = FileCacher(path="fs-storage")
+            self.assertEqual(file_cacher.get_size(digest), len(content))
+            self.assertEqual(file_cacher.get_file_content(digest), content)
+            other = content + b"more"
+            other_digest = file_cacher.put_file_content(other)
+        with open(os.path.join("fs-storage", other_digest), "rb") as f:
+            self.assertEqual(f.read(), other)
+        self.assertEqual(self.file_cacher.get_file_content(other_digest),
+                         other)
+
+    def test_uncompressed_with_magic(self):
+        # Files stored as they are that look like compressed ones.
+        for content in [CompressedBackend.MAGIC + b"gAAAAAAAA",
+                        CompressedBackend.MAGIC + b"g" + b"A" * 100]:
+            with patch.object(config.global_, "file_compression", None):
+                digest = FileCacher(path="fs-storage").put_file_content(
+                    content)
+            self.assertEqual(self.file_cacher.get_size(digest), len(content))
+            self.assertEqual(self.file_cacher.get_file_content(digest),
+                             content)
+
+    def test_compressed_with_magic(self):
+        content = CompressedBackend.MAGIC + os.urandom(100)
+        digest = self.file_cacher.put_file_content(content)
+        self.file_cacher.drop(digest)
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+
+    def test_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            CompressedBackend(FSBackend("fs-storage"), "lzma")
+
+
+class TestFileCacherChunkedFS(TestFileCacherBase, unittest.TestCase):
+    """Tests for the FileCacher service with a chunked (and
+    compressed) filesystem backend.
+
+    """
+
+    # Tell pytest to collect this class as test
+    __test__ = True
+
+    def setUp(self):
+        for name, value in [("file_compression", "gzip"),
+                            ("chunked_storage", True)]:
+            patcher = patch.object(config.global_, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        super().setUp(self.make_file_cacher())
 
     def tearDown(self):
         shutil.rmtree("fs-storage", ignore_errors=True)
 
+    @staticmethod
+    def make_file_cacher():
+        return FileCacher(path="fs-storage")
+
+    def test_chunked(self):
+        content = random.randbytes(3 * 1024 * 1024)
+        digest = self.file_cacher.put_file_content(content)
+        self.assertIsNone(self.file_cacher.backend.read_manifest(digest))
+
+        with BytesIO(content) as src:
+            other_digest = self.file_cacher.put_file_from_fobj(
+                src, "similar", chunked=True)
+        self.assertEqual(other_digest, digest)
+        self.assertIsNone(self.file_cacher.backend.read_manifest(digest))
+
+        similar = content[:1000000] + b"inserted" + content[1000000:]
+        with BytesIO(similar) as src:
+            similar_digest = self.file_cacher.put_file_from_fobj(
+                src, "similar", chunked=True)
+        manifest = self.file_cacher.backend.read_manifest(similar_digest)
+        self.assertIsNotNone(manifest)
+        self.assertEqual(sum(size for _, size in manifest), len(similar))
+
+        self.assertEqual(self.file_cacher.get_size(similar_digest),
+                         len(similar))
+        self.file_cacher.drop(similar_digest)
+        self.assertEqual(self.file_cacher.get_file_content(similar_digest),
+                         similar)
+        self.assertTrue(self.file_cacher.check_backend_integrity())
+
+    def test_chunks_read_in_batches(self):
+        content = random.randbytes(3 * 1024 * 1024)
+        with BytesIO(content) as src:
+            digest = self.file_cacher.put_file_from_fobj(src, chunked=True)
+        manifest = self.file_cacher.backend.read_manifest(digest)
+        self.assertGreater(len(manifest), 2)
+        chunk_backend = self.file_cacher.backend.backend
+        chunk_backend.get_file_contents = Mock(
+            wraps=chunk_backend.get_file_contents)
+
+        self.file_cacher.drop(digest)
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+        chunk_backend.get_file_contents.assert_called_once_with(
+            [chunk_digest for chunk_digest, _ in manifest])
+
+        # Batches hold at least a chunk, even if bigger than BATCH_SIZE.
+        chunk_backend.get_file_contents.reset_mock()
+        with patch.object(ChunkedBackend, "BATCH_SIZE", 1):
+            self.file_cacher.drop(digest)
+            self.assertEqual(self.file_cacher.get_file_content(digest),
+                             content)
+        self.assertEqual(chunk_backend.get_file_contents.call_count,
+                         len(manifest))
+
+    def test_chunks_shared(self):
+        content = random.randbytes(3 * 1024 * 1024)
+        digests = []
+        for data in [content, content[:2000000] + b"x" + content[2000000:]]:
+            with BytesIO(data) as src:
+                digests.append(self.file_cacher.put_file_from_fobj(
+                    src, chunked=True))
+        chunks = [set(chunk_digest for chunk_digest, _
+                      in self.file_cacher.backend.read_manifest(digest))
+                  for digest in digests]
+        # All chunks but the ones around the change are shared.
+        self.assertLessEqual(len(chunks[1] - chunks[0]), 2)
+        self.assertEqual(set(digest for digest, _ in self.file_cacher.list()),
+                         chunks[0] | chunks[1] | set(digests))
+
+    def test_not_chunked_with_magic(self):
+        # Files stored whole that look like manifests.
+        content = random.randbytes(3 * 1024 * 1024)
+        with BytesIO(content) as src:
+            chunked_digest = self.file_cacher.put_file_from_fobj(
+                src, chunked=True)
+        manifest = self.file_cacher.backend.read_manifest(chunked_digest)
+        with self.file_cacher.backend.backend.get_file(chunked_digest) \
+                as fobj:
+            crafted = fobj.read()
+        for other in [ChunkedBackend.MAGIC + os.urandom(100), crafted]:
+            digest = self.file_cacher.put_file_content(other)
+            self.assertIsNone(self.file_cacher.backend.read_manifest(digest))
+            self.assertEqual(self.file_cacher.get_size(digest), len(other))
+            self.file_cacher.drop(digest)
+            self.assertEqual(self.file_cacher.get_file_content(digest),
+                             other)
+        self.assertEqual(
+            self.file_cacher.backend.read_manifest(chunked_digest), manifest)
+
+    def test_chunking_disabled(self):
+        # Files stored in chunks are still readable once chunking is
+        # disabled, but new files are stored whole.
+        content = random.randbytes(3 * 1024 * 1024)
+        with BytesIO(content) as src:
+            digest = self.file_cacher.put_file_from_fobj(src, chunked=True)
+        self.assertIsNotNone(self.file_cacher.backend.read_manifest(digest))
+        with patch.object(config.global_, "chunked_storage", False):
+            file_cacher = FileCacher(path="fs-storage")
+            self.assertEqual(file_cacher.get_size(digest), len(content))
+            self.assertEqual(file_cacher.get_file_content(digest), content)
+            other = content + b"more"
+            with BytesIO(other) as src:
+                other_digest = file_cacher.put_file_from_fobj(
+                    src, chunked=True)
+        self.assertIsNone(
+            self.file_cacher.backend.read_manifest(other_digest))
+        self.assertEqual(self.file_cacher.get_file_content(other_digest),
+                         other)
+
+    def test_small_file(self):
+        content = random.randbytes(ChunkedBackend.MIN_FILE_SIZE - 1)
+        with BytesIO(content) as src:
+            digest = self.file_cacher.put_file_from_fobj(src, chunked=True)
+        self.assertIsNone(self.file_cacher.backend.read_manifest(digest))
+        self.assertEqual(self.file_cacher.get_file_content(digest), content)
+
+
+class TestContentDefinedChunks(unittest.TestCase):
+
+    def chunks(self, content):
+        return list(content_defined_chunks(BytesIO(content), 64, 256, 1024))
+
+    def test_sizes(self):
+        content = random.randbytes(100000)
+        chunks = self.chunks(content)
+        self.assertEqual(b"".join(chunks), content)
+        for chunk in chunks[:-1]:
+            self.assertGreaterEqual(len(chunk), 64)
+            self.assertLessEqual(len(chunk), 1024)
+
+    def test_empty(self):
+        self.assertEqual(self.chunks(b""), [])
+
+    def test_gear_flags(self):
+        content = random.randbytes(1000)
+        threshold = (1 << 32) // 16
+        expected = []
+        h = 0
+        for byte in content:
+            h = ((h << 1) + _GEAR[byte]) & 0xFFFFFFFF
+            expected.append(0 if h < threshold else 1)
+        self.assertEqual(list(_gear_flags(content, 1000, threshold)),
+                         expected)
+        # Padding does not change the hashes before it.
+        self.assertEqual(
+            list(_gear_flags(content[:500], 1000, threshold)[:500]),
+            expected[:500])
+
+    def test_resynchronize(self):
+        content = random.randbytes(100000)
+        chunks = self.chunks(content)
+        other_chunks = self.chunks(content[:50000] + b"x" + content[50000:])
+        self.assertEqual(other_chunks[:len(chunks) // 3],
+                         chunks[:len(chunks) // 3])
+        self.assertEqual(other_chunks[-len(chunks) // 3:],
+                         chunks[-len(chunks) // 3:])
+
+
+class TestKnownDigests(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.known = KnownDigests(size=2, ttl=10)
+
+    def test_bounded(self):
+        self.known.add(("fs", "a"))
+        self.known.add(("fs", "b"))
+        # Using "a" makes "b" the least recently used.
+        self.assertIn(("fs", "a"), self.known)
+        self.known.add(("fs", "c"))
+        self.assertIn(("fs", "a"), self.known)
+        self.assertNotIn(("fs", "b"), self.known)
+        self.assertIn(("fs", "c"), self.known)
+        self.assertNotIn(("db", "a"), self.known)
+
+    def test_expiry(self):
+        with patch("cms.db.filecacher.time.monotonic", return_value=100.0):
+            self.known.add(("fs", "a"))
+        with patch("cms.db.filecacher.time.monotonic", return_value=105.0):
+            self.assertIn(("fs", "a"), self.known)
+        with patch("cms.db.filecacher.time.monotonic", return_value=111.0):
+            self.assertNotIn(("fs", "a"), self.known)
+
+    def test_discard(self):
+        self.known.add(("fs", "a"))
+        self.known.discard(("fs", "a"))
+        self.known.discard(("fs", "b"))
+        self.assertNotIn(("fs", "a"), self.known)
+
+
+class TestFileCacherSharedCache(unittest.TestCase):
+    """Tests for the coordination of the downloads to the shared cache."""
+
+    def setUp(self):
+        super().setUp()
+        self.base_dir = tempfile.mkdtemp()
+        # File cachers remove their temporary directories at exit, so we
+        # can remove the base directory only after them.
+        atexit.register(shutil.rmtree, self.base_dir, ignore_errors=True)
+        patcher = patch.object(config.global_, "cache_dir",
+                               os.path.join(self.base_dir, "cache"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        storage = os.path.join(self.base_dir, "storage")
+        self.content = b"testcase" * 1000
+        self.digest = FileCacher(path=storage).put_file_content(self.content)
+
+        # Three services on the same host, sharing the cache.
+        self.file_cachers = [FileCacher(Mock(), path=storage)
+                             for _ in range(3)]
+        self.downloads = 0
+        for file_cacher in self.file_cachers:
+            get_file = file_cacher.backend.get_file
+            file_cacher.backend.get_file = self.slow_get_file(get_file)
+
+    def slow_get_file(self, get_file):
+        def wrapped(digest):
+            self.downloads += 1
+            # Give the other file cacher the chance to try too.
+            gevent.sleep(0.1)
+            return get_file(digest)
+        return wrapped
+
+    def assertNoLockFiles(self):
+        self.assertEqual(os.listdir(self.file_cachers[0].lock_dir), [])
+
+    def test_single_download(self):
+        # The two waiting processes opened the lock file that the first
+        # one removes when done.
+        greenlets = [gevent.spawn(file_cacher.get_file_content, self.digest)
+                     for file_cacher in self.file_cachers]
+        gevent.joinall(greenlets, raise_error=True)
+        self.assertEqual([greenlet.value for greenlet in greenlets],
+                         [self.content] * 3)
+        self.assertEqual(self.downloads, 1)
+        self.assertNoLockFiles()
+
+    def test_download_after_failure(self):
+        # If the first download fails, the waiting process downloads
+        # the file itself.
+        self.file_cachers[0].backend.get_file = Mock(side_effect=KeyError)
+        first = gevent.spawn(self.file_cachers[0].cache_file, self.digest)
+        second = gevent.spawn(self.file_cachers[1].cache_file, self.digest)
+        gevent.joinall([first, second])
+        self.assertIsInstance(first.exception, KeyError)
+        self.assertIsNone(second.exception)
+        self.assertEqual(self.downloads, 1)
+        self.assertNoLockFiles()
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the pool of connections of large objects."""
+
+import threading
+import unittest
+from unittest.mock import Mock, patch
+
+import psycopg2
+import psycopg2.extensions
+
+from cms.db.fsobject import LargeObjectConnectionPool
+
+
+def idle_connection():
+    conn = Mock()
+    conn.closed = 0
+    conn.status = psycopg2.extensions.STATUS_READY
+    conn.get_transaction_status.return_value = \
+        psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    return conn
+
+
+class TestLargeObjectConnectionPool(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = patch("cms.db.fsobject.custom_psycopg2_connection",
+                        side_effect=idle_connection)
+        self.connect = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = LargeObjectConnectionPool(2)
+
+    def test_reuse(self):
+        conn = self.pool.get()
+        self.pool.put(conn)
+        self.assertIs(self.pool.get(), conn)
+        self.assertEqual(self.connect.call_count, 1)
+
+    def test_bounded(self):
+        conns = [self.pool.get() for _ in range(3)]
+        self.assertEqual(self.connect.call_count, 3)
+        for conn in conns:
+            self.pool.put(conn)
+        # Only two are kept, the last one is closed.
+        conns[2].close.assert_called_once_with()
+        self.pool.get()
+        self.pool.get()
+        self.pool.get()
+        self.assertEqual(self.connect.call_count, 4)
+
+    def test_dirty_connection_not_reused(self):
+        conn = self.pool.get()
+        conn.get_transaction_status.return_value = \
+            psycopg2.extensions.TRANSACTION_STATUS_INERROR
+        self.pool.put(conn)
+        conn.close.assert_called_once_with()
+        self.assertIsNot(self.pool.get(), conn)
+
+    def test_rolled_back(self):
+        conn = self.pool.get()
+        self.pool.put(conn)
+        conn.rollback.assert_called_once_with()
+        self.assertIs(self.pool.get(), conn)
+
+    def test_rollback_failure(self):
+        conn = self.pool.get()
+        conn.rollback.side_effect = psycopg2.OperationalError()
+        self.pool.put(conn)
+        conn.close.assert_called_once_with()
+
+    def test_threads(self):
+        in_use = set()
+        errors = []
+
+        def work():
+            for _ in range(200):
+                conn = self.pool.get()
+                if conn in in_use:
+                    errors.append(conn)
+                in_use.add(conn)
+                in_use.discard(conn)
+                self.pool.put(conn)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(self.pool._idle), 2)
+
+    def test_recycle(self):
+        with patch("cms.db.fsobject.time.monotonic", return_value=1000.0):
+            conn = self.pool.get()
+            self.pool.put(conn)
+        with patch("cms.db.fsobject.time.monotonic", return_value=1200.0):
+            self.assertIsNot(self.pool.get(), conn)
+        conn.close.assert_called_once_with()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,10 +19,11 @@
 
 """Tests for general utility functions."""
 
+import gzip
 import io
 import unittest
 
-from cms.grading.Sandbox import Truncator
+from cms.grading.Sandbox import Truncator, _ResettingGzipWriter
 
 
 class TestTruncator(unittest.TestCase):
@@ -62,5 +63,30 @@ class TestTruncator(unittest.TestCase):
         self.perform_truncator_test(100, 40, 7)
 
 
+class TestResettingGzipWriter(unittest.TestCase):
+
+    def compress(self, writes):
+        fobj = io.BytesIO()
+        with _ResettingGzipWriter(fobj) as gz_file:
+            for data in writes:
+                gz_file.write(data)
+        return fobj.getvalue()
+
+    def test_valid_gzip(self):
+        writes = [b"a" * 1000, b"", b"hello" * 100]
+        self.assertEqual(gzip.decompress(self.compress(writes)),
+                         b"".join(writes))
+
+    def test_independent_writes(self):
+        # Each write compresses the same regardless of what precedes.
+        data = b"some content " * 100
+        first = self.compress([b"x" * 500, data])
+        second = self.compress([b"y" * 700, data])
+        compressed = self.compress([data])
+        # Skip the gzip header and the trailer.
+        self.assertIn(compressed[10:-8], first)
+        self.assertIn(compressed[10:-8], second)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -19,8 +19,12 @@
 """Tests for the GroupMin score type."""
 
 import unittest
+from unittest.mock import patch
 
+from cms import FEEDBACK_LEVEL_FULL, FEEDBACK_LEVEL_RESTRICTED
 from cms.grading.scoretypes.GroupMin import GroupMin
+from cms.grading.scoretypes.abc import ScoreType
+from cms.locale import Translation
 from cmstestsuite.unit_tests.grading.scoretypes.scoretypetestutils \
     import ScoreTypeTestMixin
 
@@ -184,6 +188,47 @@ class TestGroupMin(ScoreTypeTestMixin, unittest.TestCase):
                 {"idx": 3}
             ])
 
+    def test_html_details_cache(self):
+        ScoreType._html_details_cache.clear()
+        parameters = [[0, "0_*"], [40, "1_*"], [60, "2_*"]]
+        gmin = GroupMin(parameters, self._public_testcases)
+        sr = self.get_submission_result(self._public_testcases)
+        details = gmin.compute_score(sr)[1]
+        key = (1, 2, "score_details")
+        en, it = Translation("en"), Translation("it")
+
+        with patch.object(gmin, "_render_html_details",
+                          wraps=gmin._render_html_details) as render:
+            html = gmin.get_html_details(details, FEEDBACK_LEVEL_FULL, en,
+                                         cache_key=key)
+            self.assertEqual(gmin.get_html_details(
+                details, FEEDBACK_LEVEL_FULL, en, cache_key=key), html)
+            self.assertEqual(render.call_count, 1)
+
+            # Another instance of the same score type can reuse it.
+            other = GroupMin(parameters, self._public_testcases)
+            self.assertEqual(other.get_html_details(
+                details, FEEDBACK_LEVEL_FULL, en, cache_key=key), html)
+            self.assertEqual(render.call_count, 1)
+
+            # Different feedback level or locale.
+            gmin.get_html_details(details, FEEDBACK_LEVEL_RESTRICTED, en,
+                                  cache_key=key)
+            gmin.get_html_details(details, FEEDBACK_LEVEL_FULL, it,
+                                  cache_key=key)
+            self.assertEqual(render.call_count, 3)
+
+            # Different details, e.g., the result was scored again.
+            self.set_outcome(sr, "1_0", 0.0)
+            new_details = gmin.compute_score(sr)[1]
+            self.assertNotEqual(gmin.get_html_details(
+                new_details, FEEDBACK_LEVEL_FULL, en, cache_key=key), html)
+            self.assertEqual(render.call_count, 4)
+
+            # Not cached without a key.
+            gmin.get_html_details(new_details, FEEDBACK_LEVEL_FULL, en)
+            self.assertEqual(render.call_count, 5)
+
 
 if __name__ == "__main__":
     unittest.main()
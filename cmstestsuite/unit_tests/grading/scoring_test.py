@@ -25,7 +25,9 @@ from datetime import timedelta
 
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
-from cms.grading.scoring import task_score
+from cms.db import TaskScore
+from cms.grading.scoring import get_task_score, invalidate_task_scores, \
+    task_score, update_task_score
 from cmscommon.constants import \
     SCORE_MODE_MAX, SCORE_MODE_MAX_SUBTASK, SCORE_MODE_MAX_TOKENED_LAST
 from cmscommon.datetime import make_datetime
@@ -382,5 +384,69 @@ class TestTaskScoreMax(TaskScoreMixin, unittest.TestCase):
         self.assertEqual(self.call(rounded=True), (44.44, False))
 
 
+class TestStoredTaskScore(TaskScoreMixin, unittest.TestCase):
+    """Tests for the TaskScore rows and get_task_score()."""
+
+    def setUp(self):
+        super().setUp()
+        self.task.score_mode = SCORE_MODE_MAX
+        self.add_result(self.at(1), 40.0, public_score=10.0)
+        self.add_result(self.at(2), 60.0, tokened=True, public_score=20.0)
+        self.session.flush()
+
+    def get(self, submissions=None):
+        return get_task_score(self.session, self.participation, self.task,
+                              submissions)
+
+    def test_update(self):
+        update_task_score(self.session, self.participation, self.task)
+        row = self.get()
+        self.assertIsNotNone(row)
+        self.assertEqual((row.score, row.public_score, row.tokened_score,
+                          row.partial), (60.0, 20.0, 60.0, False))
+        self.assertEqual((row.submission_count, row.token_count), (2, 1))
+        self.assertIs(self.get(self.participation.submissions), row)
+
+    def test_invalidate(self):
+        update_task_score(self.session, self.participation, self.task)
+        invalidate_task_scores(self.session, task_id=self.task.id + 1)
+        self.assertIsNotNone(self.get())
+        invalidate_task_scores(self.session, self.participation.id,
+                               self.task.id)
+        self.assertIsNone(self.get())
+        self.assertEqual(self.session.query(TaskScore).count(), 0)
+
+    def test_stale_after_new_submission(self):
+        # As if a submission arrived (and invalidated the scores) while
+        # ScoringService was computing the row from the previous ones.
+        update_task_score(self.session, self.participation, self.task)
+        self.add_submission(participation=self.participation, task=self.task,
+                            timestamp=self.at(3))
+        self.session.flush()
+        self.assertIsNone(self.get())
+        self.assertIsNone(self.get(self.participation.submissions))
+
+    def test_stale_after_new_token(self):
+        update_task_score(self.session, self.participation, self.task)
+        submission = [s for s in self.participation.submissions
+                      if not s.tokened()][0]
+        self.add_token(timestamp=self.at(3), submission=submission)
+        self.session.flush()
+        self.assertIsNone(self.get())
+
+    def test_unofficial_submissions_ignored(self):
+        update_task_score(self.session, self.participation, self.task)
+        self.add_submission(participation=self.participation, task=self.task,
+                            timestamp=self.at(3), official=False)
+        self.session.flush()
+        self.assertIsNotNone(self.get())
+
+    def test_stale_after_dataset_change(self):
+        update_task_score(self.session, self.participation, self.task)
+        self.task.active_dataset = self.add_dataset(task=self.task)
+        self.session.flush()
+        self.assertIsNone(self.get())
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -437,7 +437,7 @@ class TestEvaluate(TaskTypeTestMixin, unittest.TestCase):
         # With get_output, submission is run, output is eval'd, and in addition
         # we store (a truncation of) the user output.
         sandbox.get_file_to_storage.assert_called_once_with(
-            "output.txt", self.file_cacher, ANY, trunc_len=ANY)
+            "output.txt", self.file_cacher, ANY, trunc_len=ANY, chunked=True)
         self.assertEqual(job.user_output, "digest of output.txt")
         self.evaluation_step.assert_called_once()
         self.eval_output.assert_called_once()
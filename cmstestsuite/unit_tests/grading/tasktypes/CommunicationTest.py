@@ -561,7 +561,7 @@ class TestEvaluate(TaskTypeTestMixin, FileSystemMixin, unittest.TestCase):
         # With get_output, submission is run, output is eval'd, and in addition
         # we store (a truncation of) the user output.
         sandbox_mgr.get_file_to_storage.assert_called_once_with(
-            "output.txt", self.file_cacher, ANY, trunc_len=ANY)
+            "output.txt", self.file_cacher, ANY, trunc_len=ANY, chunked=True)
         self.assertEqual(job.user_output, "digest of output.txt")
         self.evaluation_step_after_run.assert_called()
         self.extract_outcome_and_text.assert_called_once()
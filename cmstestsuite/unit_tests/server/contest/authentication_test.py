@@ -29,11 +29,12 @@ from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
 from cms import config
 from cms.server.contest.authentication import validate_login, \
-    authenticate_request
+    authenticate_request, LoginRateLimiter, LoginTokens, PasswordVerifier
 # Prefer build_password (which defaults to a plaintext method) over
 # hash_password (which defaults to bcrypt) as it is a lot faster.
 from cmscommon.crypto import build_password, hash_password
 from cmscommon.datetime import make_datetime
+from cmscommon.tracing import tracer
 
 
 class TestValidateLogin(DatabaseMixin, unittest.TestCase):
@@ -229,7 +230,8 @@ class TestAuthenticateRequest(DatabaseMixin, unittest.TestCase):
             kwargs.get("timestamp", self.timestamp),
             kwargs.get("cookie", self.cookie),
             kwargs.get("authorization", None),
-            ipaddress.ip_address(kwargs.get("ip_address", "10.0.0.1")))
+            ipaddress.ip_address(kwargs.get("ip_address", "10.0.0.1")),
+            kwargs.get("login_tokens", None))
 
     def assertSuccess(self, **kwargs):
         authenticated_participation, cookie, impersonated = \
@@ -451,6 +453,146 @@ class TestAuthenticateRequest(DatabaseMixin, unittest.TestCase):
         self.assertImpersonationSuccess(ip_address="10.0.0.1")
         self.assertImpersonationSuccess(ip_address="10.0.1.1")
 
+    def test_trusted_cookie(self):
+        self.contest.ip_autologin = False
+        self.contest.allow_password_authentication = True
+        login_tokens = LoginTokens(token_duration=10)
+
+        # A recent cookie is not checked against the password, and does
+        # not need to be refreshed.
+        self.user.password = build_password("newpass")
+        cookie = self.assertSuccess(
+            timestamp=self.timestamp + timedelta(seconds=5),
+            login_tokens=login_tokens)
+        self.assertEqual(cookie, self.cookie)
+
+        # The other checks still apply.
+        self.contest.block_hidden_participations = True
+        self.participation.hidden = True
+        self.assertFailure(login_tokens=login_tokens)
+        self.participation.hidden = False
+
+        # An older one is.
+        self.assertFailure(timestamp=self.timestamp + timedelta(seconds=15),
+                           login_tokens=login_tokens)
+        self.user.password = build_password("mypass")
+        cookie = self.assertSuccess(
+            timestamp=self.timestamp + timedelta(seconds=15),
+            login_tokens=login_tokens)
+        self.assertNotEqual(cookie, self.cookie)
+
+        # And so is a revoked one.
+        login_tokens.revoke(self.participation.id,
+                            self.timestamp + timedelta(seconds=16))
+        self.user.password = build_password("newpass")
+        self.assertFailure(timestamp=self.timestamp + timedelta(seconds=17),
+                           cookie=cookie, login_tokens=login_tokens)
+
+    def test_trusted_cookie_deleted_participation(self):
+        self.contest.ip_autologin = False
+        self.contest.allow_password_authentication = True
+        self.session.delete(self.participation)
+        self.assertFailure(login_tokens=LoginTokens(token_duration=10))
+
+
+class TestLoginTokens(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.timestamp = make_datetime()
+        self.login_tokens = LoginTokens(token_duration=10)
+
+    def at(self, seconds):
+        return self.timestamp + timedelta(seconds=seconds)
+
+    def test_duration(self):
+        tokens = self.login_tokens
+        self.assertTrue(tokens.is_trusted(1, self.at(0), self.at(0)))
+        self.assertTrue(tokens.is_trusted(1, self.at(0), self.at(9)))
+        self.assertFalse(tokens.is_trusted(1, self.at(0), self.at(11)))
+
+    @patch.object(config.contest_web_server, "cookie_duration", 5)
+    def test_duration_capped_by_cookie_duration(self):
+        login_tokens = LoginTokens(token_duration=10)
+        self.assertFalse(login_tokens.is_trusted(1, self.at(0), self.at(6)))
+
+    def test_revoke(self):
+        tokens = self.login_tokens
+        tokens.revoke(1, self.at(5))
+        self.assertFalse(tokens.is_trusted(1, self.at(4), self.at(6)))
+        self.assertTrue(tokens.is_trusted(1, self.at(6), self.at(7)))
+        self.assertTrue(tokens.is_trusted(2, self.at(4), self.at(6)))
+
+    def test_forget_old_revocations(self):
+        self.login_tokens.revoke(1, self.at(0))
+        self.login_tokens.revoke(2, self.at(20))
+        self.assertEqual(set(self.login_tokens._revoked), {2})
+
+
+class TestPasswordVerifier(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.verifier = PasswordVerifier(size=2)
+
+    def test_validate(self):
+        count = tracer.get_status().get("login_queue", {"count": 0})["count"]
+        self.assertTrue(self.verifier.validate(
+            hash_password("mypass", method="bcrypt"), "mypass"))
+        self.assertFalse(self.verifier.validate(
+            build_password("mypass"), "otherpass"))
+        status = tracer.get_status()
+        self.assertEqual(status["login_queue"]["count"], count + 2)
+        self.assertIn("login_verify", status)
+
+    def test_invalid_authentication(self):
+        with self.assertRaises(ValueError):
+            self.verifier.validate("not a valid password", "mypass")
+
+
+class TestLoginRateLimiter(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.limiter = LoginRateLimiter(per_ip=3, per_user=2)
+        self.ip = ipaddress.ip_address("10.0.0.1")
+        self.other_ip = ipaddress.ip_address("10.0.0.2")
+
+    def test_per_user(self):
+        self.assertTrue(self.limiter.allow(self.ip, "a", now=0.0))
+        self.assertTrue(self.limiter.allow(self.ip, "a", now=0.0))
+        self.assertFalse(self.limiter.allow(self.ip, "a", now=0.0))
+        self.assertTrue(self.limiter.allow(self.ip, "b", now=0.0))
+        # One attempt every 30 seconds.
+        self.assertTrue(self.limiter.allow(self.ip, "a", now=31.0))
+
+    def test_per_user_is_per_ip(self):
+        # Attempts from another address cannot lock the user out.
+        for _ in range(3):
+            self.limiter.allow(self.other_ip, "a", now=0.0)
+        self.assertFalse(self.limiter.allow(self.other_ip, "a", now=0.0))
+        self.assertTrue(self.limiter.allow(self.ip, "a", now=0.0))
+
+    def test_per_ip(self):
+        for username in ["a", "b", "c"]:
+            self.assertTrue(self.limiter.allow(self.ip, username, now=0.0))
+        self.assertFalse(self.limiter.allow(self.ip, "d", now=0.0))
+        self.assertTrue(self.limiter.allow(self.other_ip, "d", now=0.0))
+        # One attempt every 20 seconds.
+        self.assertTrue(self.limiter.allow(self.ip, "d", now=21.0))
+
+    def test_rejected_attempts_are_free(self):
+        self.limiter.allow(self.ip, "a", now=0.0)
+        self.limiter.allow(self.ip, "a", now=0.0)
+        self.assertFalse(self.limiter.allow(self.ip, "a", now=0.0))
+        # The rejected attempt did not use the IP address' bucket.
+        self.assertTrue(self.limiter.allow(self.ip, "b", now=0.0))
+
+    def test_no_limit(self):
+        limiter = LoginRateLimiter(per_ip=0, per_user=0)
+        for _ in range(100):
+            self.assertTrue(limiter.allow(self.ip, "a", now=0.0))
+
 
 if __name__ == "__main__":
     unittest.main()
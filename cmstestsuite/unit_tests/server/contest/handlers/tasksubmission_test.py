@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the task submission handlers of CWS."""
+
+import json
+import unittest
+from datetime import timedelta
+from unittest.mock import Mock
+
+import tornado.web
+from tornado.httputil import HTTPHeaders, HTTPServerRequest
+
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.db import SubmissionResult, UserTestResult
+from cms.grading.scoring import invalidate_task_scores, update_task_score
+from cms.locale import DEFAULT_TRANSLATION
+from cms.server.contest.handlers.tasksubmission import \
+    BatchStatusHandler, get_public_and_tokened_scores
+from cmscommon.constants import SCORE_MODE_MAX
+
+
+class TestGetPublicAndTokenedScores(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.participation = self.add_participation()
+        self.task = self.add_task(contest=self.participation.contest,
+                                  score_mode=SCORE_MODE_MAX,
+                                  score_precision=2)
+        self.task.active_dataset = self.add_dataset(task=self.task)
+        self.add_scored_submission(40.0, 10.0)
+        self.session.flush()
+        update_task_score(self.session, self.participation, self.task)
+        self.session.flush()
+
+    def add_scored_submission(self, score, public_score, tokened=False):
+        submission = self.add_submission(participation=self.participation,
+                                         task=self.task)
+        self.add_submission_result(submission, self.task.active_dataset,
+                                   score=score, public_score=public_score,
+                                   score_details=[], public_score_details=[],
+                                   ranking_score_details=[])
+        if tokened:
+            self.add_token(submission=submission)
+        return submission
+
+    def call(self, submissions=None):
+        return get_public_and_tokened_scores(
+            self.session, self.participation, self.task, submissions)
+
+    def test_stored(self):
+        self.assertEqual(self.call(), (10.0, 0.0, False))
+        self.assertEqual(self.call(self.participation.submissions),
+                         (10.0, 0.0, False))
+
+    def test_fallback_without_row(self):
+        invalidate_task_scores(self.session, self.participation.id,
+                               self.task.id)
+        self.add_scored_submission(60.0, 30.0, tokened=True)
+        self.session.flush()
+        self.assertEqual(self.call(), (30.0, 60.0, False))
+
+    def test_fallback_with_stale_row(self):
+        # As if the submission arrived while ScoringService was
+        # computing the row, which thus missed it (and the
+        # invalidation). The status endpoint passes no submissions.
+        self.add_scored_submission(60.0, 30.0, tokened=True)
+        self.session.flush()
+        self.assertEqual(self.call(), (30.0, 60.0, False))
+        self.assertEqual(self.call(self.participation.submissions),
+                         (30.0, 60.0, False))
+
+    def test_fallback_partial(self):
+        self.add_submission(participation=self.participation, task=self.task)
+        self.session.flush()
+        self.assertEqual(self.call(), (10.0, 0.0, True))
+
+
+class TestBatchStatusHandler(DatabaseMixin, unittest.TestCase):
+
+    SCORED = {"score": 10.0, "score_details": [], "public_score": 10.0,
+              "public_score_details": [], "ranking_score_details": []}
+
+    def setUp(self):
+        super().setUp()
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.other_participation = self.add_participation(
+            contest=self.contest)
+        self.tasks = []
+        for _ in range(2):
+            task = self.add_task(contest=self.contest)
+            task.active_dataset = self.add_dataset(task=task)
+            self.tasks.append(task)
+        self.start = self.contest.main_group.start
+        self.session.flush()
+
+    def add_submission_with_result(self, task, participation=None,
+                                   dataset=None, **kwargs):
+        """Add a submission and its result on the given dataset (by
+        default, the active one).
+
+        """
+        submission = self.add_submission(
+            task, participation or self.participation)
+        self.add_submission_result(
+            submission, dataset or task.active_dataset, **kwargs)
+        return submission
+
+    def add_user_test_at(self, task, seconds, participation=None,
+                         with_result=True, **kwargs):
+        """Add a user test at the given time and, if requested, its
+        result on the active dataset.
+
+        """
+        user_test = self.add_user_test(
+            task, participation or self.participation,
+            timestamp=self.start + timedelta(seconds=seconds))
+        if with_result:
+            self.add_user_test_result(user_test, task.active_dataset,
+                                      **kwargs)
+        return user_test
+
+    def get(self, task_name=None, etag=None, testing_enabled=True,
+            actual_phase=0):
+        """Call the handler, return it after the request."""
+        self.session.flush()
+        application = tornado.web.Application()
+        application.service = Mock(
+            translations={"en": DEFAULT_TRANSLATION},
+            contest_id=self.contest.id)
+        headers = HTTPHeaders()
+        if etag is not None:
+            headers["If-None-Match"] = etag
+        request = HTTPServerRequest(method="GET", uri="/status",
+                                    headers=headers, connection=Mock())
+        handler = BatchStatusHandler(application, request)
+        handler.sql_session = self.session
+        handler.contest = self.contest
+        handler.current_user = self.participation
+        handler.r_params = {"actual_phase": actual_phase,
+                            "testing_enabled": testing_enabled}
+        if task_name is None:
+            handler.get()
+        else:
+            handler.get(task_name)
+        return handler
+
+    @staticmethod
+    def statuses(handler, kind):
+        """Return the statuses in the payload, without their texts."""
+        payload = json.loads(b"".join(handler._write_buffer))
+        return {task_name: {key: status for key, (status, _) in by_key.items()}
+                for task_name, by_key in payload[kind].items()}
+
+    def test_pending_submissions(self):
+        task, other_task = self.tasks
+        old_dataset = self.add_dataset(task=task)
+        submissions = [
+            # Pending, with or without a result.
+            self.add_submission(task, self.participation),
+            self.add_submission_with_result(task),
+            self.add_submission_with_result(task, compilation_outcome="ok"),
+            self.add_submission_with_result(
+                task, compilation_outcome="ok", evaluation_outcome="ok"),
+            # Done.
+            self.add_submission_with_result(task, compilation_outcome="fail"),
+            self.add_submission_with_result(
+                task, compilation_outcome="fail", **self.SCORED),
+            self.add_submission_with_result(
+                task, compilation_outcome="ok", evaluation_outcome="ok",
+                **self.SCORED),
+            # Scored, but on a dataset that is not the active one.
+            self.add_submission_with_result(
+                task, dataset=old_dataset, compilation_outcome="ok",
+                evaluation_outcome="ok", **self.SCORED),
+            # Pending, on another task.
+            self.add_submission_with_result(other_task),
+        ]
+        # Not of the current user.
+        self.add_submission_with_result(task, self.other_participation)
+
+        handler = self.get()
+
+        self.assertEqual(handler.get_status(), 200)
+        expected = {}
+        for submission in submissions:
+            result = submission.get_result(submission.task.active_dataset)
+            status = result.get_status() if result is not None \
+                else SubmissionResult.COMPILING
+            if status != SubmissionResult.COMPILATION_FAILED \
+                    and status != SubmissionResult.SCORED:
+                expected.setdefault(submission.task.name, {})[
+                    str(submission.opaque_id)] = status
+        self.assertEqual(self.statuses(handler, "submissions"), expected)
+        self.assertEqual(
+            sorted(expected[task.name].values()),
+            [SubmissionResult.COMPILING, SubmissionResult.COMPILING,
+             SubmissionResult.COMPILING, SubmissionResult.EVALUATING,
+             SubmissionResult.SCORING])
+
+        handler = self.get(other_task.name)
+        self.assertEqual(self.statuses(handler, "submissions"),
+                         {other_task.name: expected[other_task.name]})
+
+    def test_pending_user_tests(self):
+        task, other_task = self.tasks
+        # Of another user, it does not count in the numbering.
+        self.add_user_test_at(task, 0, self.other_participation)
+        self.add_user_test_at(
+            task, 1, compilation_outcome="ok", evaluation_outcome="ok")
+        self.add_user_test_at(task, 2, with_result=False)
+        self.add_user_test_at(task, 3, compilation_outcome="fail")
+        self.add_user_test_at(task, 4, compilation_outcome="ok")
+        self.add_user_test_at(other_task, 5)
+
+        expected = {
+            task.name: {"2": UserTestResult.COMPILING,
+                        "4": UserTestResult.EVALUATING},
+            other_task.name: {"1": UserTestResult.COMPILING},
+        }
+        self.assertEqual(self.statuses(self.get(), "user_tests"), expected)
+        # The numbers do not depend on the tasks requested.
+        self.assertEqual(self.statuses(self.get(task.name), "user_tests"),
+                         {task.name: expected[task.name]})
+        # User tests are shown only when they can be submitted.
+        self.assertEqual(
+            self.statuses(self.get(testing_enabled=False), "user_tests"), {})
+        self.assertEqual(
+            self.statuses(self.get(actual_phase=1), "user_tests"), {})
+
+    def test_etag(self):
+        task = self.tasks[0]
+        submission = self.add_submission(task, self.participation)
+
+        handler = self.get()
+        self.assertEqual(handler.get_status(), 200)
+        etag = handler._headers["Etag"]
+
+        # Nothing changed.
+        handler = self.get(etag=etag)
+        self.assertEqual(handler.get_status(), 304)
+        self.assertEqual(handler._write_buffer, [])
+
+        # The submission compiled.
+        self.add_submission_result(submission, task.active_dataset,
+                                   compilation_outcome="ok")
+        handler = self.get(etag=etag)
+        self.assertEqual(handler.get_status(), 200)
+        self.assertNotEqual(handler._headers["Etag"], etag)
+        self.assertEqual(
+            self.statuses(handler, "submissions"),
+            {task.name: {str(submission.opaque_id):
+                         SubmissionResult.EVALUATING}})
+
+    def test_task_not_found(self):
+        with self.assertRaises(tornado.web.HTTPError) as cm:
+            self.get("nonexistent")
+        self.assertEqual(cm.exception.status_code, 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
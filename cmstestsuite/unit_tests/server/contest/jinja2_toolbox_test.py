@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the Jinja2 environment of CWS."""
+
+import unittest
+from unittest.mock import Mock, patch
+
+from jinja2 import DictLoader, Environment
+
+from cms.locale import Translation
+from cms.server.contest.jinja2_toolbox import FragmentCache, \
+    FragmentCacheExtension, wrapped_format_token_rules
+
+
+class TestFragmentCache(unittest.TestCase):
+
+    def test_evict_least_recently_used(self):
+        cache = FragmentCache(size=2)
+        cache.put(("a",), "A")
+        cache.put(("b",), "B")
+        self.assertEqual(cache.get(("a",)), "A")
+        cache.put(("c",), "C")
+        self.assertIsNone(cache.get(("b",)))
+        self.assertEqual(cache.get(("a",)), "A")
+        self.assertEqual(cache.get(("c",)), "C")
+
+
+class TestFragmentCacheExtension(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.env = Environment(
+            extensions=[FragmentCacheExtension],
+            loader=DictLoader({
+                "t.html":
+                    "{% cache key %}{{ f() }}{% endcache %}|{{ f() }}",
+            }))
+        self.calls = 0
+
+    def f(self):
+        self.calls += 1
+        return self.calls
+
+    def render(self, key, lang_code="en"):
+        return self.env.get_template("t.html").render(
+            key=key, f=self.f, translation=Translation(lang_code))
+
+    def test_cached(self):
+        self.assertEqual(self.render([1, 2]), "1|2")
+        self.assertEqual(self.render([1, 2]), "1|3")
+
+    def test_different_key(self):
+        self.assertEqual(self.render(1), "1|2")
+        self.assertEqual(self.render(2), "3|4")
+
+    def test_different_locale(self):
+        self.assertEqual(self.render(1, "en"), "1|2")
+        self.assertEqual(self.render(1, "it"), "3|4")
+        self.assertEqual(self.render(1, "en"), "1|5")
+
+
+class TestWrappedFormatTokenRules(unittest.TestCase):
+
+    def test_cached(self):
+        ctx = {"translation": Translation("en")}
+        tokens = {"token_mode": "finite", "token_max_number": 5}
+        with patch("cms.server.contest.jinja2_toolbox.format_token_rules",
+                   Mock(return_value="rules")) as format_token_rules:
+            for _ in range(3):
+                self.assertEqual(
+                    wrapped_format_token_rules(ctx, dict(tokens), "task"),
+                    "rules")
+            self.assertEqual(format_token_rules.call_count, 1)
+            wrapped_format_token_rules(ctx, dict(tokens), "contest")
+            self.assertEqual(format_token_rules.call_count, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
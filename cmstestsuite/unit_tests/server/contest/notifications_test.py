@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the notifications shared between ContestWebServers."""
+
+import unittest
+from datetime import datetime
+
+from cms.server.contest.notifications import Notification, NotificationStore
+
+
+class FakePeer:
+    """Forward the calls to another store, like the RPC would do."""
+
+    def __init__(self):
+        self.store = None
+        self.calls = []
+
+    def notification_added(self, **kwargs):
+        self.calls.append(("added", kwargs))
+        self.store.receive(**kwargs)
+
+    def notifications_delivered(self, **kwargs):
+        self.calls.append(("delivered", kwargs))
+        self.store.forget(**kwargs)
+
+
+class TestNotificationStore(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.timestamp = datetime(2020, 1, 1, 12, 0, 0)
+        peer_a, peer_b = FakePeer(), FakePeer()
+        self.a = NotificationStore(0, [peer_b])
+        self.b = NotificationStore(1, [peer_a])
+        peer_a.store, peer_b.store = self.a, self.b
+        self.peer_a, self.peer_b = peer_a, peer_b
+
+    def test_local(self):
+        self.a.add("user", self.timestamp, "s1", "t1", "success")
+        self.a.add("user", self.timestamp, "s2", "t2", "error")
+        self.assertEqual(self.a.pop("user"), [
+            Notification(self.timestamp, "s1", "t1", "success"),
+            Notification(self.timestamp, "s2", "t2", "error")])
+        self.assertEqual(self.a.pop("user"), [])
+
+    def test_other_user(self):
+        self.a.add("user", self.timestamp, "s", "t", "success")
+        self.assertEqual(self.a.pop("other"), [])
+        # Nothing to tell the other shards.
+        self.assertEqual([c for c, _ in self.peer_b.calls], ["added"])
+
+    def test_delivered_by_other_shard(self):
+        self.a.add("user", self.timestamp, "s", "t", "success")
+        self.assertEqual(self.b.pop("user"), [
+            Notification(self.timestamp, "s", "t", "success")])
+        # Not delivered again by the first shard.
+        self.assertEqual(self.a.pop("user"), [])
+
+    def test_forget_before_receive(self):
+        self.b.forget("user", ["2.0"])
+        self.b.receive("2.0", "user", 0.0, "s", "t", "success")
+        self.assertEqual(self.b.pop("user"), [])
+
+    def test_ids_unique_across_shards(self):
+        self.a.add("user", self.timestamp, "s1", "t", "success")
+        self.b.add("user", self.timestamp, "s2", "t", "success")
+        self.assertEqual(len(self.a.pop("user")), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
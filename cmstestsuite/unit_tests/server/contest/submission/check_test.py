@@ -24,7 +24,8 @@ from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
 from cms.db import UserTest, Submission
 from cms.server.contest.submission import get_submission_count, \
-    check_max_number, get_latest_submission, check_min_interval, is_last_minutes
+    check_max_number, get_latest_submission, check_min_interval, \
+    is_last_minutes, SubmissionStats, get_submission_stats
 from cmscommon.datetime import make_datetime
 
 
@@ -139,6 +140,53 @@ class TestGetSubmissionCount(DatabaseMixin, unittest.TestCase):
         self.assertEqual(self.call(task=self.task2), 0)
 
 
+class TestGetSubmissionStats(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.contest = self.add_contest()
+        self.task1 = self.add_task(contest=self.contest)
+        self.task2 = self.add_task(contest=self.contest)
+        self.participation = self.add_participation(contest=self.contest)
+        self.timestamp = make_datetime()
+
+    def at(self, seconds):
+        return self.timestamp + timedelta(seconds=seconds)
+
+    def call(self, task, **kwargs):
+        return get_submission_stats(
+            self.session, self.participation, task, **kwargs)
+
+    def test_no_submissions(self):
+        self.assertEqual(self.call(self.task1),
+                         SubmissionStats(0, None, 0, None))
+
+    def test_stats(self):
+        self.add_submission(timestamp=self.at(1), task=self.task1,
+                            participation=self.participation)
+        self.add_submission(timestamp=self.at(3), task=self.task2,
+                            participation=self.participation)
+        self.add_submission(timestamp=self.at(2), task=self.task1,
+                            participation=self.participation)
+        # Neither other users nor user tests are counted.
+        self.add_submission(
+            timestamp=self.at(4), task=self.task1,
+            participation=self.add_participation(contest=self.contest))
+        self.add_user_test(timestamp=self.at(5), task=self.task1,
+                           participation=self.participation)
+
+        self.assertEqual(self.call(self.task1),
+                         SubmissionStats(3, self.at(3), 2, self.at(2)))
+        self.assertEqual(self.call(self.task2),
+                         SubmissionStats(3, self.at(3), 1, self.at(3)))
+        self.assertEqual(self.call(self.task1, cls=UserTest),
+                         SubmissionStats(1, self.at(5), 1, self.at(5)))
+
+    def test_lock(self):
+        self.add_submission(task=self.task1, participation=self.participation)
+        self.assertEqual(self.call(self.task1, lock=True).task_count, 1)
+
+
 class TestCheckMaxNumber(DatabaseMixin, unittest.TestCase):
 
     def setUp(self):
@@ -198,6 +246,15 @@ class TestCheckMaxNumber(DatabaseMixin, unittest.TestCase):
         # Having calls signals an inefficiency.
         self.get_submission_count.assert_not_called()
 
+    def test_limit_stats(self):
+        stats = SubmissionStats(5, None, 2, None)
+        self.assertFalse(self.call(5, contest=self.contest, stats=stats))
+        self.assertTrue(self.call(6, contest=self.contest, stats=stats))
+        self.assertFalse(self.call(2, task=self.task, stats=stats))
+        self.assertTrue(self.call(3, task=self.task, stats=stats))
+        # The stats are used instead of querying.
+        self.get_submission_count.assert_not_called()
+
 
 class TestGetLatestSubmission(DatabaseMixin, unittest.TestCase):
 
@@ -397,6 +454,17 @@ class TestCheckMinInterval(DatabaseMixin, unittest.TestCase):
         # Having calls signals an inefficiency.
         self.get_latest_submission.assert_not_called()
 
+    def test_limit_stats(self):
+        stats = SubmissionStats(2, self.at(5), 1, self.at(3))
+        self.assertFalse(self.call(1, 5, contest=self.contest, stats=stats))
+        self.assertTrue(self.call(1, 6, contest=self.contest, stats=stats))
+        self.assertFalse(self.call(3, 5, task=self.task, stats=stats))
+        self.assertTrue(self.call(3, 6, task=self.task, stats=stats))
+        self.assertTrue(self.call(
+            3, 0, task=self.task, stats=SubmissionStats(0, None, 0, None)))
+        # The stats are used instead of querying.
+        self.get_latest_submission.assert_not_called()
+
 
 class TestIsLastMinutes(DatabaseMixin, unittest.TestCase):
 
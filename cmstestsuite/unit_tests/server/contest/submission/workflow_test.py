@@ -107,6 +107,12 @@ class TestAcceptSubmission(DatabaseMixin, unittest.TestCase):
         self.addCleanup(patcher.stop)
         self.check_min_interval.return_value = True
 
+        patcher = patch(
+            "cms.server.contest.submission.workflow.get_submission_stats")
+        self.get_submission_stats = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.get_submission_stats.return_value = sentinel.stats
+
         patcher = patch(
             "cms.server.contest.submission.workflow.is_last_minutes")
         self.is_last_minutes = patcher.start()
@@ -154,8 +160,11 @@ class TestAcceptSubmission(DatabaseMixin, unittest.TestCase):
         self.addCleanup(patcher.stop)
 
         self.file_cacher = MagicMock()
-        self.file_cacher.put_file_content.side_effect = \
-            lambda content, _: bytes_digest(content)
+        self.file_cacher.stage_files.side_effect = \
+            lambda session, files: [bytes_digest(content)
+                                    for content, _ in files]
+        self.file_cacher.put_files.side_effect = \
+            lambda files: [bytes_digest(open_().read()) for open_, _ in files]
 
     def call(self):
         return accept_submission(
@@ -188,6 +197,21 @@ class TestAcceptSubmission(DatabaseMixin, unittest.TestCase):
             submission, self.timestamp, "MockLanguage",
             {"foo.%l": FOO_CONTENT, "bar.%l": BAR_CONTENT}, True)
 
+    def test_no_stats_without_limits(self):
+        self.call()
+
+        self.get_submission_stats.assert_not_called()
+
+    def test_stats_fetched_once(self):
+        self.contest.max_submission_number = unique_long_id()
+        self.task.min_submission_interval = \
+            timedelta(seconds=unique_long_id())
+
+        self.call()
+
+        self.get_submission_stats.assert_called_once_with(
+            self.session, self.participation, self.task, lock=True)
+
     def test_success_all_languages_allowed(self):
         self.contest.languages = None
 
@@ -229,7 +253,8 @@ class TestAcceptSubmission(DatabaseMixin, unittest.TestCase):
             self.call()
 
         self.check_max_number.assert_called_with(
-            self.session, max_number, self.participation, contest=self.contest)
+            self.session, max_number, self.participation, contest=self.contest,
+            stats=sentinel.stats)
 
     def test_failure_due_to_max_number_on_task(self):
         max_number = unique_long_id()
@@ -242,7 +267,8 @@ class TestAcceptSubmission(DatabaseMixin, unittest.TestCase):
             self.call()
 
         self.check_max_number.assert_called_with(
-            self.session, max_number, self.participation, task=self.task)
+            self.session, max_number, self.participation, task=self.task,
+            stats=sentinel.stats)
 
     def test_failure_due_to_min_interval_on_contest(self):
         min_interval = timedelta(seconds=unique_long_id())
@@ -257,7 +283,7 @@ class TestAcceptSubmission(DatabaseMixin, unittest.TestCase):
 
         self.check_min_interval.assert_called_with(
             self.session, min_interval, self.timestamp, self.participation,
-            contest=self.contest)
+            contest=self.contest, stats=sentinel.stats)
 
     def test_success_with_min_interval_on_contest_in_last_minutes(self):
         min_interval = timedelta(seconds=unique_long_id())
@@ -285,7 +311,7 @@ class TestAcceptSubmission(DatabaseMixin, unittest.TestCase):
 
         self.check_min_interval.assert_called_with(
             self.session, min_interval, self.timestamp, self.participation,
-            task=self.task)
+            task=self.task, stats=sentinel.stats)
 
     def test_success_with_min_interval_on_task_in_last_minutes(self):
         min_interval = timedelta(seconds=unique_long_id())
@@ -371,16 +397,35 @@ class TestAcceptSubmission(DatabaseMixin, unittest.TestCase):
             self.submit_local_copy_path, self.participation, self.task,
             self.timestamp, self.files)
 
+    def test_success_with_large_files(self):
+        self.files["baz.%l"] = BAZ_CONTENT
+        # Only the files up to this size are stored in the transaction.
+        with patch.object(config.contest_web_server, "max_inline_file_length",
+                          len(FOO_CONTENT)):
+            submission = self.call()
+
+        self.assertSubmissionIsValid(
+            submission, self.timestamp, "MockLanguage",
+            {"foo.%l": FOO_CONTENT, "bar.%l": BAR_CONTENT,
+             "baz.%l": BAZ_CONTENT}, True)
+        (session, staged), _ = self.file_cacher.stage_files.call_args
+        self.assertIs(session, self.session)
+        self.assertEqual([content for content, _ in staged], [FOO_CONTENT])
+        (stored,), _ = self.file_cacher.put_files.call_args
+        self.assertEqual([open_().read() for open_, _ in stored],
+                         [BAZ_CONTENT])
+
     def test_failure_due_to_file_cacher(self):
-        self.file_cacher.put_file_content.side_effect = Exception
+        self.file_cacher.stage_files.side_effect = Exception
 
         with self.assertRaisesRegex(UnacceptableSubmission, "storage"):
             self.call()
 
-        args, kwargs = self.file_cacher.put_file_content.call_args
+        args, kwargs = self.file_cacher.stage_files.call_args
         self.assertEqual(kwargs, dict())
         self.assertEqual(len(args), 2)
-        content, description = args
+        self.assertIs(args[0], self.session)
+        content, description = args[1][0]
         self.assertEqual(content, FOO_CONTENT)
         self.assertIn("foo.%l", description)
         self.assertIn(self.participation.user.username, description)
@@ -446,6 +491,12 @@ class TestAcceptUserTest(DatabaseMixin, unittest.TestCase):
         self.addCleanup(patcher.stop)
         self.check_min_interval.return_value = True
 
+        patcher = patch(
+            "cms.server.contest.submission.workflow.get_submission_stats")
+        self.get_submission_stats = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.get_submission_stats.return_value = sentinel.stats
+
         patcher = patch(
             "cms.server.contest.submission.workflow.extract_files_from_tornado")
         self.extract_files_from_tornado = patcher.start()
@@ -487,8 +538,11 @@ class TestAcceptUserTest(DatabaseMixin, unittest.TestCase):
         self.addCleanup(patcher.stop)
 
         self.file_cacher = MagicMock()
-        self.file_cacher.put_file_content.side_effect = \
-            lambda content, _: bytes_digest(content)
+        self.file_cacher.stage_files.side_effect = \
+            lambda session, files: [bytes_digest(content)
+                                    for content, _ in files]
+        self.file_cacher.put_files.side_effect = \
+            lambda files: [bytes_digest(open_().read()) for open_, _ in files]
 
     def call(self):
         return accept_user_test(
@@ -590,7 +644,7 @@ class TestAcceptUserTest(DatabaseMixin, unittest.TestCase):
 
         self.check_max_number.assert_called_with(
             self.session, max_number, self.participation, contest=self.contest,
-            cls=UserTest)
+            cls=UserTest, stats=sentinel.stats)
 
     def test_failure_due_to_max_number_on_task(self):
         max_number = unique_long_id()
@@ -604,7 +658,7 @@ class TestAcceptUserTest(DatabaseMixin, unittest.TestCase):
 
         self.check_max_number.assert_called_with(
             self.session, max_number, self.participation, task=self.task,
-            cls=UserTest)
+            cls=UserTest, stats=sentinel.stats)
 
     def test_failure_due_to_min_interval_on_contest(self):
         min_interval = timedelta(seconds=unique_long_id())
@@ -619,7 +673,8 @@ class TestAcceptUserTest(DatabaseMixin, unittest.TestCase):
 
         self.check_min_interval.assert_called_with(
             self.session, min_interval, self.timestamp, self.participation,
-            contest=self.contest, cls=UserTest)
+            contest=self.contest, cls=UserTest,
+            stats=sentinel.stats)
 
     def test_failure_due_to_min_interval_on_task(self):
         min_interval = timedelta(seconds=unique_long_id())
@@ -634,7 +689,7 @@ class TestAcceptUserTest(DatabaseMixin, unittest.TestCase):
 
         self.check_min_interval.assert_called_with(
             self.session, min_interval, self.timestamp, self.participation,
-            task=self.task, cls=UserTest)
+            task=self.task, cls=UserTest, stats=sentinel.stats)
 
     def test_failure_due_to_extract_files_from_tornado(self):
         self.extract_files_from_tornado.side_effect = InvalidArchive
@@ -733,15 +788,16 @@ class TestAcceptUserTest(DatabaseMixin, unittest.TestCase):
             self.timestamp, self.files)
 
     def test_failure_due_to_file_cacher(self):
-        self.file_cacher.put_file_content.side_effect = Exception
+        self.file_cacher.stage_files.side_effect = Exception
 
         with self.assertRaisesRegex(UnacceptableUserTest, "storage"):
             self.call()
 
-        args, kwargs = self.file_cacher.put_file_content.call_args
+        args, kwargs = self.file_cacher.stage_files.call_args
         self.assertEqual(kwargs, dict())
         self.assertEqual(len(args), 2)
-        content, description = args
+        self.assertIs(args[0], self.session)
+        content, description = args[1][0]
         self.assertIn(content, {FOO_CONTENT, SPAM_CONTENT, INPUT_CONTENT})
         self.assertRegex(description, "foo.%l|spammock.1|input")
         self.assertIn(self.participation.user.username, description)
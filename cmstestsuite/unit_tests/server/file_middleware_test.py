@@ -18,16 +18,20 @@
 
 import io
 import random
+import tempfile
 import unittest
 from unittest.mock import Mock
 
+import gevent
+from gevent import socket
+
 from werkzeug.http import quote_header_value
 from werkzeug.test import Client, EnvironBuilder
 from werkzeug.wrappers import Response
 from werkzeug.wsgi import responder
 
 from cms.db.filecacher import FileCacher, TombstoneError
-from cms.server.file_middleware import FileServerMiddleware
+from cms.server.file_middleware import FileServerMiddleware, FileWrapper
 from cmscommon.digest import bytes_digest
 
 
@@ -51,6 +55,7 @@ class TestFileByDigestMiddleware(unittest.TestCase):
 
         self.serve_file = True
         self.provide_filename = True
+        self.immutable = False
 
         self.wsgi_app = \
             FileServerMiddleware(self.file_cacher, self.wrapped_wsgi_app)
@@ -65,6 +70,8 @@ class TestFileByDigestMiddleware(unittest.TestCase):
             headers = {FileServerMiddleware.DIGEST_HEADER: self.digest}
             if self.provide_filename:
                 headers[FileServerMiddleware.FILENAME_HEADER] = self.filename
+            if self.immutable:
+                headers[FileServerMiddleware.IMMUTABLE_HEADER] = "1"
             return Response(headers=headers, mimetype=self.mimetype)
         else:
             return Response(b"some other content", mimetype="text/plain")
@@ -91,9 +98,36 @@ class TestFileByDigestMiddleware(unittest.TestCase):
         self.assertTrue(response.cache_control.private)
         self.assertFalse(response.cache_control.public)
         self.assertEqual(response.get_data(), self.content)
+        self.assertEqual(response.content_length, TESTFILE_LEN)
 
         self.file_cacher.get_file.assert_called_once_with(self.digest)
 
+    def test_immutable(self):
+        self.immutable = True
+
+        response = self.request()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(FileServerMiddleware.IMMUTABLE_HEADER,
+                         response.headers)
+        self.assertTrue(response.cache_control.immutable)
+        self.assertGreater(response.cache_control.max_age, 0)
+        self.assertFalse(response.cache_control.no_cache)
+        self.assertTrue(response.cache_control.private)
+
+    def test_size_from_file(self):
+        # For real files the size is taken without asking the backend.
+        fobj = tempfile.TemporaryFile()
+        fobj.write(self.content)
+        fobj.seek(0)
+        self.file_cacher.get_file.side_effect = lambda digest: fobj
+
+        response = self.request()
+
+        self.assertEqual(response.content_length, TESTFILE_LEN)
+        self.assertEqual(response.get_data(), self.content)
+        self.file_cacher.get_size.assert_not_called()
+
     def test_not_a_file(self):
         self.serve_file = False
 
@@ -165,5 +199,46 @@ class TestFileByDigestMiddleware(unittest.TestCase):
         self.assertEqual(response.status_code, 416)
 
 
+class TestFileWrapper(unittest.TestCase):
+
+    def setUp(self):
+        self.content = random.randbytes(TESTFILE_LEN)
+        self.fobj = tempfile.TemporaryFile()
+        self.fobj.write(self.content)
+        self.fobj.seek(0)
+        self.wrapper = FileWrapper(self.fobj, buffer_size=1024)
+
+    def tearDown(self):
+        self.wrapper.close()
+
+    def test_iter(self):
+        self.assertEqual(b"".join(self.wrapper), self.content)
+
+    def test_sendfile(self):
+        self.fobj.seek(100)
+        sender, receiver = socket.socketpair()
+        with sender, receiver:
+            received = []
+
+            def receive():
+                while True:
+                    data = receiver.recv(65536)
+                    if len(data) == 0:
+                        return
+                    received.append(data)
+
+            greenlet = gevent.spawn(receive)
+            sent = self.wrapper.sendfile(sender)
+            sender.shutdown(socket.SHUT_WR)
+            greenlet.join()
+
+        self.assertEqual(sent, TESTFILE_LEN - 100)
+        self.assertEqual(b"".join(received), self.content[100:])
+        self.assertEqual(self.fobj.tell(), TESTFILE_LEN)
+
+    def test_no_fileno(self):
+        self.assertIsNone(FileWrapper(io.BytesIO(b"")).fileno())
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+
+# Contest Management System - http://cms-dev.github.io/
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as
+# published by the Free Software Foundation, either version 3 of the
+# License, or (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Tests for the evaluation service."""
+
+import unittest
+from datetime import datetime
+from unittest.mock import Mock
+
+from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
+
+from cms.db import TaskScore
+from cms.grading.scoring import update_task_score
+from cms.io.priorityqueue import PriorityQueue
+from cms.service.EvaluationService import EvaluationExecutor, \
+    EvaluationService
+from cms.service.esoperations import ESOperation
+from cmscommon.datetime import make_datetime
+
+
+class TestEvaluationExecutorQueueSummary(unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.executor = EvaluationExecutor(Mock())
+
+    def enqueue(self, type_, object_id, dataset_id, codename=None,
+                priority=PriorityQueue.PRIORITY_HIGH, second=0):
+        operation = ESOperation(type_, object_id, dataset_id, codename)
+        self.executor.enqueue(operation, priority,
+                              datetime(2020, 1, 1, 0, 0, second))
+        return operation
+
+    def test_empty(self):
+        summary = self.executor.queue_summary(10, 0)
+        self.assertEqual(summary["operations"], 0)
+        self.assertEqual(summary["entries"], 0)
+        self.assertEqual(summary["by_type"], {})
+        self.assertIsNone(summary["oldest_timestamp"])
+        self.assertEqual(summary["oldest"], [])
+
+    def test_counts(self):
+        self.enqueue(ESOperation.COMPILATION, 1, 10, second=3)
+        self.enqueue(ESOperation.EVALUATION, 2, 10, "a", second=1)
+        self.enqueue(ESOperation.EVALUATION, 2, 10, "b", second=1)
+        self.enqueue(ESOperation.EVALUATION, 3, 20, "a",
+                     priority=PriorityQueue.PRIORITY_LOW, second=2)
+
+        summary = self.executor.queue_summary(10, 0)
+        self.assertEqual(summary["operations"], 4)
+        self.assertEqual(summary["entries"], 3)
+        self.assertEqual(summary["by_type"], {"compile": 1, "evaluate": 3})
+        self.assertEqual(summary["by_priority"], {
+            str(PriorityQueue.PRIORITY_HIGH): 3,
+            str(PriorityQueue.PRIORITY_LOW): 1})
+        self.assertEqual(summary["by_dataset"], {"10": 3, "20": 1})
+        self.assertEqual(summary["oldest_timestamp"],
+                         summary["oldest"][0]["timestamp"])
+        self.assertEqual([entry["item"]["object_id"]
+                          for entry in summary["oldest"]], [2, 1, 3])
+
+    def test_pagination(self):
+        for i in range(5):
+            self.enqueue(ESOperation.COMPILATION, i, 10, second=i)
+
+        summary = self.executor.queue_summary(2, 1)
+        self.assertEqual(summary["entries"], 5)
+        self.assertEqual([entry["item"]["object_id"]
+                          for entry in summary["oldest"]], [1, 2])
+
+    def test_dequeue(self):
+        operation = self.enqueue(ESOperation.EVALUATION, 2, 10, "a")
+        self.enqueue(ESOperation.EVALUATION, 2, 10, "b")
+
+        self.executor.dequeue(operation)
+        summary = self.executor.queue_summary(10, 0)
+        self.assertEqual(summary["operations"], 1)
+        self.assertEqual(summary["by_type"], {"evaluate": 1})
+
+        self.executor._pop()
+        summary = self.executor.queue_summary(10, 0)
+        self.assertEqual(summary["operations"], 0)
+        self.assertEqual(summary["by_type"], {})
+        self.assertEqual(summary["by_dataset"], {})
+
+
+
+class TestEvaluationServiceInvalidate(DatabaseMixin, unittest.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.contest = self.add_contest()
+        self.participation = self.add_participation(contest=self.contest)
+        self.task = self.add_task(contest=self.contest)
+        self.dataset = self.add_dataset(task=self.task)
+        self.task.active_dataset = self.dataset
+        self.other_dataset = self.add_dataset(task=self.task)
+        self.submission = self.add_submission(
+            task=self.task, participation=self.participation)
+        for dataset in [self.dataset, self.other_dataset]:
+            self.add_submission_result(
+                self.submission, dataset, compilation_outcome="ok",
+                evaluation_outcome="ok", score=100.0, score_details=[],
+                public_score=100.0, public_score_details=[],
+                ranking_score_details=[], scored_at=make_datetime())
+        update_task_score(self.session, self.participation, self.task)
+        self.session.commit()
+        self.service = EvaluationService(0, self.contest.id)
+
+    def task_scores(self):
+        self.session.expire_all()
+        return self.session.query(TaskScore).count()
+
+    def test_invalidate_other_dataset(self):
+        self.service.invalidate_submission(
+            submission_id=self.submission.id,
+            dataset_id=self.other_dataset.id, level="evaluation")
+        self.assertEqual(self.task_scores(), 1)
+
+    def test_invalidate_evaluation(self):
+        # The score is not final anymore while the submission is
+        # evaluated again.
+        self.service.invalidate_submission(
+            submission_id=self.submission.id, level="evaluation")
+        self.assertEqual(self.task_scores(), 0)
+
+    def test_invalidate_compilation(self):
+        self.service.invalidate_submission(
+            participation_id=self.participation.id, level="compilation")
+        self.assertEqual(self.task_scores(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
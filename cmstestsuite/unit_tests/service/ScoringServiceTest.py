@@ -34,6 +34,8 @@ import gevent
 
 from cmstestsuite.unit_tests.databasemixin import DatabaseMixin
 
+from cms.db import TaskScore
+from cms.grading.scoring import update_task_score
 from cms.service.ScoringService import ScoringService
 from cmscommon.datetime import make_datetime
 from cmstestsuite.unit_tests.testidgenerator import unique_long_id, \
@@ -104,6 +106,59 @@ class TestScoringService(DatabaseMixin, unittest.TestCase):
                          self.score_info)
         self.assertIsNotNone(sr.scored_at)
 
+    def test_new_evaluation_task_score(self):
+        """The score of the participation on the task is stored.
+
+        """
+        sr = self.new_sr_to_score()
+        sr.submission.task.active_dataset = sr.dataset
+        self.session.commit()
+
+        service = ScoringService(0)
+        service.new_evaluation(sr.submission_id, sr.dataset_id)
+
+        gevent.sleep(0.1)  # Needed to trigger the score loop.
+
+        task_score = self.session.query(TaskScore).one()
+        self.assertEqual(task_score.participation_id,
+                         sr.submission.participation_id)
+        self.assertEqual(task_score.task_id, sr.submission.task_id)
+        self.assertEqual(task_score.dataset_id, sr.dataset_id)
+        self.assertEqual(task_score.score, self.score_info[0])
+        self.assertEqual(task_score.public_score, self.score_info[2])
+        self.assertFalse(task_score.partial)
+        self.assertEqual(task_score.submission_count, 1)
+        self.assertEqual(task_score.token_count, 0)
+
+    def test_new_evaluation_task_score_batched(self):
+        """The score of the participation on the task is computed once
+        for all the results scored together.
+
+        """
+        sr_a = self.new_sr_to_score()
+        task = sr_a.submission.task
+        task.active_dataset = sr_a.dataset
+        submission = self.add_submission(
+            task=task, participation=sr_a.submission.participation)
+        sr_b = self.add_submission_result(
+            compilation_outcome="ok", evaluation_outcome="ok",
+            submission=submission, dataset=sr_a.dataset)
+        self.session.commit()
+
+        service = ScoringService(0)
+        with patch("cms.service.ScoringService.update_task_score",
+                   wraps=update_task_score) as update:
+            service.new_evaluation(sr_a.submission_id, sr_a.dataset_id)
+            service.new_evaluation(sr_b.submission_id, sr_b.dataset_id)
+
+            gevent.sleep(0.1)  # Needed to trigger the score loop.
+
+        self.assertEqual(len(self.call_args), 2)
+        update.assert_called_once()
+        task_score = self.session.query(TaskScore).one()
+        self.assertFalse(task_score.partial)
+        self.assertEqual(task_score.submission_count, 2)
+
     def test_new_evaluation_two(self):
         """More than one submissions in the queue.
 
@@ -21,6 +21,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import logging
 import os
 import random
@@ -105,6 +106,95 @@ class TaskStatementRequest(GenericRequest):
         return '\nNO DATA DUMP FOR TASK STATEMENTS\n'
 
 
+class TaskSubmissionsRequest(GenericRequest):
+    """Load the submissions page of a task in CWS.
+
+    """
+
+    def __init__(self, browser, task_id, base_url=None):
+        GenericRequest.__init__(self, browser, base_url)
+        self.url = "%s/tasks/%s/submissions" % (self.base_url, task_id)
+        self.task_id = task_id
+
+    def describe(self):
+        return "load submissions for task %s (%s)" % (self.task_id, self.url)
+
+
+class NotificationsRequest(GenericRequest):
+    """Poll the notifications in CWS, as the pages of the contest do
+    periodically.
+
+    """
+
+    def __init__(self, browser, last_notification=None, base_url=None):
+        GenericRequest.__init__(self, browser, base_url)
+        self.url = "%s/notifications" % self.base_url
+        if last_notification is not None:
+            self.url += "?last_notification=%r" % last_notification
+        self.notifications = None
+
+    def describe(self):
+        return "poll notifications (%s)" % self.url
+
+    def test_success(self):
+        # The response is usually too short for the generic check.
+        if self.status_code != 200:
+            return False
+        self.notifications = json.loads(self.res_data)
+        return isinstance(self.notifications, list)
+
+    def get_last_notification(self):
+        """Return the timestamp of the most recent notification
+        received, or None.
+
+        """
+        if not self.notifications:
+            return None
+        return max(n["timestamp"] for n in self.notifications)
+
+
+class StatusRequest(GenericRequest):
+    """Poll the statuses of the pending submissions and user tests in
+    CWS, of a task or of the whole contest.
+
+    """
+
+    def __init__(self, browser, task_id=None, etag=None, base_url=None):
+        GenericRequest.__init__(self, browser, base_url)
+        if task_id is None:
+            self.url = "%s/status" % self.base_url
+        else:
+            self.url = "%s/tasks/%s/status" % (self.base_url, task_id)
+        self.task_id = task_id
+        if etag is not None:
+            self.headers = {"If-None-Match": etag}
+        self.statuses = None
+        self.etag = etag
+
+    def describe(self):
+        return "poll statuses (%s)" % self.url
+
+    def test_success(self):
+        # Nothing changed since the previous poll.
+        if self.status_code == 304:
+            return True
+        if self.status_code != 200:
+            return False
+        self.statuses = json.loads(self.res_data)
+        self.etag = self.response.headers.get("Etag")
+        return "submissions" in self.statuses \
+            and "user_tests" in self.statuses
+
+    def is_pending(self):
+        """Return whether there are still submissions being evaluated
+        (assuming there were, if the server answered "not modified").
+
+        """
+        if self.statuses is None:
+            return self.status_code == 304
+        return any(len(s) > 0 for s in self.statuses["submissions"].values())
+
+
 class SubmitRequest(GenericRequest):
     """Submit a solution in CWS.
 
@@ -53,6 +53,7 @@ class Browser:
         url: str,
         data: dict | None = None,
         file_names: list[tuple[str, str]] | None = None,
+        headers: dict[str, str] | None = None,
     ):
         """Open an URL, optionally passing the specified data and files as
            POST arguments.
@@ -63,15 +64,16 @@ class Browser:
         file_names: a list of files to pass as POST
             arguments. Each entry is a tuple containing two strings:
             the field name and the name of the file to send.
+        headers: additional headers to send with the request.
 
         """
         if file_names is None:
             if data is None:
-                response = self.session.get(url)
+                response = self.session.get(url, headers=headers)
             else:
                 data = data.copy()
                 data['_xsrf'] = self.xsrf_token
-                response = self.session.post(url, data)
+                response = self.session.post(url, data, headers=headers)
         else:
             file_objs = {}
             try:
@@ -79,7 +81,8 @@ class Browser:
                 data['_xsrf'] = self.xsrf_token
                 for k, v in file_names:
                     file_objs[k] = open(v, "rb")
-                response = self.session.post(url, data, files=file_objs)
+                response = self.session.post(url, data, files=file_objs,
+                                             headers=headers)
             finally:
                 for fobj in file_objs.values():
                     fobj.close()
@@ -114,6 +117,7 @@ class GenericRequest(metaclass=ABCMeta):
         self.url = None
         self.data = None
         self.files = None
+        self.headers = None
 
         self.status_code = None
         self.response = None
@@ -135,7 +139,7 @@ class GenericRequest(metaclass=ABCMeta):
         self.start_time = time.time()
         try:
             self.response = self.browser.do_request(
-                self.url, self.data, self.files)
+                self.url, self.data, self.files, self.headers)
             self.response.raise_for_status()
 
             self.status_code = self.response.status_code